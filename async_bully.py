@@ -0,0 +1,657 @@
+from collections import deque
+from argparse import ArgumentParser
+import asyncio
+import random
+from pacing import Pacer, FixedDelay, make_pacer
+import wire
+from rtt import make_estimator, MIN_TIMEOUT
+from reliable import Reliability
+import metrics
+
+
+class LocalNetwork:
+    """
+    Delivers datagrams between nodes living on the same event loop without touching any sockets.
+    Messages to ids that were never registered (dead nodes) are dropped, like UDP to a closed port.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, latency: float = 0) -> None:
+        self.loop = loop
+        self.latency = latency
+        self.nodes = {}
+
+    async def register(self, node) -> None:
+        self.nodes[node.node_id] = node
+        node.connection_made(None)
+
+    def send(self, sender, msg: bytes, receiver_id: int) -> None:
+        receiver = self.nodes.get(receiver_id)
+        if receiver is None:
+            return
+        if self.latency:
+            self.loop.call_later(self.latency, receiver.datagram_received, msg, sender.node_id)
+        else:
+            self.loop.call_soon(receiver.datagram_received, msg, sender.node_id)
+
+    def close(self) -> None:
+        self.nodes.clear()
+
+
+class UdpNetwork:
+    """
+    One asyncio datagram endpoint per node on 127.0.0.1:base_port+id, all served by the same loop.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, base_port: int) -> None:
+        self.loop = loop
+        self.base_port = base_port
+        self.transports = []
+
+    async def register(self, node) -> None:
+        transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: node, local_addr=("127.0.0.1", self.base_port + node.node_id))
+        self.transports.append(transport)
+
+    def send(self, sender, msg: bytes, receiver_id: int) -> None:
+        sender.transport.sendto(msg, ("127.0.0.1", self.base_port + receiver_id))
+
+    def close(self) -> None:
+        for transport in self.transports:
+            transport.close()
+        self.transports.clear()
+
+
+class AsyncNode(asyncio.DatagramProtocol):
+    """
+    Event-driven counterpart of the `Process` based nodes. All the waiting that the threaded
+    nodes do with `sleep` and `Timer` is done with `loop.call_later`, so thousands of nodes
+    can share a single event loop.
+    """
+    # The messages that are acked and retransmitted with a retransmit timeout, see reliable.py
+    RELIABLE = ()
+
+    def __init__(self,
+                 id: int,
+                 num_nodes: int,
+                 starter: bool,
+                 network,
+                 delay: float = 0.01,
+                 silent: bool = True,
+                 pacing: str | Pacer = None,
+                 wire_format: str = "binary",
+                 retransmit_timeout: float = None,
+                 retries: int = 3) -> None:
+        self.node_id = id
+        self.num_nodes = num_nodes
+        self.is_starter = starter
+        self.network = network
+        self.loop = network.loop
+        self.delay = delay
+        self.pacer = make_pacer(pacing, clock=self.loop.time) if pacing is not None else FixedDelay(delay)
+        self.silent = silent
+        self.wire_format = wire_format
+
+        self.coordinator_id = id
+        self.message_count = 0
+        self.transport = None
+
+        self.running_election = False
+        self.has_announced = False
+        # Election terms, like in the threaded nodes
+        self.term = 0
+        self.stale_count = 0
+        self.coalesced_count = 0
+        self.reliable = Reliability(retransmit_timeout, retries, clock=self.loop.time) if retransmit_timeout is not None else None
+        self.retransmit_handle = None
+        self.retransmit_count = 0
+        self.duplicate_count = 0
+        self.unacked_count = 0
+
+        self.listening = True
+        self.outbox = deque()
+        self.sending = False
+        self.done = self.loop.create_future()
+        self.ready_time = None
+        self.start_time = None
+        self.finish_time = None
+        # For `convergence_times`, the loop time of the first election, the first announce and adopting the coordinator
+        self.election_time = None
+        self.announce_time = None
+        self.adopt_time = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        self.ready_time = self.loop.time()
+
+    def start(self) -> None:
+        self.start_time = self.loop.time()
+        if self.is_starter:
+            self.loop.call_soon(self.starter)
+
+    def starter(self) -> None:
+        raise NotImplementedError
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if not self.listening and self.reliable is None:
+            return
+        message = wire.decode(data)
+        if self.reliable is not None and message is not None and not self.receive_reliably(message):
+            self.check_done()
+            return
+        if not self.listening:
+            return # Done, only acks are still taken and given
+        match message:
+            case (wire.EXIT, _, _, _):
+                self.print2(f"Node {self.node_id} received exit message")
+                self.listening = False
+            case None:
+                pass
+            case (kind, sender_id, term, _):
+                if self.check_term(kind, sender_id, term):
+                    self.handle_message(kind, sender_id)
+        self.print2(f"{self.node_id} received {data}")
+        self.check_done()
+
+    def handle_message(self, kind: int, sender_id: int) -> None:
+        raise NotImplementedError
+
+    def receive_reliably(self, message: tuple) -> bool:
+        """Take an ack, or ack a reliable message right away. False for the ones not to handle: acks and duplicates."""
+        kind, sender_id, _, seq = message
+        if kind == wire.ACK:
+            self.reliable.acked(sender_id, seq)
+            if not self.reliable.busy() and self.retransmit_handle is not None:
+                self.retransmit_handle.cancel()
+                self.retransmit_handle = None
+            return False
+        if seq == 0:
+            return True
+        self.network.send(self, wire.encode(wire.ACK, self.node_id, self.term, seq, fmt=self.wire_format), sender_id)
+        self.message_count += 1
+        if not self.reliable.received(sender_id, seq):
+            self.duplicate_count += 1
+            return False
+        return True
+
+    def schedule_retransmit(self) -> None:
+        if self.reliable is None or self.retransmit_handle is not None:
+            return
+        deadline = self.reliable.next_deadline()
+        if deadline is not None:
+            self.retransmit_handle = self.loop.call_later(deadline - self.loop.time(), self._retransmit)
+
+    def _retransmit(self) -> None:
+        self.retransmit_handle = None
+        resend, gave_up = self.reliable.due()
+        for msg, receiver_id in resend:
+            self.network.send(self, msg, receiver_id)
+            self.message_count += 1
+            self.retransmit_count += 1
+            self.retransmitted(msg, receiver_id)
+        self.unacked_count += len(gave_up)
+        self.schedule_retransmit()
+        self.check_done()
+
+    def retransmitted(self, msg: bytes, receiver_id: int) -> None:
+        """Called right after a message has been sent again."""
+        pass
+
+    def check_term(self, kind: int, sender_id: int, term: int) -> bool:
+        """Adopt a newer term, messages of an older one go to `stale` instead of being handled."""
+        if term > self.term:
+            self.term = term
+        elif term < self.term:
+            self.stale_count += 1
+            return self.stale(kind, sender_id)
+        return True
+
+    def stale(self, kind: int, sender_id: int) -> bool:
+        """A message of an older term, True to handle it anyway. A leader answers a stale announcement of a lower node with its own."""
+        if kind == wire.COORDINATOR and sender_id < self.node_id and self.has_announced and self.coordinator_id == self.node_id:
+            self.send_message(self.encode(wire.COORDINATOR), sender_id, reply=True)
+        return False
+
+    def message_sent(self, msg: bytes, receiver_id: int) -> None:
+        """Called right after a queued message has actually been sent."""
+        pass
+
+    def election_started(self) -> None:
+        if self.election_time is None:
+            self.election_time = self.loop.time()
+
+    def adopt(self, coordinator_id: int) -> None:
+        self.coordinator_id = coordinator_id
+        self.adopt_time = self.loop.time()
+
+    def announced(self) -> None:
+        if self.announce_time is None:
+            self.announce_time = self.loop.time()
+        self.adopt(self.node_id)
+
+    def busy(self) -> bool:
+        """True while the node has a timer or a probe pending, i.e. while the threaded node would still have a thread running."""
+        return False
+
+    def check_done(self) -> None:
+        if self.listening and (self.coordinator_id != self.node_id or self.has_announced):
+            self.listening = False
+        if not self.listening and not self.sending and not self.busy() and self.retransmit_handle is None and not self.done.done():
+            self.print2(f"Node {self.node_id} is done")
+            self.finish_time = self.loop.time()
+            self.done.set_result(self.coordinator_id)
+
+    def send_message(self, msg: bytes, receiver_id: int, reply: bool = False) -> None:
+        """
+        Queue a message. The queue is drained at the pace given by the node's pacer, which mirrors
+        the wait in front of every send in the threaded nodes without blocking the loop.
+        Replies skip ahead of queued fan-outs, like the threaded nodes answer from the listener
+        thread while another thread is busy fanning out.
+        """
+        if reply:
+            self.outbox.appendleft((msg, receiver_id))
+        else:
+            self.outbox.append((msg, receiver_id))
+        if not self.sending:
+            self.sending = True
+            self.loop.call_later(self.pacer.reserve(receiver_id), self._send_next)
+
+    def _send_next(self) -> None:
+        if not self.outbox:
+            # Whatever was queued got dropped in the meantime
+            self.sending = False
+            self.check_done()
+            return
+        msg, receiver_id = self.outbox.popleft()
+        self.network.send(self, msg, receiver_id)
+        self.message_count += 1
+        if self.reliable is not None:
+            self.reliable.sent(msg, receiver_id)
+            self.schedule_retransmit()
+        self.message_sent(msg, receiver_id)
+        if self.outbox:
+            self.loop.call_later(self.pacer.reserve(self.outbox[0][1]), self._send_next)
+        else:
+            self.sending = False
+            self.check_done()
+
+    def encode(self, kind: int) -> bytes:
+        seq = self.reliable.next_seq() if self.reliable is not None and kind in self.RELIABLE else 0
+        return wire.encode(kind, self.node_id, self.term, seq, fmt=self.wire_format)
+
+    def print2(self, msg, *args, **kwargs):
+        if not self.silent:
+            print(msg, *args, **kwargs)
+
+
+class StandardNode(AsyncNode):
+    RELIABLE = (wire.ELECTION, wire.OK, wire.COORDINATOR)
+
+    def __init__(self, *args, election_timeout: float = None, min_timeout: float = MIN_TIMEOUT, max_timeout: float = None, ok_window: float = 0,
+                 **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.rtt = make_estimator(self.num_nodes, election_timeout, min_timeout, max_timeout)
+        self.election_msg = None
+        self.election_term = -1
+        self.election_sent = {}
+        self.elections_queued = 0
+        self.timer = None
+        # OK coalescing, like in the threaded node
+        self.ok_window = ok_window
+        self.ok_pending = []
+        self.ok_answered = set()
+        self.ok_term = -1
+        self.ok_flush = None
+
+    def starter(self) -> None:
+        self.run_election()
+
+    def handle_message(self, kind: int, sender_id: int) -> None:
+        match kind:
+            case wire.ELECTION:
+                self.msg_received_election(sender_id)
+            case wire.COORDINATOR:
+                self.msg_received_coordinator(sender_id)
+            case wire.OK:
+                self.msg_received_ok(sender_id)
+
+    def busy(self) -> bool:
+        return self.timer is not None or self.ok_flush is not None
+
+    def stale(self, kind: int, sender_id: int) -> bool:
+        if kind == wire.ELECTION and sender_id < self.node_id:
+            # The OK carries the current term, the election itself is not joined
+            self.answer_election(sender_id)
+        return super().stale(kind, sender_id)
+
+    def msg_received_election(self, sender_id):
+        if sender_id < self.node_id:
+            self.answer_election(sender_id)
+            self.run_election()
+
+    def answer_election(self, sender_id):
+        """At most one OK per lower node and term, the ones within `ok_window` go out together."""
+        if self.ok_term != self.term:
+            self.ok_term = self.term
+            self.ok_answered.clear()
+        if sender_id in self.ok_answered:
+            self.coalesced_count += 1
+            return
+        self.ok_answered.add(sender_id)
+        self.ok_pending.append(sender_id)
+        if not self.ok_window:
+            self.send_oks()
+        elif self.ok_flush is None:
+            self.ok_flush = self.loop.call_later(self.ok_window, self.send_oks)
+
+    def send_oks(self):
+        pending, self.ok_pending = self.ok_pending, []
+        self.ok_flush = None
+        for peer_id in pending:
+            self.send_message(self.encode(wire.OK), peer_id, reply=True)
+        self.check_done()
+
+    def msg_received_coordinator(self, sender_id):
+        self.adopt(sender_id)
+
+    def msg_received_ok(self, sender_id):
+        sent = self.election_sent.pop(sender_id, None)
+        if sent is not None:
+            self.rtt.sample(self.loop.time() - sent)
+        if self.reliable is not None:
+            self.reliable.cancel(wire.ELECTION)
+
+        if self.running_election:
+            self.running_election = False
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            if self.elections_queued:
+                # The higher node runs the election from here on, and reaches the rest itself
+                self.outbox = deque(item for item in self.outbox if item[0] is not self.election_msg)
+                self.coalesced_count += self.elections_queued
+                self.elections_queued = 0
+
+    def run_election(self):
+        if not self.running_election and self.election_term < self.term:
+            self.running_election = True
+            self.election_term = self.term
+            self.election_msg = self.encode(wire.ELECTION)
+            self.election_started()
+            self.print2(f"Starting election on {self.node_id}")
+
+            for peer_id in range(self.node_id+1, self.num_nodes):
+                self.send_message(self.election_msg, peer_id)
+                self.elections_queued += 1
+            if not self.elections_queued:
+                self.arm_timer()
+
+    def message_sent(self, msg: bytes, receiver_id: int) -> None:
+        if msg is self.election_msg:
+            self.election_sent[receiver_id] = self.loop.time()
+            self.elections_queued -= 1
+            # Like the threaded node, the timeout counts from the last election message
+            if not self.elections_queued and self.running_election:
+                self.arm_timer()
+
+    def retransmitted(self, msg: bytes, receiver_id: int) -> None:
+        if wire.peek_kind(msg) == wire.ELECTION:
+            # The OK to a retransmit says nothing about the round trip
+            self.election_sent.pop(receiver_id, None)
+
+    def arm_timer(self):
+        self.timer = self.loop.call_later(self.rtt.timeout(), self._election_timeout)
+
+    def _election_timeout(self):
+        self.timer = None
+        if self.running_election and self.reliable is not None and self.reliable.waiting((wire.ELECTION,)):
+            # An election message is still being retransmitted, its receiver may well be alive
+            self.timer = self.loop.call_later(self.reliable.timeout, self._election_timeout)
+            return
+        self.announce_coordinator()
+        self.check_done()
+
+    def announce_coordinator(self):
+        self.print2(f"Announcing coordinator {self.node_id}")
+        self.announced()
+        for peer_id in range(self.num_nodes):
+            self.send_message(self.encode(wire.COORDINATOR), peer_id)
+        self.running_election = False
+        self.has_announced = True
+
+
+class ImprovedNode(AsyncNode):
+    RELIABLE = (wire.ARE_YOU_ALIVE, wire.PROBE, wire.ALIVE, wire.COORDINATOR)
+    ANNOUNCE_RETRIES = 2
+
+    def __init__(self, *args, probe_window: int = 1, probe_timeout: float = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.election_term = -1
+        self.announced_term = -1
+        self.probe_window = probe_window
+        self.probe_timeout = probe_timeout if probe_timeout is not None else self.delay*(2*self.node_id+self.num_nodes)
+        self.probe_candidates = []
+        self.probe_targets = []
+        self.probe_responses = set()
+        self.probe_top = None
+        self.probe_handle = None
+        self.announce_top = None
+        self.announce_asks = 0
+
+    def starter(self) -> None:
+        self.check_alive()
+
+    def handle_message(self, kind: int, sender_id: int) -> None:
+        match kind:
+            case wire.ARE_YOU_ALIVE:
+                self.msg_received_rua(sender_id)
+            case wire.COORDINATOR:
+                self.msg_received_coordinator(sender_id)
+            case wire.PROBE:
+                self.msg_received_probe(sender_id)
+            case wire.ALIVE:
+                self.msg_received_alive(sender_id)
+
+    def busy(self) -> bool:
+        return self.probe_handle is not None
+
+    def stale(self, kind: int, sender_id: int) -> bool:
+        # Stale probes are answered, the answer carries the current term
+        return super().stale(kind, sender_id) or kind in (wire.ARE_YOU_ALIVE, wire.PROBE)
+
+    def msg_received_rua(self, sender_id):
+        if sender_id < self.node_id:
+            if self.announced_term == self.term:
+                # Already announced in this term, only the node asking missed it
+                self.send_message(self.encode(wire.COORDINATOR), sender_id, reply=True)
+            else:
+                self.announce_coordinator()
+
+    def msg_received_coordinator(self, sender_id):
+        if sender_id < self.node_id:
+            if not self.running_election:
+                self.term += 1
+                self.check_alive()
+        else:
+            self.adopt(sender_id)
+            self.running_election = False
+
+    def msg_received_probe(self, sender_id):
+        if sender_id < self.node_id:
+            self.send_message(self.encode(wire.ALIVE), sender_id, reply=True)
+
+    def msg_received_alive(self, sender_id):
+        if self.probe_top is None:
+            return
+        self.probe_responses.add(sender_id)
+        if sender_id == self.probe_top and self.probe_handle is not None:
+            # Nobody in the window can beat this one, stop waiting
+            if self.reliable is not None:
+                self.reliable.cancel(wire.PROBE)
+            self.probe_handle.cancel()
+            self._probe_next()
+
+    def check_alive(self):
+        """
+        Same top-down probing as `improved_bully.Node.check_alive`, but every step is scheduled
+        on the loop instead of sleeping between probes.
+        """
+        self.running_election = True
+        self.election_term = self.term
+        self.election_started()
+        self.probe_candidates = list(range(self.node_id, self.num_nodes))
+        self.probe_targets = list(self.probe_candidates)
+        self.announce_top = None
+        if self.probe_handle is None:
+            self._probe_next()
+
+    def _probe_next(self):
+        self.probe_handle = None
+        if self.running_election and self.reliable is not None and self.reliable.waiting((wire.ARE_YOU_ALIVE, wire.PROBE)):
+            # A probe is still being retransmitted, its receiver may well be alive
+            self.probe_handle = self.loop.call_later(self.reliable.timeout, self._probe_next)
+            return
+        if not self.running_election:
+            self.check_done()
+            return
+
+        if self.probe_responses:
+            # The window had answers, ask the highest one to announce itself
+            self.announce_top = max(self.probe_responses)
+            self.announce_asks = 0
+            self.probe_responses.clear()
+            self.probe_top = None
+        if self.announce_top is not None and self.announce_asks == self.ANNOUNCE_RETRIES:
+            # It answered the probe but never announced, so it died since: start over from the top without it
+            self.probe_candidates.remove(self.announce_top)
+            self.probe_targets = list(self.probe_candidates)
+            self.announce_top = None
+
+        if self.announce_top is not None:
+            self.announce_asks += 1
+            self.send_message(self.encode(wire.ARE_YOU_ALIVE), self.announce_top)
+        elif not self.probe_targets:
+            self.running_election = False
+            self.announce_coordinator()
+            self.check_done()
+            return
+        elif self.probe_window > 1:
+            window = [self.probe_targets.pop() for _ in range(min(self.probe_window, len(self.probe_targets)))]
+            self.probe_top = window[0]
+            for peer_id in window:
+                self.send_message(self.encode(wire.PROBE), peer_id)
+        else:
+            peer_id = self.probe_targets.pop()
+            self.send_message(self.encode(wire.ARE_YOU_ALIVE), peer_id)
+        self.probe_handle = self.loop.call_later(self.delay*len(self.outbox) + self.probe_timeout, self._probe_next)
+
+    def announce_coordinator(self):
+        if self.announced_term == self.term:
+            return
+        self.announced_term = self.term
+
+        self.print2(f"Announcing coordinator {self.node_id} in term {self.term}")
+        self.announced()
+        for peer_id in range(self.num_nodes):
+            self.send_message(self.encode(wire.COORDINATOR), peer_id)
+        self.has_announced = True
+
+
+VARIANTS = {
+    "standard": StandardNode,
+    "improved": ImprovedNode,
+}
+
+
+async def run_nodes(variant: str,
+                    num: int,
+                    starters: list[int],
+                    alive: list[int],
+                    port: int = None,
+                    timeout: float = None,
+                    network = None,
+                    **node_kwargs) -> list[AsyncNode]:
+    """
+    Run one election with every alive node on the running event loop.
+    Without a `port` (or an explicit `network`) messages are passed in memory, otherwise over UDP.
+    """
+    loop = asyncio.get_running_loop()
+    if network is None:
+        network = LocalNetwork(loop) if port is None else UdpNetwork(loop, port)
+    implementation = VARIANTS[variant]
+
+    nodes = [implementation(node_id, num, node_id in starters, network, **node_kwargs) for node_id in alive]
+    for node in nodes:
+        await network.register(node)
+    for node in nodes:
+        node.start()
+
+    await asyncio.wait([node.done for node in nodes], timeout=timeout)
+    network.close()
+    return nodes
+
+
+def phase_times(nodes: list[AsyncNode], start: float, end: float) -> tuple[float, float, float]:
+    """Startup, election and teardown seconds of a run from `start` to `end` (loop time), like `MetricsBlock.phases`."""
+    ready = max((node.ready_time for node in nodes if node.ready_time is not None), default=start)
+    election_start = min((node.start_time for node in nodes if node.start_time is not None), default=ready)
+    election_end = max((node.finish_time for node in nodes if node.finish_time is not None), default=election_start)
+    return ready - start, election_end - election_start, end - election_end
+
+
+def convergence_times(nodes: list[AsyncNode]) -> tuple:
+    """`metrics.convergence` of a run, in seconds of loop time."""
+    return metrics.convergence([node.election_time for node in nodes], [node.announce_time for node in nodes],
+                               [node.adopt_time for node in nodes], [node.coordinator_id for node in nodes])
+
+
+def run(variant: str, num: int, starters: list[int], alive: list[int], **kwargs) -> list[AsyncNode]:
+    return asyncio.run(run_nodes(variant, num, starters, alive, **kwargs))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("variant", choices=VARIANTS.keys())
+    parser.add_argument("-n", "--num_nodes", type=int, default=5)
+    starter = parser.add_mutually_exclusive_group(required=True)
+    starter.add_argument("-s", "--starters", type=int, nargs="+")
+    starter.add_argument("-S", '--num-starters', type=int)
+    alive = parser.add_mutually_exclusive_group(required=True)
+    alive.add_argument("-a", "--alive", type=int, nargs="+")
+    alive.add_argument("-A", '--num-alive', type=int)
+    parser.add_argument("--seed", type=int, default=None, help="seed for picking the -A/-S nodes, printed so a run can be repeated")
+    parser.add_argument("-p", "--base_port", type=int, default=None, help="use UDP from this port instead of in-memory delivery")
+    parser.add_argument("-d", "--delay", type=float, default=0.01, help="time unit of the protocol timers, also the default pause between sends")
+    parser.add_argument("--pacing", type=str, default=None, help="none, fixed:DELAY, bucket:RATE[:BURST] or dest:RATE")
+    parser.add_argument("--wire-format", choices=wire.FORMATS, default="binary", help="text messages are easier to read when debugging")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="give up waiting for nodes after this many seconds")
+
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    rng = random.Random(seed)
+    num_proc = args.num_nodes
+    if args.num_alive:
+        alive_nodes = sorted(rng.sample(range(num_proc), args.num_alive))
+    else:
+        alive_nodes = args.alive
+
+    if args.num_starters:
+        starter_nodes = sorted(rng.sample(alive_nodes, args.num_starters))
+    else:
+        starter_nodes = args.starters
+
+    print(f"{num_proc = }")
+    print(f"{len(alive_nodes) = }")
+    print(f"{starter_nodes = }")
+    print(f"{seed = }")
+
+    nodes = run(args.variant, num_proc, starter_nodes, alive_nodes,
+                port=args.base_port, timeout=args.timeout, delay=args.delay, pacing=args.pacing, wire_format=args.wire_format)
+
+    print("")
+    print(f"Total messages sent: {sum(node.message_count for node in nodes)}")
+    print(metrics.format_convergence(convergence_times(nodes)))
+    coordinators = [node.coordinator_id for node in nodes]
+    if all(coordinators[0] == coordinator for coordinator in coordinators):
+        print(f"Coordinator: {coordinators[0]}")
+    else:
+        print("No coordinator elected")
+        print(f"Coordinators: {coordinators}")
@@ -0,0 +1,41 @@
+import argparse
+import socket
+import time
+
+
+def socket_per_message(count: int, port: int) -> float:
+    """The old `send_message`: open, send and close a socket for every datagram."""
+    t0 = time.perf_counter()
+    for _ in range(count):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b"election 42", ("127.0.0.1", port))
+    return time.perf_counter() - t0
+
+
+def persistent_socket(count: int, port: int) -> float:
+    """The current `send_message`: every datagram goes out on the same long-lived socket."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        t0 = time.perf_counter()
+        for _ in range(count):
+            sock.sendto(b"election 42", ("127.0.0.1", port))
+        return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-message cost of sending election datagrams, without the pacing delay")
+    parser.add_argument("-c", "--count", type=int, default=100_000)
+    parser.add_argument("-p", "--port", type=int, default=4000)
+
+    args = parser.parse_args()
+
+    # A bound receiver that is never read from, so datagrams have somewhere to go
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver:
+        receiver.bind(("127.0.0.1", args.port))
+
+        for name, bench in [("socket per message", socket_per_message), ("persistent socket", persistent_socket)]:
+            elapsed = bench(args.count, args.port)
+            print(f"{name:>20}: {elapsed/args.count*1e6:6.2f} us/message ({args.count} messages in {elapsed:.3f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import selectors
+import time
+from multiprocessing import Process, RawValue
+from threading import Thread
+from metrics import percentile
+from transport import TRANSPORTS, RECV_BATCH, make_transport, drain
+import wire
+
+
+def receive(endpoint, count: int, timeout: float, echo=None, progress=None) -> int:
+    """
+    Receive up to `count` datagrams the way the listener does, sending each one back with `echo` and
+    counting them in `progress.value`. Returns how many came.
+    """
+    received = 0
+    with selectors.DefaultSelector() as selector:
+        selector.register(endpoint, selectors.EVENT_READ)
+        while received < count and selector.select(timeout):
+            datagrams, _ = drain(endpoint, min(RECV_BATCH, count - received))
+            received += len(datagrams)
+            if echo is not None:
+                for data in datagrams:
+                    echo(data)
+            if progress is not None:
+                progress.value = received
+    return received
+
+
+def receive_one(selector: selectors.BaseSelector, endpoint, timeout: float) -> bool:
+    """Wait for one datagram. An endpoint may be readable with nothing to read, like the shm inboxes after a late wakeup."""
+    while selector.select(timeout):
+        try:
+            endpoint.recvfrom(1024)
+            return True
+        except BlockingIOError:
+            continue
+    return False
+
+
+def spawn(target, args: tuple, processes: bool) -> Thread | Process:
+    """Start the other end as a thread, or as a process of its own like the nodes in process mode."""
+    peer = (Process if processes else Thread)(target=target, args=args)
+    peer.start()
+    return peer
+
+
+def throughput(transport, count: int, window: int, processes: bool = False) -> tuple[float, int]:
+    """
+    Datagrams per second from one sender to one receiver, and the number that got lost on the way.
+    The sender stays at most `window` datagrams ahead, so the rate is what the receiver keeps up with.
+    """
+    msg = wire.encode(wire.ELECTION, 1)
+    with transport.bind(0) as receiver, transport.socket() as sender:
+        progress = RawValue("q", 0)
+        peer = spawn(receive, (receiver, count, .5, None, progress), processes)
+        t0 = time.perf_counter()
+        for sent in range(count):
+            deadline = time.perf_counter() + .1
+            while sent - progress.value >= window and time.perf_counter() < deadline:
+                time.sleep(0)
+            transport.send(sender, msg, 0)
+        peer.join()
+        elapsed = time.perf_counter() - t0
+    return progress.value/elapsed, count - progress.value
+
+
+def latency(transport, count: int, processes: bool = False) -> list[float]:
+    """Round trip times in seconds of `count` ping-pongs between two endpoints."""
+    msg = wire.encode(wire.ELECTION, 1)
+    with transport.bind(0) as ping, transport.bind(1) as pong:
+        echo = spawn(receive, (pong, count, 1, lambda data: transport.send(pong, data, 0)), processes)
+        times = []
+        with selectors.DefaultSelector() as selector:
+            selector.register(ping, selectors.EVENT_READ)
+            for _ in range(count):
+                t0 = time.perf_counter()
+                transport.send(ping, msg, 1)
+                if not receive_one(selector, ping, 1):
+                    break
+                times.append(time.perf_counter() - t0)
+        echo.join()
+    return times
+
+
+def elections(transports: list[str], batch: list[dict], port: int, pacing: str) -> dict:
+    """
+    Run every election of `batch` in process mode over each transport. Returns the summed message
+    counts and election times by transport and variant.
+    """
+    from compare import run_set, Standard, Improved
+    totals = {}
+    for name in transports:
+        for variant, implementation in (("standard", Standard), ("improved", Improved)):
+            messages, election = 0, 0.0
+            for test in batch:
+                sent, _, seconds, _, _ = run_set(implementation, test["num"], test["starters"], test["alive"], port,
+                                                 pacing=pacing, transport=name)
+                messages += sent
+                election += seconds
+            totals[name, variant] = (messages, election)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and round trip latency of the transports, without the pacing delay")
+    parser.add_argument("-c", "--count", type=int, default=100_000, help="datagrams for the throughput")
+    parser.add_argument("-w", "--window", type=int, default=8, help="datagrams the sender may be ahead of the receiver, below the 10 a unix socket queues")
+    parser.add_argument("-r", "--round-trips", type=int, default=10_000)
+    parser.add_argument("-p", "--port", type=int, default=4000)
+    parser.add_argument("-t", "--transports", choices=TRANSPORTS, nargs="+", default=list(TRANSPORTS))
+    parser.add_argument("--processes", action="store_true", help="receive and echo in another process, the queue transport is skipped")
+    parser.add_argument("--spin", type=float, default=0, help="seconds an empty shm inbox is watched before sleeping")
+    parser.add_argument("-e", "--elections", metavar="FILE", default=None,
+                        help="also run the elections of a batch file in process mode over each transport but queue")
+    parser.add_argument("--pacing", type=str, default="none", help="pacing of the elections")
+
+    args = parser.parse_args()
+
+    for name in args.transports:
+        if args.processes and name == "queue":
+            continue
+        transport = make_transport(name, args.port, 2)
+        if name == "shm":
+            transport.spin = args.spin
+        rate, lost = throughput(transport, args.count, args.window, args.processes)
+        times = latency(transport, args.round_trips, args.processes)
+        print(f"{name:>6}: {rate/1e3:6.0f} k messages/s ({lost} lost), round trip p50 {percentile(times, 50)*1e6:5.1f} us, "
+              f"p99 {percentile(times, 99)*1e6:5.1f} us")
+
+    if args.elections is not None:
+        with open(args.elections) as f:
+            batch = json.load(f)
+        transports = [name for name in args.transports if name != "queue"]
+        totals = elections(transports, batch, args.port, args.pacing)
+        for (name, variant), (messages, election) in totals.items():
+            print(f"{name:>6} {variant:>8}: {messages} messages, {election:.3f} s of election in {len(batch)} tests")
+
+
+if __name__ == "__main__":
+    main()
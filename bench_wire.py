@@ -0,0 +1,49 @@
+import argparse
+import time
+import wire
+
+
+def parse_text_split(data: bytes):
+    """What the listeners used to do with every datagram."""
+    match data.decode("UTF8").split(' '):
+        case ["election", id]:
+            return wire.ELECTION, int(id), 0, 0
+        case ["coordinator", id]:
+            return wire.COORDINATOR, int(id), 0, 0
+        case ["OK", id]:
+            return wire.OK, int(id), 0, 0
+        case ["are_you_alive", id]:
+            return wire.ARE_YOU_ALIVE, int(id), 0, 0
+
+
+def bench(parse, messages: list[bytes], rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for msg in messages:
+            parse(msg)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse throughput of the text and binary wire formats")
+    parser.add_argument("-r", "--rounds", type=int, default=50_000)
+
+    args = parser.parse_args()
+
+    kinds = [wire.ELECTION, wire.OK, wire.COORDINATOR, wire.ARE_YOU_ALIVE]
+    text = [wire.encode(kind, 4242, fmt="text") for kind in kinds]
+    binary = [wire.encode(kind, 4242, fmt="binary") for kind in kinds]
+
+    benches = [
+        ("text, decode+split", parse_text_split, text),
+        ("text, wire.decode", wire.decode, text),
+        ("binary, wire.decode", wire.decode, binary),
+    ]
+    count = args.rounds*len(kinds)
+    for name, parse, messages in benches:
+        elapsed = bench(parse, messages, args.rounds)
+        print(f"{name:>20}: {count/elapsed/1e6:5.2f} M messages/s ({elapsed/count*1e9:5.0f} ns/message)")
+
+
+if __name__ == "__main__":
+    main()
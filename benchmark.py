@@ -0,0 +1,177 @@
+"""
+Scaling benchmark: both variants over a grid of cluster sizes, alive fractions and starter counts.
+
+    python benchmark.py --nodes 10 100 1000 --alive .1 .5 1 --starters 1 4 -o bench.json --csv bench.csv
+
+Every election runs in a fresh worker process, so the CPU time and peak RSS of a record are those of
+that election alone. CPU time includes the node processes, the peak RSS is that of the largest single
+process (the worker itself in thread, inline and simulate mode, a node in process mode), next to
+`baseline_rss_kb`, what the worker used before the election started. Each record also has the message
+count and the election and convergence times, see `compare.run_set`.
+
+With `--baseline` the results are checked against an earlier run of the same grid, and the script
+exits with 1 if a message count, agreement time, CPU time or peak RSS grew by more than `--tolerance`.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import argparse
+import resource
+import random
+import json
+import time
+import csv
+import sys
+import os
+import compare
+import wire
+
+MODES = ("process", "thread", "inline", "simulate")
+VARIANTS = ("standard", "improved")
+FIELDS = ["variant", "mode", "num_nodes", "alive_fraction", "num_alive", "num_starters", "repeat", "seed",
+          "messages", "startup", "election", "teardown", "first_announce", "agreement", "adoption_p50", "adoption_p99",
+          "wall_time", "cpu_time", "peak_rss_kb", "baseline_rss_kb"]
+WATCHED = ("messages", "agreement", "cpu_time", "peak_rss_kb")
+
+
+def scenario(num:int, alive_fraction:float, num_starters:int, seed:int) -> tuple[list[int], list[int]]:
+    """The alive and starter nodes of one grid point, the same for the same arguments on every run."""
+    rng = random.Random(f"{seed}:{num}:{alive_fraction}:{num_starters}")
+    alive = sorted(rng.sample(range(num), max(1, round(num*alive_fraction))))
+    starters = sorted(rng.sample(alive, min(num_starters, len(alive))))
+    return alive, starters
+
+
+def usage() -> tuple[float, int]:
+    """CPU seconds of this process and its finished children, and the larger of their peak RSS in KiB."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, max(own.ru_maxrss, children.ru_maxrss)
+
+
+def init_worker() -> None:
+    """The workers are spawned, but the nodes they start must be forked like everywhere else."""
+    multiprocessing.set_start_method("fork", force=True)
+
+
+def run_point(variant:str, mode:str, num:int, alive:list[int], starters:list[int], port:int, **node_options) -> dict:
+    """One election in the calling process. Meant for a worker of its own, the peak RSS never goes down."""
+    implementation = compare.Standard if variant == "standard" else compare.Improved
+    cpu_start, baseline_rss = usage()
+    start = time.monotonic()
+    if mode == "simulate":
+        messages, election, convergence = compare.simulate_set(implementation, num, starters, alive, **node_options)
+        startup = teardown = None
+    else:
+        messages, startup, election, teardown, convergence = compare.run_set(implementation, num, starters, alive, port,
+                                                                             execution_mode=mode, **node_options)
+    wall_time = time.monotonic() - start
+    cpu_end, peak_rss = usage()
+
+    first_announce, agreement, p50, p99 = convergence
+    return {"messages": messages, "startup": startup, "election": election, "teardown": teardown,
+            "first_announce": first_announce, "agreement": agreement, "adoption_p50": p50, "adoption_p99": p99,
+            "wall_time": wall_time, "cpu_time": cpu_end - cpu_start, "peak_rss_kb": peak_rss, "baseline_rss_kb": baseline_rss}
+
+
+def benchmark(nodes:list[int], alive_fractions:list[float], starter_counts:list[int], variants=VARIANTS, mode:str="process",
+              repeat:int=1, seed:int=0, port:int=4000, max_procs:int=None, **node_options) -> list[dict]:
+    """
+    Run every point of the grid `repeat` times with each variant, one after the other, and return a record per election.
+    In process mode, points with more alive nodes than `max_procs` (default 64 per core) are skipped.
+    """
+    if max_procs is None:
+        max_procs = 64*os.cpu_count()
+
+    results = []
+    # A fresh spawned worker per election, a forked one would start out with this process' memory
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=1,
+                             initializer=init_worker) as pool:
+        for num in nodes:
+            for alive_fraction in alive_fractions:
+                for num_starters in starter_counts:
+                    for r in range(repeat):
+                        alive, starters = scenario(num, alive_fraction, num_starters, seed + r)
+                        point = {"mode": mode, "num_nodes": num, "alive_fraction": alive_fraction, "num_alive": len(alive),
+                                 "num_starters": len(starters), "repeat": r, "seed": seed + r}
+                        if mode == "process" and len(alive) > max_procs:
+                            print(f"Skipping {num} nodes with {len(alive)} alive, more than {max_procs} processes")
+                            continue
+                        if mode != "simulate" and port + num >= 65536:
+                            print(f"Skipping {num} nodes, their ports do not fit above {port}")
+                            continue
+
+                        for variant in variants:
+                            print(f"{variant}: {num} nodes, {len(alive)} alive, {len(starters)} starters ({mode})")
+                            record = pool.submit(run_point, variant, mode, num, alive, starters, port, **node_options).result()
+                            results.append({"variant": variant, **point, **record})
+    return results
+
+
+def write_json(results:list[dict], path:str) -> None:
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def write_csv(results:list[dict], path:str) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def regressions(results:list[dict], baseline:list[dict], tolerance:float=0.2) -> list[str]:
+    """What got worse than in `baseline` by more than `tolerance`, for the records of the same grid point."""
+    key = lambda record: (record["variant"], record["mode"], record["num_nodes"], record["alive_fraction"],
+                          record["num_starters"], record["repeat"], record["seed"])
+    old = {key(record): record for record in baseline}
+    found = []
+    for record in results:
+        before = old.get(key(record))
+        if before is None:
+            continue
+        name = "{variant} {num_nodes} nodes, {num_alive} alive, {num_starters} starters".format(**record)
+        for field in WATCHED:
+            if before[field] is not None and record[field] is None:
+                found.append(f"{name}: no {field} any more")
+            elif before[field] and record[field] is not None and record[field] > before[field]*(1 + tolerance):
+                found.append(f"{name}: {field} {before[field]:.6g} -> {record[field]:.6g}")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep cluster size, alive fraction and starter count for both variants")
+    parser.add_argument("-n", "--nodes", type=int, nargs="+", default=[10, 100, 1000], help="cluster sizes, up to 10000")
+    parser.add_argument("-a", "--alive", type=float, nargs="+", default=[.1, .5, 1.0], help="fractions of the nodes that are alive")
+    parser.add_argument("-s", "--starters", type=int, nargs="+", default=[1, 4], help="numbers of nodes starting an election at once")
+    parser.add_argument("--variants", choices=VARIANTS, nargs="+", default=list(VARIANTS))
+    parser.add_argument("--mode", choices=MODES, default="process",
+                        help="a process or a thread per node, all nodes on one event loop (inline), or the simulator's virtual clock")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="runs per grid point, each with its own random nodes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-p", "--base_port", type=int, default=4000)
+    parser.add_argument("--max-procs", type=int, default=None, help="skip process mode points with more alive nodes, defaults to 64 per core")
+    parser.add_argument("--pacing", type=str, default="fixed:0.01", help="none, fixed:DELAY, bucket:RATE[:BURST] or dest:RATE")
+    parser.add_argument("--wire-format", choices=wire.FORMATS, default="binary")
+
+    output = parser.add_argument_group("Output")
+    output.add_argument("-o", "--json", type=str, default="benchmark.json")
+    output.add_argument("--csv", type=str, default=None)
+    output.add_argument("--baseline", type=str, default=None, help="JSON of an earlier run to compare against")
+    output.add_argument("--tolerance", type=float, default=0.2, help="allowed relative growth before a change counts as a regression")
+
+    args = parser.parse_args()
+
+    results = benchmark(args.nodes, args.alive, args.starters, args.variants, args.mode, args.repeat, args.seed, args.base_port,
+                        args.max_procs, pacing=args.pacing, wire_format=args.wire_format)
+    write_json(results, args.json)
+    if args.csv is not None:
+        write_csv(results, args.csv)
+    print(f"{len(results)} runs written to {args.json}" + (f" and {args.csv}" if args.csv is not None else ""))
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"Regression: {line}")
+        if found:
+            sys.exit(1)
@@ -0,0 +1,192 @@
+"""
+The command line of `standard_bully.py` and `improved_bully.py`.
+
+`make_parser` has the options of both scripts, each script adds the ones of its own variant. `parse_args`
+checks them against each other, and `run` picks the alive nodes and starters, runs one election and
+prints the results.
+
+`--execution-mode inline` runs the nodes of `async_bully.py` on one event loop. Those have no membership
+cache (`--membership`), no daemon mode (`--heartbeat`), no tracing (`--trace`) and no multicast. They
+talk over udp or in memory (`--transport queue`), not over unix sockets or shared memory, and have no
+node sockets to size with `--rcvbuf`.
+"""
+from argparse import ArgumentParser, Namespace
+from multiprocessing import Barrier
+from time import monotonic, monotonic_ns
+import random
+from metrics import MetricsBlock
+from node import EXECUTION_MODES
+from transport import TRANSPORTS
+import wire
+import multicast
+import metrics
+import async_bully
+import failover
+
+
+def make_parser(multicast_help: str) -> ArgumentParser:
+    """`multicast_help` says what the variant sends to the group."""
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--num_nodes", type=int, default=5)
+    starter = parser.add_mutually_exclusive_group(required=True)
+    starter.add_argument("-s", "--starters", type=int, nargs="+")
+    starter.add_argument("-S", '--num-starters', type=int)
+    alive = parser.add_mutually_exclusive_group(required=True)
+    alive.add_argument("-a", "--alive", type=int, nargs="+")
+    alive.add_argument("-A", '--num-alive', type=int)
+    parser.add_argument("--seed", type=int, default=None, help="seed for picking the -A/-S nodes, printed so a run can be repeated")
+    parser.add_argument("-p", "--base_port", type=int, default=5000)
+    parser.add_argument("--pacing", type=str, default="fixed:0.01", help="none, fixed:DELAY, bucket:RATE[:BURST] or dest:RATE")
+    parser.add_argument("--wire-format", choices=wire.FORMATS, default="binary", help="text messages are easier to read when debugging")
+    parser.add_argument("-m", "--multicast", nargs="?", const=multicast.DEFAULT_GROUP, default=None, metavar="GROUP",
+                        help=f"{multicast_help} (default {multicast.DEFAULT_GROUP})")
+
+    parser.add_argument("--execution-mode", choices=EXECUTION_MODES + ("inline",), default="process",
+                        help="a process or a thread per node, or all nodes on one event loop (inline)")
+    parser.add_argument("--trace", metavar="DIR", default=None, help="write an event trace of every node to DIR, see tracing.py")
+    parser.add_argument("--trace-size", type=int, default=4096, help="events kept per node, older ones are overwritten")
+    parser.add_argument("--heartbeat", type=float, default=None, metavar="INTERVAL",
+                        help="daemon mode: the leader sends heartbeats, and the script stops it once to measure the failover")
+    parser.add_argument("--heartbeat-timeout", type=float, default=None, help="missed heartbeat detection, defaults to 3*INTERVAL")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="udp", help="unix datagram sockets, shared memory rings, or in-process queues for threads, instead of UDP")
+    parser.add_argument("--membership", type=float, default=None, metavar="TTL",
+                        help="stop sending to nodes that failed to answer, until the suspicion expires after TTL seconds")
+    parser.add_argument("--rcvbuf", type=int, default=None, metavar="BYTES", help="receive buffer of the node sockets, udp and unix only")
+    parser.add_argument("--retransmit", type=float, default=None, metavar="TIMEOUT",
+                        help="ack the election messages and send them again after TIMEOUT, doubling it every time, see reliable.py")
+    parser.add_argument("--retries", type=int, default=3, help="retransmits of a message before its receiver is given up on")
+    return parser
+
+
+def parse_args(parser: ArgumentParser) -> Namespace:
+    """Parse the command line, and stop with an error on options that don't go together."""
+    args = parser.parse_args()
+    if args.execution_mode == "inline" and args.multicast is not None:
+        parser.error("multicast is not supported inline")
+    if args.execution_mode == "inline" and args.trace is not None:
+        parser.error("tracing is not supported inline")
+    if args.execution_mode == "inline" and args.heartbeat is not None:
+        parser.error("daemon mode is not supported inline")
+    if args.execution_mode == "inline" and args.membership is not None:
+        parser.error("the membership cache is not supported inline")
+    if args.execution_mode == "process" and args.transport == "queue":
+        parser.error("the queue transport needs --execution-mode thread")
+    if args.multicast is not None and args.transport != "udp":
+        parser.error("multicast needs the udp transport")
+    if args.execution_mode == "inline" and args.transport in ("unix", "shm"):
+        parser.error("the inline nodes use udp, or in-memory delivery with --transport queue")
+    if args.rcvbuf is not None and (args.execution_mode == "inline" or args.transport not in ("udp", "unix")):
+        parser.error("--rcvbuf needs node sockets, the udp or unix transport")
+    return args
+
+
+def run(variant: str, node_class: type, args: Namespace, **options) -> None:
+    """
+    Run one election of `node_class` nodes (or the inline nodes of `variant`) as `args` say, and print the results.
+    `options` are the ones of the variant, the same names for the nodes and for `async_bully.run`.
+    """
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    rng = random.Random(seed)
+    num_proc = args.num_nodes
+    if args.num_alive:
+        alive_nodes = sorted(rng.sample(range(num_proc), args.num_alive))
+    else:
+        alive_nodes = args.alive
+
+    if args.num_starters:
+        starter_nodes = sorted(rng.sample(alive_nodes, args.num_starters))
+    else:
+        starter_nodes = args.starters
+
+    print(f"{num_proc = }")
+    print(f"{alive_nodes = }")
+    print(f"{starter_nodes = }")
+    print(f"{seed = }")
+
+    start = monotonic_ns()
+    if args.execution_mode == "inline":
+        port = args.base_port if args.transport == "udp" else None
+        nodes = async_bully.run(variant, num_proc, starter_nodes, alive_nodes, port=port, pacing=args.pacing,
+                                wire_format=args.wire_format, retransmit_timeout=args.retransmit, retries=args.retries, **options)
+        message_counts = [node.message_count for node in nodes]
+        datagram_counts = message_counts
+        coordinator_ids = [node.coordinator_id for node in nodes]
+        teardowns = None
+        skipped = None
+        coalesced = [node.coalesced_count for node in nodes]
+        dropped = None
+        retransmits = [(node.retransmit_count, node.duplicate_count, node.unacked_count) for node in nodes]
+        phases = async_bully.phase_times(nodes, start/1e9, monotonic())
+        convergence = async_bully.convergence_times(nodes)
+    else:
+        processes = []
+        block = MetricsBlock(len(alive_nodes))
+        ready = Barrier(len(alive_nodes))
+        for slot, node_id in enumerate(alive_nodes):
+            starter = node_id in starter_nodes
+            p = node_class(node_id, num_proc, args.base_port, starter, pacing=args.pacing, wire_format=args.wire_format,
+                           multicast_group=args.multicast, metrics=block.slot(slot), execution_mode=args.execution_mode, ready_barrier=ready,
+                           trace_dir=args.trace, trace_size=args.trace_size, heartbeat_interval=args.heartbeat, heartbeat_timeout=args.heartbeat_timeout,
+                           membership_ttl=args.membership, transport=args.transport, rcvbuf=args.rcvbuf,
+                           retransmit_timeout=args.retransmit, retries=args.retries, **options)
+            processes.append(p)
+
+        for p in processes:
+            p.start()
+
+        if args.heartbeat is not None:
+            # Daemon nodes only stop on an exit message
+            detection, failover_time = failover.measure_failover(block, alive_nodes, args.base_port, transport=args.transport)
+            failover.stop_nodes(args.base_port, alive_nodes, args.transport)
+
+        for p in processes:
+            p.join()
+
+        message_counts = block.messages_sent()
+        datagram_counts = block.datagrams_sent()
+        coordinator_ids = block.coordinators()
+        teardowns = block.teardowns()
+        skipped = block.skipped()
+        coalesced = block.coalesced()
+        dropped = block.kernel_drops()
+        results = block.array()
+        retransmits = results[:, [metrics.RETRANSMITS, metrics.DUPLICATES, metrics.UNACKED]].tolist()
+        phases = block.phases(start, monotonic_ns())
+        convergence = block.convergence()
+        block.close()
+
+    print("")
+    for node, count, coord in zip(alive_nodes, message_counts, coordinator_ids):
+        print(f"{node} sent {count} messages, and got coordinator {coord}")
+    print(f"Total messages sent: {sum(message_counts)}")
+    print(f"Total datagrams sent: {sum(datagram_counts)}")
+    if args.membership is not None and skipped is not None:
+        print(f"Total messages skipped: {sum(skipped)}")
+    print(f"Total messages coalesced: {sum(coalesced)}")
+    if dropped is not None and args.transport == "udp":
+        print(f"Datagrams dropped by the kernel: {sum(dropped)}")
+    if args.retransmit is not None:
+        resent, duplicates, unacked = (sum(counts) for counts in zip(*retransmits))
+        print(f"Retransmits: {resent}, duplicates dropped: {duplicates}, messages never acked: {unacked}")
+    if teardowns is not None:
+        print(f"Slowest teardown: {max(teardowns)*1000:.1f} ms")
+    print("Startup {:.3f} s, election {:.3f} s, teardown {:.3f} s".format(*phases))
+    print(metrics.format_convergence(convergence))
+    if args.heartbeat is not None:
+        if failover_time is not None:
+            print(f"Failover: leader {max(alive_nodes)} stopped, missed heartbeats noticed after {detection:.3f} s, new leader agreed on after {failover_time:.3f} s")
+        else:
+            print(f"Failover: no new leader agreed on after stopping {max(alive_nodes)}")
+    print("")
+    if args.heartbeat is not None and len(alive_nodes) > 1:
+        # The leader was stopped for the failover, the others should have moved on to the next one
+        coordinator_ids = [coordinator_id for node, coordinator_id in zip(alive_nodes, coordinator_ids) if node != max(alive_nodes)]
+    if all(coordinator_ids[0] == coordinator_id for coordinator_id in coordinator_ids):
+        print(f"Coordinator: {coordinator_ids[0]}")
+    else:
+        print("No coordinator elected")
+        print(f"Coordinators: {coordinator_ids}")
+    print("")
+    print(f"{num_proc = }")
+    print(f"{alive_nodes = }")
+    print(f"{starter_nodes = }")
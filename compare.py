@@ -1,67 +1,241 @@
 import argparse
+import os
 import random
 from standard_bully import Node as Standard
 from improved_bully import Node as Improved
-from multiprocessing import Value
-from ctypes import c_uint
 import json
-import pandas as pd
+from multiprocessing import Barrier
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import Thread, Condition, Lock
 import time
-from matplotlib import pyplot as plt
 import numpy as np
+import simulator
+import async_bully
+import wire
+import multicast
+import transport
+import metrics
 
-def run_set(implementation: type[Standard|Improved], num:int, starters:list[int], alive:list[int], port:int=4000, verbose:bool=False):
+# The jobs of `run_jobs` start their nodes from threads of one process. A fork copies the locks other
+# threads hold at that moment, so only one thread forks at a time
+START_LOCK = Lock()
+
+def run_set(implementation: type[Standard|Improved], num:int, starters:list[int], alive:list[int], port:int=4000, verbose:bool=False, execution_mode:str="process", **node_options):
+    """
+    Run one election with a process (or thread) per alive node, or with all of them inline on one event loop.
+    Returns the number of messages sent, the startup, election and teardown time in seconds, and the
+    convergence of the election (`metrics.convergence`: first announce, agreement, p50 and p99 adoption spread).
+    `node_options` (pacing, wire_format, multicast_group, transport, ...) are passed on to every node.
+    """
     if implementation == Standard:
         print("Running standard bully")
+        variant = "standard"
     elif implementation == Improved:
         print("Running improved bully")
+        variant = "improved"
     else:
         raise ValueError(f"Unknown implementation {implementation}")
     
+    if execution_mode == "inline":
+        return run_set_inline(variant, num, starters, alive, port, verbose, **node_options)
+    
     processes = []
-    message_counts = []
-    coordinator_ids = []
-    
-    for node_id in alive:
-        starter = node_id in starters
-        count = Value(c_uint)
-        coordinator = Value(c_uint)
-        p = implementation(node_id, num, port, starter, coordinator, count, silent=(not verbose))
+    start = time.monotonic_ns()
+    ready = Barrier(len(alive))
+    with metrics.MetricsBlock(len(alive)) as block:
+        for slot, node_id in enumerate(alive):
+            starter = node_id in starters
+            p = implementation(node_id, num, port, starter, silent=(not verbose), metrics=block.slot(slot), execution_mode=execution_mode,
+                               ready_barrier=ready, **node_options)
+            processes.append(p)
 
-        processes.append(p)
-        message_counts.append(count)
-        coordinator_ids.append(coordinator)
+        with START_LOCK:
+            for p in processes:
+                p.start()
 
-    for p in processes:
-        p.start()
+        for p in processes:
+            p.join()
+        
+        results = block.array()
+        startup, election, teardown = block.phases(start, time.monotonic_ns())
+        convergence = block.convergence()
+    
+    total_messages = int(results[:, metrics.SENT:metrics.SENT+metrics.NUM_TYPES].sum())
+    total_datagrams = int(results[:, metrics.DATAGRAMS].sum())
+    if total_datagrams != total_messages:
+        print(f"{total_messages} messages sent in {total_datagrams} datagrams")
+    teardowns = results[:, metrics.TEARDOWN]/1e6
+    print(f"Teardown: mean {teardowns.mean():.1f} ms, max {teardowns.max():.1f} ms")
+    drops = int(results[:, metrics.DROPS].sum())
+    if drops:
+        print(f"{drops} datagrams dropped")
+    kernel_drops = int(results[:, metrics.KERNEL_DROPS].sum())
+    if kernel_drops:
+        print(f"{kernel_drops} datagrams dropped by the kernel on full receive buffers")
+    retransmits = int(results[:, metrics.RETRANSMITS].sum())
+    if retransmits:
+        print(f"{retransmits} retransmits, {int(results[:, metrics.DUPLICATES].sum())} duplicates dropped, "
+              f"{int(results[:, metrics.UNACKED].sum())} messages never acked")
+    
+    coordinator_ids = results[:, metrics.COORDINATOR]
+    if not np.all(coordinator_ids == max(alive)):
+        print("No consensus or wrong coordinator elected")
+        print(f"Coordinators: {coordinator_ids.tolist()}")
+    
+    print(f"Startup {startup:.3f} s, election {election:.3f} s, teardown {teardown:.3f} s")
+    print(metrics.format_convergence(convergence))
+    return total_messages, startup, election, teardown, convergence
 
-    for p in processes:
-        p.join()
+def run_set_inline(variant:str, num:int, starters:list[int], alive:list[int], port:int=4000, verbose:bool=False, **node_options):
+    """`run_set` with the event-driven nodes from `async_bully.py`, all on one event loop in this process."""
+    if node_options.get("multicast_group") is not None:
+        raise ValueError("Multicast is not supported inline")
+    if node_options.get("trace_dir") is not None:
+        raise ValueError("Tracing is not supported inline")
+    # The inline nodes have UDP, or in-memory delivery for the queue transport
+    transport_name = node_options.get("transport") or "udp"
+    if transport_name not in ("udp", "queue"):
+        raise ValueError(f"The {transport_name} transport is not supported inline")
+    options = {key: value for key, value in node_options.items() if value is not None and key not in ("multicast_group", "transport")}
     
-    total_messages = sum(count.value for count in message_counts)
-    #print(f"Total messages sent: {total_messages}")
+    start = time.monotonic()
+    nodes = async_bully.run(variant, num, starters, alive, port=port if transport_name == "udp" else None, silent=(not verbose), **options)
+    startup, election, teardown = async_bully.phase_times(nodes, start, time.monotonic())
+    convergence = async_bully.convergence_times(nodes)
+    
+    total_messages = sum(node.message_count for node in nodes)
+    coordinator_ids = [node.coordinator_id for node in nodes]
+    if not all(max(alive) == coordinator_id for coordinator_id in coordinator_ids):
+        print("No consensus or wrong coordinator elected")
+        print(f"Coordinators: {coordinator_ids}")
     
-    if all(max(alive) == coordinator_id.value for coordinator_id in coordinator_ids):
-        pass
+    print(f"Startup {startup:.3f} s, election {election:.3f} s, teardown {teardown:.3f} s")
+    print(metrics.format_convergence(convergence))
+    return total_messages, startup, election, teardown, convergence
+
+def simulate_set(implementation: type[Standard|Improved], num:int, starters:list[int], alive:list[int], seed:int=0, latency:float=0.001, pacing:str="fixed:0.01", **node_options):
+    """
+    Same election as `run_set`, but on the simulator's virtual clock.
+    Returns the message count, the simulated time until every node was done and the convergence of the election.
+    """
+    if implementation == Standard:
+        print("Simulating standard bully")
+        variant = "standard"
+    elif implementation == Improved:
+        print("Simulating improved bully")
+        variant = "improved"
     else:
+        raise ValueError(f"Unknown implementation {implementation}")
+    
+    nodes = simulator.simulate(variant, num, starters, alive, latency=latency, seed=seed, pacing=pacing,
+                               wire_format=node_options.get("wire_format", "binary"),
+                               retransmit_timeout=node_options.get("retransmit_timeout"), retries=node_options.get("retries", 3))
+    
+    if not all(max(alive) == node.coordinator_id for node in nodes):
         print("No consensus or wrong coordinator elected")
-        print(f"Coordinators: {[v.value for v in coordinator_ids]}")
+        print(f"Coordinators: {[node.coordinator_id for node in nodes]}")
     
-    return total_messages
+    return sum(node.message_count for node in nodes), simulator.convergence_time(nodes), async_bully.convergence_times(nodes)
 
-def compare(num:int, starters:list[int], alive:list[int], port:int=4000, verbose:bool=False):
-    t0 = time.time()
-    msg_std = run_set(Standard, num, starters, alive, port, verbose)
-    t1 = time.time()
-    msg_imp = run_set(Improved, num, starters, alive, port, verbose)
-    t2 = time.time()
-    
-    return msg_std, msg_imp, t1-t0, t2-t1
+def compare(num:int, starters:list[int], alive:list[int], port:int=4000, verbose:bool=False, simulate:bool=False, seed:int=0, latency:float=0.001, **node_options):
+    if simulate:
+        msg_std, time_std, conv_std = simulate_set(Standard, num, starters, alive, seed, latency, **node_options)
+        msg_imp, time_imp, conv_imp = simulate_set(Improved, num, starters, alive, seed, latency, **node_options)
+        return msg_std, msg_imp, time_std, time_imp, conv_std, conv_imp
+    
+    # The run time is the election itself, without starting and stopping the nodes
+    msg_std, _, time_std, _, conv_std = run_set(Standard, num, starters, alive, port, verbose, **node_options)
+    msg_imp, _, time_imp, _, conv_imp = run_set(Improved, num, starters, alive, port, verbose, **node_options)
+    
+    return msg_std, msg_imp, time_std, time_imp, conv_std, conv_imp
 
-def batch_compare(port, file:str="batch.json", texout="results.tex", plotout="results.png"):
+def parallel_compare(batch:list[dict], port:int=4000, jobs:int=2, max_procs:int=None, verbose:bool=False, simulate:bool=False, seed:int=0, latency:float=0.001, **node_options):
+    """
+    Run the standard and the improved election of every scenario in `batch` as separate jobs, up to
+    `jobs` at a time. Each of the `jobs` slots has its own port range, so concurrent elections never
+    see each other's messages, and a job only starts while the total number of node processes stays
+    within `max_procs` (a scenario bigger than that still runs, on its own).
+    With `simulate` the jobs run in a process pool instead, as they are CPU bound.
+    Returns the same `(msg_std, msg_imp, time_std, time_imp, conv_std, conv_imp)` rows as `compare`, in batch order.
+    """
+    work = [(i, implementation, run) for i, run in enumerate(batch) for implementation in (Standard, Improved)]
+    results = {}
+    
+    if simulate:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {(i, implementation): pool.submit(simulate_set, implementation, run["num"], run["starters"], run["alive"], seed, latency, **node_options)
+                       for i, implementation, run in work}
+            results = {key: future.result() for key, future in futures.items()}
+    else:
+        run_jobs(work, results, port, jobs, max_procs, verbose, **node_options)
+    
+    return [(results[i, Standard][0], results[i, Improved][0], results[i, Standard][1], results[i, Improved][1],
+             results[i, Standard][2], results[i, Improved][2])
+            for i in range(len(batch))]
+
+def run_jobs(work:list[tuple], results:dict, port:int, jobs:int, max_procs:int, verbose:bool=False, **node_options):
+    """Scheduler behind `parallel_compare` for real processes, fills `results` with `(msgs, election time, convergence)` per job."""
+    if max_procs is None:
+        max_procs = 64*os.cpu_count()
+    stride = max(run["num"] for _, _, run in work) + 1 # node ports plus the multicast port
+    if port + jobs*stride > 65536:
+        raise ValueError(f"{jobs} port ranges of {stride} ports starting at {port} do not fit")
+    
+    free_ports = [port + k*stride for k in range(jobs)]
+    running = [0] # node processes of the jobs in flight
+    errors = []
+    cond = Condition()
+    
+    def job(key, run, job_port):
+        try:
+            msgs, _, election, _, convergence = run_set(key[1], run["num"], run["starters"], run["alive"], job_port, verbose, **test_options(node_options, key[0]))
+            results[key] = msgs, election, convergence
+        except Exception as e:
+            errors.append(e)
+        finally:
+            with cond:
+                free_ports.append(job_port)
+                running[0] -= len(run["alive"])
+                cond.notify_all()
+    
+    pending = deque(work)
+    with cond:
+        while pending:
+            i, implementation, run = pending[0]
+            procs = len(run["alive"])
+            cond.wait_for(lambda: free_ports and (running[0] == 0 or running[0] + procs <= max_procs))
+            pending.popleft()
+            running[0] += procs
+            print(f"Test {i}")
+            Thread(target=job, args=((i, implementation), run, free_ports.pop(0))).start()
+        cond.wait_for(lambda: len(free_ports) == jobs)
+    
+    if errors:
+        raise errors[0]
+
+def test_options(node_options:dict, i:int) -> dict:
+    """The node options of test `i` of a batch, every test gets its own subdirectory for the traces."""
+    if node_options.get("trace_dir") is None:
+        return node_options
+    return {**node_options, "trace_dir": os.path.join(node_options["trace_dir"], f"test{i}")}
+
+def batch_compare(port, file:str="batch.json", texout="results.tex", plotout="results.png", simulate:bool=False, seed:int=0, latency:float=0.001, jobs:int=1, max_procs:int=None, **node_options):
+    # Only needed for the report, so the benchmark workers that import this module stay small
+    import pandas as pd
+    from matplotlib import pyplot as plt
+    
     with open(file, "r") as f:
         batch = json.load(f)
     
+    if jobs > 1:
+        rows = parallel_compare(batch, port, jobs, max_procs, simulate=simulate, seed=seed, latency=latency, **node_options)
+    else:
+        rows = []
+        for i, run in enumerate(batch):
+            print(f"Test {i}")
+            rows.append(compare(port=port, simulate=simulate, seed=seed, latency=latency, **run, **test_options(node_options, i)))
+    
     df = pd.DataFrame(columns=["Test #", "Standard message count", "Standard run time", "Improved message count", "Improved run time"])
     
     smc = []
@@ -69,17 +243,20 @@ def batch_compare(port, file:str="batch.json", texout="results.tex", plotout="re
     st = []
     it = []
     
-    for i, run in enumerate(batch):
-        print(f"Test {i}")
-        
-        msg_std, msg_imp, time_std, time_imp = compare(port=port, **run)
+    # Convergence per test and variant, in seconds from the first election started
+    convergence = pd.DataFrame(columns=["Test #", "Variant", "First announce", "Agreement", "Adoption p50", "Adoption p99"])
+    
+    for i, (msg_std, msg_imp, time_std, time_imp, conv_std, conv_imp) in enumerate(rows):
         df.loc[len(df.index)] = [i, msg_std, time_std, msg_imp, time_imp]
+        convergence.loc[len(convergence.index)] = [i, "standard", *conv_std]
+        convergence.loc[len(convergence.index)] = [i, "improved", *conv_imp]
         smc.append(msg_std)
         imc.append(msg_imp)
         st.append(time_std)
         it.append(time_imp)
     
     print(df)
+    print(convergence)
     df.to_latex(texout, index=False)
     
     aublue = "#003d73"
@@ -108,15 +285,36 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--verbose", action="store_true")
     parser.add_argument("-p", "--base_port", type=int, default=4000)
+    parser.add_argument("--pacing", type=str, default="fixed:0.01", help="none, fixed:DELAY, bucket:RATE[:BURST] or dest:RATE")
+    parser.add_argument("--wire-format", choices=wire.FORMATS, default="binary")
+    parser.add_argument("--execution-mode", choices=("process", "thread", "inline"), default="process",
+                        help="a process or a thread per node, or all nodes on one event loop (inline)")
+    parser.add_argument("-m", "--multicast", nargs="?", const=multicast.DEFAULT_GROUP, default=None, metavar="GROUP",
+                        help=f"send elections and announcements to a multicast group (default {multicast.DEFAULT_GROUP})")
+    parser.add_argument("--trace", metavar="DIR", default=None, help="write an event trace of every node to DIR/testN, see tracing.py")
+    parser.add_argument("--transport", choices=transport.TRANSPORTS, default="udp", help="the queue transport needs --execution-mode thread or inline")
+    parser.add_argument("--rcvbuf", type=int, default=None, metavar="BYTES", help="receive buffer of the node sockets, udp and unix only")
+    parser.add_argument("--retransmit", type=float, default=None, metavar="TIMEOUT", help="ack the election messages and retransmit them, see reliable.py")
+    parser.add_argument("--retries", type=int, default=3)
     
     batch_group = parser.add_argument_group("Batch")
     batch_group.add_argument("-f", "--file", type=str, default="batch.json")
     batch_group.add_argument("-t", "--texout", type=str, default="results.tex")
     batch_group.add_argument("-P", "--plotout", type=str, default="results.png")
+    batch_group.add_argument("-j", "--jobs", type=int, default=1, help="number of elections run at the same time, each on its own port range")
+    batch_group.add_argument("--max-procs", type=int, default=None, help="limit on the node processes of all concurrent elections, defaults to 64 per core")
+    
+    sim_group = parser.add_argument_group("Simulation")
+    sim_group.add_argument("-s", "--simulate", action="store_true", help="run on the simulator's virtual clock instead of real processes")
+    sim_group.add_argument("--seed", type=int, default=0)
+    sim_group.add_argument("--latency", type=float, default=0.001, help="one-way latency of the simulated network")
     
     args = parser.parse_args()
     
-    batch_compare(args.base_port, args.file, args.texout, args.plotout)
+    batch_compare(args.base_port, args.file, args.texout, args.plotout, args.simulate, args.seed, args.latency, args.jobs, args.max_procs,
+                  pacing=args.pacing, wire_format=args.wire_format, multicast_group=args.multicast, execution_mode=args.execution_mode, trace_dir=args.trace,
+                  transport=args.transport, rcvbuf=args.rcvbuf,
+                  retransmit_timeout=args.retransmit, retries=args.retries)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Self-pipe for waking a listener that is blocked in `select`.
+
+The listener registers the pipe next to its sockets. Any thread that changes the node's state calls
+`wake()`, so the listener rechecks its exit condition right away instead of after the next message.
+"""
+import os
+from threading import Lock
+
+
+class ControlPipe:
+    def __init__(self) -> None:
+        self.r, self.w = os.pipe()
+        os.set_blocking(self.r, False)
+        os.set_blocking(self.w, False)
+        self.lock = Lock()
+        self.closed = False
+
+    def fileno(self) -> int:
+        return self.r
+
+    def wake(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                os.write(self.w, b"\0")
+            except BlockingIOError: # The pipe is full, so a wakeup is pending anyway
+                pass
+
+    def drain(self) -> None:
+        try:
+            while os.read(self.r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            os.close(self.r)
+            os.close(self.w)
+
+    def __enter__(self) -> "ControlPipe":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,15 +1,16 @@
 import argparse
-import socket
+from transport import make_transport
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-n', '--num_nodes', type=int, required=True)
     parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('-t', '--transport', choices=("udp", "unix", "shm"), default="udp")
     
     args = parser.parse_args()
     
+    transport = make_transport(args.transport, args.port)
     for i in range(args.num_nodes):
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.sendto(b'exit', ("127.0.0.1", args.port + i))
+        transport.send_to(i, b'exit')
     
     
\ No newline at end of file
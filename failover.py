@@ -0,0 +1,50 @@
+"""
+Failover of nodes running in daemon mode (with a heartbeat interval).
+
+`measure_failover` waits until all nodes agree on the highest alive node, stops that leader with
+an exit message, and waits until the others agree on the next one. It returns how long after the
+stop the first node noticed the missing heartbeats and the last node had adopted the new leader.
+"""
+from time import monotonic, monotonic_ns, sleep
+from metrics import MetricsBlock, MISSED_HEARTBEAT, ELECTION_END
+from transport import make_transport
+
+POLL = .01
+
+
+def wait_for_coordinator(block: MetricsBlock, slots: list[int], coordinator: int, timeout: float) -> bool:
+    """Wait until every node in `slots` has `coordinator` as its coordinator."""
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        coordinators = block.coordinators()
+        if all(coordinators[slot] == coordinator for slot in slots):
+            return True
+        sleep(POLL)
+    return False
+
+
+def stop_nodes(port: int, node_ids: list[int], transport="udp") -> None:
+    transport = make_transport(transport, port)
+    for node_id in node_ids:
+        transport.send_to(node_id, b"exit")
+
+
+def measure_failover(block: MetricsBlock, alive: list[int], port: int, timeout: float = 30, transport="udp") -> tuple[float | None, float | None]:
+    """
+    Seconds from stopping the leader until the first node missed its heartbeats, and until every
+    other node had adopted the new leader. None for what did not happen within `timeout`. The
+    leader is stopped, the other nodes keep running.
+    """
+    if len(alive) < 2 or not wait_for_coordinator(block, list(range(len(alive))), max(alive), timeout):
+        return None, None
+
+    survivors = [slot for slot, node_id in enumerate(alive) if node_id != max(alive)]
+    stopped = monotonic_ns()
+    stop_nodes(port, [max(alive)], transport)
+    agreed = wait_for_coordinator(block, survivors, max(alive[slot] for slot in survivors), timeout)
+
+    results = block.array()
+    missed = [t for t in results[survivors, MISSED_HEARTBEAT] if t > stopped]
+    detection = (min(missed) - stopped)/1e9 if missed else None
+    failover = (results[survivors, ELECTION_END].max() - stopped)/1e9 if agreed else None
+    return detection, failover
@@ -0,0 +1,197 @@
+"""
+Fuzz runner: thousands of random elections, each checked for every alive node ending up with
+`max(alive)` as its coordinator.
+
+    python fuzz.py -n 5000 --max-nodes 40 -o failures.json
+
+Scenarios come from a seed, `scenario(seed)` always gives the same nodes, so a failure is reproduced
+with `--seed SEED -n 1`. Failing scenarios are shrunk to a minimal one: alive nodes and starters are
+dropped and the cluster made smaller for as long as the election still goes wrong. The minimal
+scenarios are written in the `batch.json` format, to rerun them with `simulator.py -f` or `compare.py -f`.
+
+The default backend is the simulator, which needs no sockets or processes and runs a few hundred
+elections per second. `inline` runs the async nodes over in-memory delivery in real time, `thread`
+and `process` the real nodes over UDP.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Barrier
+from time import monotonic
+from metrics import MetricsBlock
+from failover import stop_nodes
+import argparse
+import random
+import json
+import sys
+import simulator
+import async_bully
+import standard_bully
+import improved_bully
+
+BACKENDS = ("simulate", "inline", "thread", "process")
+VARIANTS = ("standard", "improved")
+
+
+def scenario(seed:int, max_nodes:int=50, max_starters:int=None) -> dict:
+    """A random scenario in the `batch.json` format, the same for the same seed."""
+    rng = random.Random(seed)
+    num = rng.randint(1, max_nodes)
+    alive = sorted(rng.sample(range(num), rng.randint(1, num)))
+    num_starters = rng.randint(1, min(len(alive), max_starters or len(alive)))
+    starters = sorted(rng.sample(alive, num_starters))
+    return {"num": num, "alive": alive, "starters": starters}
+
+
+def elect(variant:str, run:dict, backend:str="simulate", seed:int=0, port:int=4000, timeout:float=30, **options) -> list[int | None]:
+    """The coordinator every alive node ended up with, None for a node that never finished."""
+    if backend == "simulate":
+        nodes = simulator.simulate(variant, run["num"], run["starters"], run["alive"], seed=seed, **options)
+        return [node.coordinator_id if node.done.done() else None for node in nodes]
+    if backend == "inline":
+        nodes = async_bully.run(variant, run["num"], run["starters"], run["alive"], silent=True, timeout=timeout, **options)
+        return [node.coordinator_id if node.done.done() else None for node in nodes]
+    return elect_threaded(variant, run, backend, port, timeout, **options)
+
+
+def elect_threaded(variant:str, run:dict, mode:str, port:int, timeout:float, **options) -> list[int | None]:
+    module = standard_bully if variant == "standard" else improved_bully
+    alive = run["alive"]
+    with MetricsBlock(len(alive)) as block:
+        ready = Barrier(len(alive))
+        nodes = [module.Node(node_id, run["num"], port, node_id in run["starters"], silent=True, metrics=block.slot(slot),
+                             execution_mode=mode, ready_barrier=ready, **options)
+                 for slot, node_id in enumerate(alive)]
+        for node in nodes:
+            node.start()
+        deadline = monotonic() + timeout
+        for node in nodes:
+            node.join(max(deadline - monotonic(), 0))
+
+        finished = [teardown > 0 for teardown in block.teardowns()]
+        if not all(finished):
+            # Stop the nodes that are still waiting, so the next election gets the ports
+            stop_nodes(port, alive, options.get("transport", "udp"))
+            for node in nodes:
+                node.join()
+        coordinators = block.coordinators()
+    return [coordinator if done else None for coordinator, done in zip(coordinators, finished)]
+
+
+def correct(run:dict, coordinators:list[int | None]) -> bool:
+    return all(coordinator == max(run["alive"]) for coordinator in coordinators)
+
+
+def shrink(run:dict, fails) -> dict:
+    """
+    Greedily make a failing scenario smaller while `fails(run)` still holds: drop alive nodes, drop
+    starters, cut the dead nodes above the highest alive one and renumber the alive nodes 0, 1, ...
+    """
+    def smaller(run):
+        for node_id in run["alive"]:
+            starters = [s for s in run["starters"] if s != node_id]
+            if len(run["alive"]) > 1 and starters:
+                yield {"num": run["num"], "alive": [a for a in run["alive"] if a != node_id], "starters": starters}
+        for node_id in run["starters"]:
+            if len(run["starters"]) > 1:
+                yield {**run, "starters": [s for s in run["starters"] if s != node_id]}
+        if run["num"] > max(run["alive"]) + 1:
+            yield {**run, "num": max(run["alive"]) + 1}
+        if run["alive"] != list(range(len(run["alive"]))):
+            ids = {node_id: i for i, node_id in enumerate(run["alive"])}
+            yield {"num": len(ids), "alive": list(ids.values()), "starters": [ids[s] for s in run["starters"]]}
+
+    changed = True
+    while changed:
+        changed = False
+        for candidate in smaller(run):
+            if fails(candidate):
+                run = candidate
+                changed = True
+                break
+    return run
+
+
+def check_seed(variant:str, seed:int, max_nodes:int, max_starters:int, backend:str, port:int, timeout:float, **options) -> tuple[dict, list] | None:
+    """The scenario of `seed` and its coordinators if the election went wrong, None if it was fine."""
+    run = scenario(seed, max_nodes, max_starters)
+    coordinators = elect(variant, run, backend, seed, port, timeout, **options)
+    return None if correct(run, coordinators) else (run, coordinators)
+
+
+def fuzz(runs:int, variants=VARIANTS, backend:str="simulate", seed:int=0, max_nodes:int=50, max_starters:int=None,
+         shrink_failures:bool=True, jobs:int=1, port:int=4000, timeout:float=30, **options) -> list[dict]:
+    """
+    Run `runs` random scenarios with every variant, and return the failures with the seed, the
+    scenario, the coordinators the nodes ended up with and the shrunk scenario.
+    With `jobs` > 1 the in-memory backends run in a process pool.
+    """
+    if jobs > 1 and backend not in ("simulate", "inline"):
+        raise ValueError("Only the in-memory backends can run in parallel")
+
+    work = [(variant, s) for s in range(seed, seed + runs) for variant in variants]
+    check = lambda variant, s: check_seed(variant, s, max_nodes, max_starters, backend, port, timeout, **options)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(check_seed, variant, s, max_nodes, max_starters, backend, port, timeout, **options) for variant, s in work]
+            results = [future.result() for future in futures]
+    else:
+        results = [check(variant, s) for variant, s in work]
+
+    failures = []
+    for (variant, s), result in zip(work, results):
+        if result is None:
+            continue
+        run, coordinators = result
+        print(f"{variant} seed {s} failed: {run}, coordinators {coordinators}")
+        failure = {"variant": variant, "seed": s, "scenario": run, "coordinators": coordinators}
+        if shrink_failures:
+            fails = lambda candidate: not correct(candidate, elect(variant, candidate, backend, s, port, timeout, **options))
+            failure["shrunk"] = shrink(run, fails)
+            print(f"  shrunk to {failure['shrunk']}")
+        failures.append(failure)
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check random elections for electing max(alive), and shrink the ones that don't")
+    parser.add_argument("-n", "--runs", type=int, default=1000, help="number of random scenarios, each run with every variant")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first scenario, the others follow")
+    parser.add_argument("--variants", choices=VARIANTS, nargs="+", default=list(VARIANTS))
+    parser.add_argument("-b", "--backend", choices=BACKENDS, default="simulate")
+    parser.add_argument("--max-nodes", type=int, default=50)
+    parser.add_argument("--max-starters", type=int, default=None)
+    parser.add_argument("--no-shrink", action="store_true")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="parallel workers, simulate and inline only")
+    parser.add_argument("-p", "--base_port", type=int, default=4000)
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before the nodes of a real election are given up on")
+    parser.add_argument("--pacing", type=str, default=None, help="none, fixed:DELAY, bucket:RATE[:BURST] or dest:RATE")
+    parser.add_argument("--retransmit", type=float, default=None, metavar="TIMEOUT", help="ack the election messages and retransmit them, see reliable.py")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("-o", "--out", type=str, default=None, help="write the shrunk failing scenarios here, in the batch.json format")
+
+    sim_group = parser.add_argument_group("Simulation")
+    sim_group.add_argument("--latency", type=float, default=0.001)
+    sim_group.add_argument("--jitter", type=float, default=0)
+    sim_group.add_argument("--loss", type=float, default=0)
+
+    args = parser.parse_args()
+
+    options = {"pacing": args.pacing} if args.pacing is not None else {}
+    if args.retransmit is not None:
+        options.update(retransmit_timeout=args.retransmit, retries=args.retries)
+    if args.backend == "simulate":
+        options.update(latency=args.latency, jitter=args.jitter, loss=args.loss)
+
+    start = monotonic()
+    failures = fuzz(args.runs, args.variants, args.backend, args.seed, args.max_nodes, args.max_starters, not args.no_shrink,
+                    args.jobs, args.base_port, args.timeout, **options)
+    elapsed = monotonic() - start
+    elections = args.runs*len(args.variants)
+    print(f"{elections} elections in {elapsed:.1f} s ({elections/elapsed:.0f}/s), {len(failures)} failed")
+    for variant in args.variants:
+        print(f"{variant}: {sum(failure['variant'] == variant for failure in failures)} failed")
+
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump([failure.get("shrunk", failure["scenario"]) for failure in failures], f, indent=4)
+    if failures:
+        sys.exit(1)
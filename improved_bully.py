@@ -1,94 +1,84 @@
+"""
+The improved bully: a node that notices the coordinator is gone asks the higher nodes one at a time
+from the top (or `--probe-window` at a time) whether they are alive, and the highest one that answers
+announces itself. The node machinery the variants share is `node.Node`, the command line is `cli.py`.
+
+With `--execution-mode inline` the nodes of `async_bully.py` run instead. They can't use the membership
+cache, heartbeats (daemon mode), tracing, multicast, the unix and shm transports or `--rcvbuf`.
+"""
 from email import parser
-from multiprocessing import Process, Value
-from ctypes import c_uint
-from multiprocessing.sharedctypes import SynchronizedBase
-from threading import Thread, Timer
-from time import sleep, time
-import socket
-import random
-from argparse import ArgumentParser
-
-class Node(Process):
-    def __init__(self, 
-                 id: int, 
-                 num_nodes: int, 
-                 base_port: int, 
-                 starter: bool, 
-                 coordinator_id: SynchronizedBase,
-                 message_count: SynchronizedBase = None,
-                 silent:bool = False) -> None:
-        self.node_id = id
-        self.num_nodes = num_nodes
-        self.base_port = base_port
-        self.is_starter = starter
-        self.port = base_port + id
-        self.message_count = message_count
-        self.silent = silent
-        
-        self.coordinator_id = coordinator_id
-        self.coordinator_id.value = id
-        self.timer = None
-        
-        self.running_election = False
-        self.has_announced = False
-        
+from threading import Event
+import wire
+import tracing
+import node
+import cli
+
+class Node(node.Node):
+    VARIANT = "improved"
+    # The messages that are acked and retransmitted with a retransmit timeout
+    RELIABLE = (wire.ARE_YOU_ALIVE, wire.PROBE, wire.ALIVE, wire.COORDINATOR)
+    # Times the highest node that answered a windowed probe is asked to announce before it counts as dead
+    ANNOUNCE_RETRIES = 2
+
+    def __init__(self, *args,
+                 probe_window: int = 1,
+                 probe_timeout: float = None,
+                 **options) -> None:
+        """The options shared by both variants are the ones of `node.Node`."""
+        super().__init__(*args, **options)
         self.delay = 0.01
+        # A node announces itself at most once per term, later probes of that term are answered one by one
+        self.announced_term = -1
         
-        self.last_announce_time = 0
-
-        super().__init__()
-
-    def run(self):
-        self.starter_thread = Thread(target=self.starter)
-        self.starter_thread.start()
-
-        self.listen_thread = Thread(target=self.listener)
-        self.listen_thread.start()
-
-        self.starter_thread.join()
-        self.listen_thread.join()
-        
-        self.print2(f"Node {self.node_id} is done")
-
-    def starter(self) -> None: 
-        sleep(.1)
-        if self.is_starter:
-            self.check_alive()
-
-
-    def listener(self) -> None:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.bind(("127.0.0.1", self.port))
-            sock.settimeout(1)
-
-            while self.coordinator_id.value == self.node_id and not self.has_announced:
-                try:
-                    data, addr = sock.recvfrom(1024)
-                    match data.decode("UTF8").split(' '):
-                        case ["are_you_alive", id]:
-                            self.msg_received_rua(int(id)) # rua = are_you_alive
-                        case ["coordinator", id]:
-                            self.msg_received_coordinator(int(id))
-                        case ["exit"]:
-                            self.print2(f"Node {self.node_id} received exit message")
-                            return
-
-                    self.print2(f"{self.node_id} received {data}")
-                except socket.timeout:
-                    #self.print2(f"{self.node_id} timed out") 
-                    pass
-            
-            if self.message_count.value > self.num_nodes**2:
-                self.print2(f"Node {self.node_id} received too many messages. Exiting.")
-                return
+        self.probe_window = probe_window
+        self.probe_timeout = probe_timeout if probe_timeout is not None else self.delay*(2*self.node_id+self.num_nodes)
+        self.probe_responses = set()
+        self.probe_top = None
+        self.probe_event = Event()
+
+    def start_election(self):
+        self.check_alive()
+
+    def handle_message(self, kind:int, sender_id:int):
+        match kind:
+            case wire.ARE_YOU_ALIVE:
+                self.msg_received_rua(sender_id) # rua = are_you_alive
+            case wire.COORDINATOR:
+                self.msg_received_coordinator(sender_id)
+            case wire.PROBE:
+                self.msg_received_probe(sender_id)
+            case wire.ALIVE:
+                self.msg_received_alive(sender_id)
+    
+    def check_term(self, message:tuple) -> bool:
+        """
+        Adopt a newer term, and drop messages of an older one. Stale probes are still answered, the
+        answer carries the current term and brings the prober up to date. A stale announcement of a
+        lower node is answered by the leader with its own.
+        """
+        kind, sender_id, term, _ = message
+        if kind == wire.EXIT or term == self.term:
+            return True
+        if term > self.term:
+            self.set_term(term)
+            return True
+        if not self.metrics is None:
+            self.metrics.count_stale()
+        if kind == wire.COORDINATOR and sender_id < self.node_id and self.is_leader():
+            self.send_message(self.encode(wire.COORDINATOR), sender_id)
+        return kind in (wire.ARE_YOU_ALIVE, wire.PROBE)
     
     def msg_received_rua(self, sender_id):
         """
         Code runs if the sender has a lower ID than the receiver
         Then the receiving node will send out a "coordinator" message.
         """
-        if sender_id < self.node_id: 
-            self.announce_coordinator()
+        if sender_id < self.node_id:
+            if self.announced_term == self.term:
+                # Already announced in this term, only the node asking missed it
+                self.send_message(self.encode(wire.COORDINATOR), sender_id)
+            else:
+                self.announce_coordinator()
     
     def msg_received_coordinator(self, sender_id):
         """
@@ -97,10 +87,31 @@ class Node(Process):
         new coordinator is the sender.
         """
         if sender_id < self.node_id:
-            self.check_alive()
+            if not self.running_election:
+                # The next term, the other nodes that saw the same announcement end up in it too
+                self.set_term(self.term + 1)
+                # Probe on a separate thread, so the listener keeps receiving the answers
+                self.spawn(self.check_alive)
         else:
-            self.coordinator_id.value = sender_id
+            self.set_coordinator(sender_id)
+            if self.running_election and not self.trace is None:
+                self.trace.record(tracing.STATE, tracing.ELECTION_STOPPED)
             self.running_election = False
+            self.probe_event.set()
+    
+    def msg_received_probe(self, sender_id):
+        """
+        A windowed probe only asks whether this node is alive, the prober decides who gets to announce.
+        """
+        if sender_id < self.node_id:
+            self.send_message(self.encode(wire.ALIVE), sender_id)
+    
+    def msg_received_alive(self, sender_id):
+        self.probe_responses.add(sender_id)
+        if sender_id == self.probe_top: # Nobody in the window can beat this one, stop waiting
+            if not self.reliable is None:
+                self.reliable.cancel(wire.PROBE)
+            self.probe_event.set()
 
     def check_alive(self):
         """
@@ -108,108 +119,112 @@ class Node(Process):
         When an election stops running, return void.
         """
         self.running_election = True
+        self.election_term = self.term
+        if not self.metrics is None:
+            self.metrics.election_started()
+        if not self.trace is None:
+            self.trace.record(tracing.STATE, tracing.ELECTION_STARTED)
+        
+        bigger_nodes = list(self.live_peers(range(self.node_id, self.num_nodes)))
+        if self.probe_window > 1:
+            self.check_alive_windowed(bigger_nodes[::-1])
+            return
         
-        bigger_nodes = list(range(self.node_id, self.num_nodes))
         for peer_id in bigger_nodes[::-1]: # iterate backwards
-            self.send_message(bytes(f"are_you_alive {self.node_id}", encoding="UTF8"), peer_id)
-            sleep(self.delay*(2*self.node_id+self.num_nodes))
+            self.probe_event.clear()
+            self.send_message(self.encode(wire.ARE_YOU_ALIVE), peer_id)
+            answered = self.wait_for_probe() # Cut short by a coordinator message
             if not self.running_election: # We have received a coordinator message
                 return
+            if not answered and not self.membership is None:
+                self.membership.suspect([peer_id])
         
         # When no response is received from any higher nodes
         self.running_election = False
         self.announce_coordinator()
+    
+    def wait_for_probe(self) -> bool:
+        """Wait for `probe_event` at most `probe_timeout`, returns False if the wait timed out."""
+        if not self.trace is None:
+            self.trace.record(tracing.TIMER_ARMED, tracing.PROBE_TIMER, int(self.probe_timeout*1e6))
+        answered = self.probe_event.wait(self.probe_timeout)
+        while not answered and self.running_election and not self.reliable is None and self.reliable.waiting((wire.ARE_YOU_ALIVE, wire.PROBE)):
+            # A probe is still being retransmitted, its receiver may well be alive
+            answered = self.probe_event.wait(self.reliable.timeout)
+        if not answered and not self.trace is None:
+            self.trace.record(tracing.TIMER_FIRED, tracing.PROBE_TIMER)
+        return answered
+    
+    def check_alive_windowed(self, candidates:list[int]):
+        """
+        Probe `probe_window` nodes at a time, from the top down. Every window gets one deadline, and
+        the highest node that answered is asked to announce itself, so the highest alive node still wins.
+        If it doesn't announce after `ANNOUNCE_RETRIES` asks, it died since it answered: it is suspected
+        and the scan starts over from the top without it. The scan never goes below a node known to be alive.
+        """
+        start = 0
+        while start < len(candidates):
+            window = candidates[start:start+self.probe_window]
+            self.probe_responses.clear()
+            self.probe_event.clear()
+            self.probe_top = window[0]
+            
+            for peer_id in window:
+                self.send_message(self.encode(wire.PROBE), peer_id)
+            answered = self.wait_for_probe()
+            if not self.running_election:
+                return
+            if not answered and not self.membership is None:
+                self.membership.suspect([peer_id for peer_id in window if peer_id not in self.probe_responses])
+            
+            if not self.probe_responses:
+                start += self.probe_window
+                continue
+            
+            top = max(self.probe_responses)
+            self.probe_top = None # Only a coordinator message ends the wait now
+            for _ in range(self.ANNOUNCE_RETRIES):
+                self.probe_event.clear()
+                self.send_message(self.encode(wire.ARE_YOU_ALIVE), top)
+                self.wait_for_probe()
+                if not self.running_election:
+                    return
+            if not self.membership is None:
+                self.membership.suspect([top])
+            candidates = [peer_id for peer_id in candidates if peer_id != top]
+            start = 0
+        
+        self.running_election = False
+        self.announce_coordinator()
 
 
     def announce_coordinator(self):
-        if (self.last_announce_time + 1) > time():
+        if self.announced_term == self.term:
             return
-        self.last_announce_time = time()
+        self.announced_term = self.term
         
-        self.print2(f"Announcing coordinator {self.node_id} delta_t: {time() - self.last_announce_time}")
-        for peer_id in range(self.num_nodes):
-            self.send_message(bytes(f"coordinator {self.node_id}", encoding="UTF8"), peer_id)
+        self.print2(f"Announcing coordinator {self.node_id} in term {self.term}")
+        if not self.metrics is None:
+            self.metrics.announced()
+        self.broadcast(self.encode(wire.COORDINATOR), self.live_peers(range(self.num_nodes)))
+        self.set_coordinator(self.node_id)
         self.has_announced = True
-    
-    def send_message(self, msg:bytes, receiver_id):
+        self.mark_done()
+        self.start_heartbeats()
+
+    def send_message(self, msg:bytes, receiver_id, keep_going=None, sent_at:dict=None) -> bool:
         self.print2(self.node_id, "is sending", msg, "to", receiver_id)
-        sleep(self.delay)
-        port = self.base_port + receiver_id
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.sendto(msg, ("127.0.0.1", port))
-            if not self.message_count is None:
-                self.message_count.value += 1
+        return super().send_message(msg, receiver_id, keep_going, sent_at)
     
-    def print2(self, msg, *args, **kwargs):
-        if not self.silent:
-            print(msg, *args, **kwargs)
+    def mark_done(self):
+        """The node's outcome is settled: stop probing too."""
+        self.running_election = False
+        self.probe_event.set()
+        super().mark_done()
 
 if __name__ == "__main__":
-    parser = ArgumentParser()
-    parser.add_argument("-n", "--num_nodes", type=int, default=5)
-    starter = parser.add_mutually_exclusive_group(required=True)
-    starter.add_argument("-s", "--starters", type=int, nargs="+")
-    starter.add_argument("-S", '--num-starters', type=int)
-    alive = parser.add_mutually_exclusive_group(required=True)
-    alive.add_argument("-a", "--alive", type=int, nargs="+")
-    alive.add_argument("-A", '--num-alive', type=int)
-    parser.add_argument("-p", "--base_port", type=int, default=5000)
-    
-    args = parser.parse_args()
-    
-    num_proc = args.num_nodes
-    if args.num_alive:
-        num_alive = args.num_alive
-        alive_nodes = random.sample(range(num_proc), num_alive)
-        alive_nodes = sorted(alive_nodes)
-    else:
-        alive_nodes = args.alive
-        num_alive = len(alive_nodes)
-        
-    if args.num_starters:
-        num_starters = args.num_starters
-        starter_nodes = random.sample(alive_nodes, num_starters)
-        starter_nodes = sorted(starter_nodes)
-    else:
-        starter_nodes = args.starters
-        num_starters = len(starter_nodes)
-    
-    
-    print(f"{num_proc = }")
-    print(f"{alive_nodes = }")
-    print(f"{starter_nodes = }")
-    
-
-    processes = []
-    message_counts = []
-    coordinator_ids = []
-    for node_id in alive_nodes:
-        starter = node_id in starter_nodes
-        count = Value(c_uint)
-        coordinator = Value(c_uint)
-        p = Node(node_id, num_proc, args.base_port, starter, coordinator, count)
-
-        processes.append(p)
-        message_counts.append(count)
-        coordinator_ids.append(coordinator)
-
-    for p in processes:
-        p.start()
-
-    for p in processes:
-        p.join()
-    
-    print("")
-    for node, count in zip(alive_nodes, message_counts):
-        print(f"{node} sent {count.value} messages")
-    print(f"Total messages sent: {sum(count.value for count in message_counts)}")
-    print("")
-    if all(coordinator_ids[0].value == coordinator_id.value for coordinator_id in coordinator_ids):
-        print(f"Coordinator: {coordinator_ids[0].value}")
-    else:
-        print("No coordinator elected")
-        print(f"Coordinators: {[v.value for v in coordinator_ids]}")
-    print("")
-    print(f"{num_proc = }")
-    print(f"{alive_nodes = }")
-    print(f"{starter_nodes = }")
\ No newline at end of file
+    parser = cli.make_parser("send announcements to a multicast group")
+    parser.add_argument("-k", "--probe-window", type=int, default=1, help="number of higher nodes probed at once")
+    parser.add_argument("--probe-timeout", type=float, default=None, help="deadline of each probe or window, defaults to .01*(2*ID+NUM_NODES)")
+    args = cli.parse_args(parser)
+    cli.run("improved", Node, args, probe_window=args.probe_window, probe_timeout=args.probe_timeout)
@@ -0,0 +1,66 @@
+"""
+What a node believes about which of the other nodes are alive.
+
+A node learns from the traffic it gets: whoever sends it a message is alive. It suspects a node once
+that node did not answer within a timeout (an election message nobody answered with OK, a probe
+nobody answered, a leader whose heartbeats stopped). The leader `expect`s an answer to its heartbeats
+as well, so the followers that died are suspected too, and not only the higher nodes an election asks.
+Nodes it has never heard of count as alive, so a fresh cache changes nothing and only nodes that
+actually failed to answer are skipped.
+
+Suspicions expire after `ttl` seconds. `sweep` drops the expired ones, after which the node sends to
+those peers again, so a node that comes back is found without having to speak first.
+"""
+from threading import Lock
+from time import monotonic
+
+
+class Membership:
+    def __init__(self, node_id: int, ttl: float) -> None:
+        self.node_id = node_id
+        self.ttl = ttl
+        self.suspected = {}
+        self.expected = {}
+        self.lock = Lock()
+
+    def seen(self, peer_id: int) -> None:
+        with self.lock:
+            self.suspected.pop(peer_id, None)
+            self.expected.pop(peer_id, None)
+
+    def suspect(self, peer_ids) -> None:
+        now = monotonic()
+        with self.lock:
+            for peer_id in peer_ids:
+                if peer_id != self.node_id:
+                    self.suspected[peer_id] = now
+
+    def expect(self, peer_ids, timeout: float) -> None:
+        """The peers owe an answer within `timeout`, the ones still silent by then are suspected."""
+        deadline = monotonic() + timeout
+        with self.lock:
+            for peer_id in peer_ids:
+                self.expected.setdefault(peer_id, deadline)
+
+    def alive(self, peers) -> list[int]:
+        """The peers that are not suspected, in the order given."""
+        with self.lock:
+            self.overdue(monotonic())
+            return [peer_id for peer_id in peers if peer_id not in self.suspected]
+
+    def sweep(self) -> list[int]:
+        """Forget the suspicions older than `ttl`, and return the peers that were forgiven."""
+        now = monotonic()
+        with self.lock:
+            self.overdue(now)
+            expired = [peer_id for peer_id, since in self.suspected.items() if since < now - self.ttl]
+            for peer_id in expired:
+                del self.suspected[peer_id]
+        return expired
+
+    def overdue(self, now: float) -> None:
+        """Suspect the peers whose answer is overdue, from their deadline on. Called with the lock held."""
+        for peer_id, deadline in list(self.expected.items()):
+            if deadline < now:
+                del self.expected[peer_id]
+                self.suspected[peer_id] = deadline
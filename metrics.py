@@ -0,0 +1,261 @@
+"""
+Shared memory block with the counters of every node in a run.
+
+Each node gets its own slot of `SLOT_SIZE` signed 64 bit integers and is the only process writing to it,
+so no cross process lock is needed. Threads inside a node share a plain `threading.Lock` for their
+read-modify-writes. The parent reads the whole block at once as a NumPy array. Aligned 64 bit loads
+don't tear, so a read during a run gives counters that are each valid, just maybe from slightly
+different moments.
+
+Slot layout, indices into a slot:
+
+    SENT + type         messages sent per wire type, counted per receiver (a multicast counts once per peer)
+    RECEIVED + type     messages received per wire type
+    DATAGRAMS           datagrams actually written to a socket
+    DROPS               datagrams that were received but not handled, like ones that did not decode or had an unknown type
+    ELECTION_START      monotonic_ns when this node first started an election, 0 if it never did
+    ELECTION_END        monotonic_ns when this node last learned or announced the coordinator, i.e. adopted the one it ended up with
+    COORDINATOR         the coordinator this node ended up with, -1 while it has none
+    TEARDOWN            ns from the node knowing the outcome until its listener and starter had stopped
+    READY               monotonic_ns when the node's listener was bound
+    ANNOUNCE            monotonic_ns when this node first started announcing itself as coordinator, 0 if it never did
+    MISSED_HEARTBEAT    daemon mode: monotonic_ns when this node last gave up on the coordinator's heartbeats
+    FAILOVERS           daemon mode: how many times it did
+    SKIPPED             messages not sent because the membership cache believed the receiver dead
+    TERM                the latest election term this node started or heard of
+    STALE               messages dropped because they belonged to an older term
+    COALESCED           standard bully: messages not sent because another one already said the same
+    KERNEL_DROPS        datagrams the kernel dropped on a full receive buffer of this node's sockets, UDP only
+    RETRANSMITS         reliable messages sent again because their ack didn't come in time
+    DUPLICATES          reliable messages received again and dropped
+    UNACKED             reliable messages given up on after the last retransmit
+"""
+from multiprocessing import shared_memory
+from threading import Lock
+from time import monotonic_ns
+import math
+
+NUM_TYPES = 16
+SENT = 0
+RECEIVED = SENT + NUM_TYPES
+DATAGRAMS = RECEIVED + NUM_TYPES
+DROPS = DATAGRAMS + 1
+ELECTION_START = DROPS + 1
+ELECTION_END = ELECTION_START + 1
+COORDINATOR = ELECTION_END + 1
+TEARDOWN = COORDINATOR + 1
+READY = TEARDOWN + 1
+ANNOUNCE = READY + 1
+MISSED_HEARTBEAT = ANNOUNCE + 1
+FAILOVERS = MISSED_HEARTBEAT + 1
+SKIPPED = FAILOVERS + 1
+TERM = SKIPPED + 1
+STALE = TERM + 1
+COALESCED = STALE + 1
+KERNEL_DROPS = COALESCED + 1
+RETRANSMITS = KERNEL_DROPS + 1
+DUPLICATES = RETRANSMITS + 1
+UNACKED = DUPLICATES + 1
+SLOT_SIZE = 56 # 448 bytes, a whole number of cache lines so neighbouring slots never share one
+
+ITEM_SIZE = 8
+
+
+class MetricsSlot:
+    """The writer side of one node's slot. Only ever used by that node's process."""
+    def __init__(self, values: memoryview) -> None:
+        self.values = values
+        self.lock = Lock()
+
+    def add(self, field: int, n: int = 1) -> None:
+        with self.lock:
+            self.values[field] += n
+
+    def set(self, field: int, value: int) -> None:
+        self.values[field] = value
+
+    def __getitem__(self, field: int) -> int:
+        return self.values[field]
+
+    def count_sent(self, kind: int, logical: int, physical: int) -> None:
+        """The node only sends what `wire.encode` made, a kind without a counter of its own is a bug."""
+        if not 0 <= kind < NUM_TYPES:
+            raise ValueError(f"No counter for message type {kind}")
+        with self.lock:
+            self.values[SENT + kind] += logical
+            self.values[DATAGRAMS] += physical
+
+    def count_received(self, kind: int) -> None:
+        """A kind without a counter of its own counts in DROPS, like a datagram that didn't decode."""
+        with self.lock:
+            if 0 <= kind < NUM_TYPES:
+                self.values[RECEIVED + kind] += 1
+            else:
+                self.values[DROPS] += 1
+
+    def count_drop(self) -> None:
+        self.add(DROPS)
+
+    def election_started(self) -> None:
+        with self.lock:
+            if self.values[ELECTION_START] == 0:
+                self.values[ELECTION_START] = monotonic_ns()
+
+    def election_ended(self, coordinator: int) -> None:
+        with self.lock:
+            self.values[ELECTION_END] = monotonic_ns()
+            self.values[COORDINATOR] = coordinator
+
+    def announced(self) -> None:
+        with self.lock:
+            if self.values[ANNOUNCE] == 0:
+                self.values[ANNOUNCE] = monotonic_ns()
+
+    def missed_heartbeat(self) -> None:
+        with self.lock:
+            self.values[MISSED_HEARTBEAT] = monotonic_ns()
+            self.values[FAILOVERS] += 1
+
+    def count_skipped(self, n: int) -> None:
+        self.add(SKIPPED, n)
+
+    def count_stale(self) -> None:
+        self.add(STALE)
+
+    def count_coalesced(self, n: int = 1) -> None:
+        self.add(COALESCED, n)
+
+    def count_retransmit(self) -> None:
+        self.add(RETRANSMITS)
+
+    def count_duplicate(self) -> None:
+        self.add(DUPLICATES)
+
+    def count_unacked(self, n: int) -> None:
+        self.add(UNACKED, n)
+
+    def messages_sent(self) -> int:
+        return sum(self.values[SENT:SENT + NUM_TYPES])
+
+
+class MetricsBlock:
+    """
+    Owns the shared memory. Create it in the parent before starting the nodes, hand each node
+    `block.slot(i)` and read the results with `array()` (or the totals below) once they are done.
+    """
+    def __init__(self, num_slots: int) -> None:
+        self.num_slots = num_slots
+        self.shm = shared_memory.SharedMemory(create=True, size=max(num_slots, 1)*SLOT_SIZE*ITEM_SIZE)
+        self.values = self.shm.buf.cast("q")
+        for i in range(num_slots):
+            self.values[i*SLOT_SIZE + COORDINATOR] = -1
+        self.views = []
+
+    def slot(self, index: int) -> MetricsSlot:
+        view = self.values[index*SLOT_SIZE:(index + 1)*SLOT_SIZE]
+        self.views.append(view)
+        return MetricsSlot(view)
+
+    def array(self):
+        """A copy of the whole block as a `(num_slots, SLOT_SIZE)` int64 NumPy array."""
+        import numpy as np
+        view = np.ndarray((self.num_slots, SLOT_SIZE), dtype=np.int64, buffer=self.shm.buf)
+        result = view.copy()
+        del view
+        return result
+
+    def messages_sent(self) -> list[int]:
+        return [sum(self.values[i*SLOT_SIZE + SENT:i*SLOT_SIZE + SENT + NUM_TYPES]) for i in range(self.num_slots)]
+
+    def datagrams_sent(self) -> list[int]:
+        return [self.values[i*SLOT_SIZE + DATAGRAMS] for i in range(self.num_slots)]
+
+    def skipped(self) -> list[int]:
+        return [self.values[i*SLOT_SIZE + SKIPPED] for i in range(self.num_slots)]
+
+    def coalesced(self) -> list[int]:
+        return [self.values[i*SLOT_SIZE + COALESCED] for i in range(self.num_slots)]
+
+    def kernel_drops(self) -> list[int]:
+        return [self.values[i*SLOT_SIZE + KERNEL_DROPS] for i in range(self.num_slots)]
+
+    def retransmits(self) -> list[int]:
+        return [self.values[i*SLOT_SIZE + RETRANSMITS] for i in range(self.num_slots)]
+
+    def teardowns(self) -> list[float]:
+        """Teardown latency of every node in seconds."""
+        return [self.values[i*SLOT_SIZE + TEARDOWN]/1e9 for i in range(self.num_slots)]
+
+    def phases(self, start_ns: int, end_ns: int) -> tuple[float, float, float]:
+        """
+        Split a run from `start_ns` to `end_ns` (monotonic_ns) into seconds of startup (until the last
+        listener was up), election (from the first election started until the last node knew the
+        coordinator) and teardown (from there until `end_ns`).
+        """
+        column = lambda field: [self.values[i*SLOT_SIZE + field] for i in range(self.num_slots)]
+        ready = max(column(READY), default=start_ns)
+        starts = [t for t in column(ELECTION_START) if t]
+        ends = [t for t in column(ELECTION_END) if t]
+        election_start = min(starts, default=ready)
+        election_end = max(ends, default=election_start)
+        return (ready - start_ns)/1e9, (election_end - election_start)/1e9, (end_ns - election_end)/1e9
+
+    def convergence(self) -> tuple[float | None, float | None, float | None, float | None]:
+        """`convergence` of the run in seconds."""
+        column = lambda field: [self.values[i*SLOT_SIZE + field] or None for i in range(self.num_slots)]
+        times = convergence(column(ELECTION_START), column(ANNOUNCE), column(ELECTION_END), self.coordinators())
+        return tuple(t/1e9 if t is not None else None for t in times)
+
+    def coordinators(self) -> list[int]:
+        return [self.values[i*SLOT_SIZE + COORDINATOR] for i in range(self.num_slots)]
+
+    def close(self) -> None:
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.values.release()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> "MetricsBlock":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def percentile(values: list, p: float):
+    """Nearest rank percentile, None without values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p/100*len(ordered)) - 1, 0)]
+
+
+def convergence(starts: list, announces: list, adoptions: list, coordinators: list) -> tuple:
+    """
+    How fast one election converged, from per node timestamps that are None where a node has none:
+    time from the first election started until the first announce, time from the first election started
+    until every node had adopted the coordinator they all agree on, and the p50 and p99 of how long after
+    the first announce the nodes adopted it. In the unit of the timestamps, None for what didn't happen
+    (no announce, or the nodes never agreed).
+    """
+    starts = [t for t in starts if t is not None]
+    announces = [t for t in announces if t is not None]
+    if not starts:
+        return None, None, None, None
+    origin = min(starts)
+    first_announce = min(announces) - origin if announces else None
+    
+    agreed = len(set(coordinators)) == 1 and coordinators[0] not in (-1, None) and None not in adoptions
+    agreement = max(adoptions) - origin if agreed else None
+    if not announces or not agreed:
+        return first_announce, agreement, None, None
+    spread = [t - min(announces) for t in adoptions]
+    return first_announce, agreement, percentile(spread, 50), percentile(spread, 99)
+
+
+def format_convergence(times: tuple) -> str:
+    """One line for the output of the scripts, from a `convergence` in seconds."""
+    first_announce, agreement, p50, p99 = (f"{t:.3f} s" if t is not None else "-" for t in times)
+    return f"First announce {first_announce}, agreement {agreement}, adoption spread p50 {p50}, p99 {p99}"
@@ -0,0 +1,24 @@
+"""
+Helpers for sending one datagram to every node through an IP multicast group on the loopback interface.
+"""
+import socket
+
+DEFAULT_GROUP = "239.255.42.1"
+LOOPBACK = "127.0.0.1"
+
+
+def open_group_socket(group: str, port: int) -> socket.socket:
+    """A socket bound to the group port that receives everything sent to the group on loopback."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((group, port))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(group) + socket.inet_aton(LOOPBACK))
+    return sock
+
+
+def enable_multicast_send(sock: socket.socket) -> socket.socket:
+    """Route multicast datagrams sent on `sock` over loopback, and deliver them to the sending host as well."""
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(LOOPBACK))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    return sock
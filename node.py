@@ -0,0 +1,571 @@
+"""
+What the standard and the improved bully nodes have in common: sockets and transports, the listener
+and its receive loop, the counters, acks and retransmits, heartbeats, the membership cache and tracing.
+
+A variant subclasses `Node` with its election and the handlers of its own message types. It sets
+`VARIANT` (the name of its trace files) and `RELIABLE`, and implements `start_election`,
+`handle_message`, `check_term` and `announce_coordinator`.
+"""
+from multiprocessing import Process
+from multiprocessing.synchronize import Barrier as BarrierType
+from multiprocessing.sharedctypes import SynchronizedBase
+from metrics import MetricsSlot
+from threading import Thread, BrokenBarrierError, Event
+from time import sleep, monotonic, monotonic_ns
+import socket
+import selectors
+from pacing import Pacer, FixedDelay, make_pacer
+import wire
+import multicast
+import metrics
+import tracing
+import os
+from control import ControlPipe
+from membership import Membership
+from reliable import Reliability
+from transport import make_transport, configure_receive, drain, kernel_drops
+
+EXECUTION_MODES = ("process", "thread")
+POLL_INTERVAL = 1 # Only for state changed from outside the process, like a shared `coordinator_id`
+READY_TIMEOUT = 10 # Give up on the other nodes getting ready after this, and start anyway
+
+
+class Node(Process):
+    VARIANT = None
+    # The messages that are acked and retransmitted with a retransmit timeout
+    RELIABLE = ()
+
+    def __init__(self,
+                 id: int,
+                 num_nodes: int,
+                 base_port: int,
+                 starter: bool,
+                 coordinator_id: SynchronizedBase = None,
+                 message_count: SynchronizedBase = None,
+                 silent:bool = False,
+                 pacing: str | Pacer = None,
+                 wire_format: str = "binary",
+                 multicast_group: str = None,
+                 physical_count: SynchronizedBase = None,
+                 metrics: MetricsSlot = None,
+                 execution_mode: str = "process",
+                 ready_barrier: BarrierType = None,
+                 trace_dir: str = None,
+                 trace_size: int = 4096,
+                 heartbeat_interval: float = None,
+                 heartbeat_timeout: float = None,
+                 membership_ttl: float = None,
+                 transport: str = "udp",
+                 rcvbuf: int = None,
+                 retransmit_timeout: float = None,
+                 retries: int = 3) -> None:
+        self.node_id = id
+        self.num_nodes = num_nodes
+        self.base_port = base_port
+        self.is_starter = starter
+        self.port = base_port + id
+        self.message_count = message_count
+        self.physical_count = physical_count
+        self.metrics = metrics
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode {execution_mode}, inline nodes are the ones in async_bully.py")
+        self.execution_mode = execution_mode
+        self.node_thread = None
+        self.threads = []
+        self.ready_barrier = ready_barrier
+        self.listening = Event()
+        self.trace_dir = trace_dir
+        self.trace = tracing.Trace(trace_size) if trace_dir is not None else None
+        # Daemon mode: with a heartbeat interval the node keeps running until it gets an exit message
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout if heartbeat_timeout is not None else 3*heartbeat_interval if heartbeat_interval else None
+        self.heartbeat_deadline = None
+        self.heartbeat_thread = None
+        self.heartbeat_stop = Event()
+        # With a membership ttl the node stops sending to peers that failed to answer, see membership.py
+        self.membership = Membership(id, membership_ttl) if membership_ttl is not None else None
+        self.transport = make_transport(transport, base_port, num_nodes)
+        if execution_mode == "process" and self.transport.name == "queue":
+            raise ValueError("The queue transport only reaches nodes in the same process, run them as threads")
+        if multicast_group is not None and self.transport.name != "udp":
+            raise ValueError("Multicast needs the udp transport")
+        if rcvbuf is not None and self.transport.name not in ("udp", "unix"):
+            raise ValueError(f"The {self.transport.name} transport has no receive buffer to size")
+        self.rcvbuf = rcvbuf
+        self.kernel_drops = {}
+        # With a retransmit timeout the election messages are acked and sent again until they are, see reliable.py
+        self.reliable = Reliability(retransmit_timeout, retries) if retransmit_timeout is not None else None
+        self.multicast_group = multicast_group
+        self.multicast_port = base_port + num_nodes
+        self.silent = silent
+        self.wire_format = wire_format
+        self.pacer = make_pacer(pacing) if pacing is not None else FixedDelay(.01)
+
+        self.coordinator = id
+        self.coordinator_id = coordinator_id
+        if self.coordinator_id is not None:
+            self.coordinator_id.value = id
+        self.timer = None
+        self.send_sock = None
+        self.stopped = False
+        self.control = None
+        self.done_at = None
+        self.running_election = False
+        self.has_announced = False
+        # Every message carries the sender's term, see the variants for what a term settles
+        self.term = 0
+        self.election_term = -1
+        self.coordinator_term = -1
+
+        super().__init__()
+
+    def start(self):
+        """In "thread" mode the node runs on a thread of the calling process instead of a process of its own."""
+        if self.execution_mode == "thread":
+            self.node_thread = Thread(target=self.run, name=f"Node-{self.node_id}")
+            self.node_thread.start()
+        else:
+            super().start()
+
+    def join(self, timeout=None):
+        if self.execution_mode == "thread":
+            self.node_thread.join(timeout)
+        else:
+            super().join(timeout)
+
+    def run(self):
+        # Opened before the threads that share it
+        self.get_send_socket()
+        self.starter_thread = Thread(target=self.starter)
+        self.starter_thread.start()
+
+        self.listen_thread = Thread(target=self.listener)
+        self.listen_thread.start()
+
+        self.starter_thread.join()
+        self.listen_thread.join()
+        # In thread mode nothing else would wait for the election threads and timers, and they
+        # must not send into the next election on the same ports
+        while self.threads:
+            self.threads.pop().join()
+
+        if self.send_sock is not None:
+            self.send_sock.close()
+        if self.done_at is not None:
+            teardown = monotonic() - self.done_at
+            if not self.metrics is None:
+                self.metrics.set(metrics.TEARDOWN, int(teardown*1e9))
+            self.print2(f"Node {self.node_id} is done, teardown took {teardown*1000:.1f} ms")
+        else:
+            self.print2(f"Node {self.node_id} is done")
+        if not self.trace is None:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            self.trace.dump(os.path.join(self.trace_dir, f"{self.VARIANT}-{self.node_id}.npy"))
+
+    def starter(self) -> None:
+        self.wait_until_ready()
+        if self.is_starter:
+            self.start_election()
+
+    def start_election(self) -> None:
+        """Run the variant's election, on the starters and once the heartbeats of the leader stopped."""
+        raise NotImplementedError
+
+    def wait_until_ready(self) -> None:
+        """
+        Wait until every alive node has bound its port, with a barrier shared by all the nodes of the run.
+        Without one, the listeners get the 100 ms they always had.
+        """
+        if self.ready_barrier is None:
+            sleep(.1)
+            return
+        self.listening.wait(READY_TIMEOUT)
+        try:
+            self.ready_barrier.wait(READY_TIMEOUT)
+        except BrokenBarrierError:
+            self.print2(f"Node {self.node_id} gave up waiting for the other nodes to get ready")
+
+
+    def listener(self) -> None:
+        """
+        Waits on the node socket, the multicast group socket and the control pipe at once. The pipe
+        is poked whenever another thread ends the node, so the loop exits without waiting for a message.
+        """
+        with self.transport.bind(self.node_id, self.rcvbuf) as sock, selectors.DefaultSelector() as selector, ControlPipe() as control:
+            self.control = control
+            selector.register(sock, selectors.EVENT_READ)
+            selector.register(control, selectors.EVENT_READ)
+            if not self.metrics is None:
+                self.metrics.set(metrics.READY, monotonic_ns())
+            if self.heartbeat_interval is not None:
+                self.heartbeat_deadline = monotonic() + self.heartbeat_timeout
+            self.listening.set()
+
+            group_sock = None
+            if self.multicast_group is not None:
+                group_sock = multicast.open_group_socket(self.multicast_group, self.multicast_port)
+                configure_receive(group_sock, self.rcvbuf)
+                group_sock.setblocking(False)
+                selector.register(group_sock, selectors.EVENT_READ)
+            try:
+                self.receive_loop(selector)
+            finally:
+                # Drops after the last datagram never came with one, ask the kernel for the final count
+                for endpoint in (sock, group_sock):
+                    self.count_kernel_drops(endpoint, kernel_drops(endpoint))
+                if group_sock is not None:
+                    group_sock.close()
+
+    def receive_loop(self, selector: selectors.BaseSelector) -> None:
+        """
+        Every wakeup takes all that is waiting on a socket, up to RECV_BATCH datagrams, before selecting
+        again. A node that is done keeps listening for the acks of its messages, and retransmits them.
+        """
+        while self.keep_listening() or self.awaiting_acks():
+            for key, _ in selector.select(self.select_timeout()):
+                if key.fileobj is self.control:
+                    self.control.drain()
+                    continue
+                datagrams, drops = drain(key.fileobj)
+                self.count_kernel_drops(key.fileobj, drops)
+                for data in datagrams:
+                    if not self.handle_datagram(data):
+                        return
+                    if not self.keep_listening() and not self.awaiting_acks():
+                        break
+            self.check_heartbeat()
+            self.retransmit()
+            if not self.membership is None:
+                self.membership.sweep()
+
+    def handle_datagram(self, data: bytes) -> bool:
+        """Act on one datagram. False when the node should stop listening."""
+        message = wire.decode(data)
+        self.count_received(message)
+        if not self.reliable is None and message is not None and not self.receive_reliably(message):
+            return True
+        if not self.keep_listening() and message is not None and message[0] != wire.EXIT:
+            return True # Done, only waiting for acks
+        if message is not None and not self.check_term(message):
+            return True
+        match message:
+            case (wire.HEARTBEAT, id, _, _):
+                self.msg_received_heartbeat(id)
+            case (wire.EXIT, _, _, _):
+                self.print2(f"Node {self.node_id} received exit message")
+                self.stopped = True
+                self.heartbeat_stop.set()
+                self.mark_done()
+                return False
+            case (kind, id, _, _):
+                self.handle_message(kind, id)
+
+        if not self.silent:
+            self.print2(f"{self.node_id} received {data}")
+        if self.heartbeat_interval is None and self.messages_sent() > self.num_nodes**2:
+            # Only a safety net, the terms keep an election well below this
+            self.print2(f"Node {self.node_id} sent too many messages. Exiting.")
+            return False
+        return True
+
+    def handle_message(self, kind:int, sender_id:int) -> None:
+        """Act on a message of the variant's own types, in the current term."""
+        raise NotImplementedError
+
+    def check_term(self, message:tuple) -> bool:
+        """Adopt a newer term, and drop messages of an older one. False for the messages not to handle."""
+        raise NotImplementedError
+
+    def announce_coordinator(self) -> None:
+        raise NotImplementedError
+
+    def receive_reliably(self, message:tuple) -> bool:
+        """Take an ack, or ack a reliable message. False for the ones not to handle: acks and duplicates."""
+        kind, sender_id, _, seq = message
+        if kind == wire.ACK:
+            self.reliable.acked(sender_id, seq)
+            return False
+        if seq == 0:
+            return True
+        self.send_now(wire.encode(wire.ACK, self.node_id, self.term, seq, fmt=self.wire_format), sender_id)
+        if not self.reliable.received(sender_id, seq):
+            if not self.metrics is None:
+                self.metrics.count_duplicate()
+            return False
+        return True
+
+    def awaiting_acks(self) -> bool:
+        return not self.reliable is None and not self.stopped and self.reliable.busy()
+
+    def retransmit(self):
+        """Send the reliable messages again whose ack is overdue, the receivers that never acked are suspected."""
+        if self.reliable is None:
+            return
+        resend, gave_up = self.reliable.due()
+        for msg, receiver_id in resend:
+            self.retransmitting(msg, receiver_id)
+            self.send_now(msg, receiver_id)
+            if not self.metrics is None:
+                self.metrics.count_retransmit()
+        if gave_up:
+            if not self.metrics is None:
+                self.metrics.count_unacked(len(gave_up))
+            if not self.membership is None:
+                self.membership.suspect(gave_up)
+
+    def retransmitting(self, msg:bytes, receiver_id:int) -> None:
+        """Called right before `msg` goes out again."""
+
+    def count_kernel_drops(self, endpoint, drops: int | None) -> None:
+        """Keep the latest drop count of each socket, the metrics get their sum."""
+        if drops is None:
+            return
+        self.kernel_drops[endpoint.fileno()] = drops
+        if not self.metrics is None:
+            self.metrics.set(metrics.KERNEL_DROPS, sum(self.kernel_drops.values()))
+
+    def set_term(self, term:int):
+        self.term = term
+        if not self.metrics is None:
+            self.metrics.set(metrics.TERM, term)
+
+    def send_message(self, msg:bytes, receiver_id, keep_going=None, sent_at:dict=None) -> bool:
+        """
+        Send after the pacing delay, unless `keep_going` says otherwise by then. Returns whether it was sent.
+        The send time goes into `sent_at` right before the send, on loopback the answer can be handled
+        before the send returns.
+        """
+        self.pacer.wait(receiver_id)
+        if keep_going is not None and not keep_going():
+            return False
+        if sent_at is not None:
+            sent_at[receiver_id] = monotonic()
+        self.send_now(msg, receiver_id)
+        if not self.reliable is None:
+            self.reliable.sent(msg, receiver_id)
+        return True
+
+    def send_now(self, msg:bytes, receiver_id):
+        """Send without the pacing delay, like the acks and retransmits."""
+        # Recorded before the send, so it comes before the receive in a merged trace
+        if not self.trace is None:
+            self.trace.record(tracing.SEND, wire.peek_kind(msg), receiver_id)
+        self.send_datagram(lambda sock: self.transport.send(sock, msg, receiver_id))
+        self.count_sent(msg, 1, 1)
+
+    def broadcast(self, msg:bytes, peers:range, sent_at:dict=None, keep_going=None):
+        """
+        Send `msg` to every node in `peers`. With a multicast group this is a single datagram to the
+        group, receivers outside `peers` ignore it the same way they would ignore a stray unicast.
+        If `sent_at` is given, the send time to each peer is recorded in it. If `keep_going` is given,
+        a unicast fan-out stops as soon as it returns False, the peers left out count as coalesced.
+        """
+        if self.multicast_group is None:
+            for i, peer_id in enumerate(peers):
+                if not self.send_message(msg, peer_id, keep_going, sent_at):
+                    if not self.metrics is None:
+                        self.metrics.count_coalesced(len(peers) - i)
+                    return
+            return
+
+        self.print2(self.node_id, "is multicasting", msg)
+        self.pacer.wait(None)
+        if sent_at is not None:
+            sent_at.update(dict.fromkeys(peers, monotonic()))
+        if not self.trace is None:
+            self.trace.record(tracing.SEND, wire.peek_kind(msg), -1)
+        self.send_datagram(lambda sock: sock.sendto(msg, (self.multicast_group, self.multicast_port)))
+        self.count_sent(msg, len(peers), 1)
+        if not self.reliable is None:
+            # Every receiver acks the one datagram, the retransmits go to the ones that didn't
+            for peer_id in peers:
+                self.reliable.sent(msg, peer_id)
+
+    def count_sent(self, msg:bytes, logical:int, physical:int):
+        """`message_count` counts messages per receiver, `physical_count` the datagrams actually sent."""
+        if not self.metrics is None:
+            self.metrics.count_sent(wire.peek_kind(msg), logical, physical)
+        if not self.message_count is None:
+            with self.message_count.get_lock():
+                self.message_count.value += logical
+        if not self.physical_count is None:
+            with self.physical_count.get_lock():
+                self.physical_count.value += physical
+
+    def count_received(self, message:tuple | None):
+        if not self.membership is None and message is not None and message[0] != wire.EXIT:
+            self.membership.seen(message[1])
+        if not self.trace is None:
+            if message is None:
+                self.trace.record(tracing.RECEIVE, 0, -1)
+            else:
+                self.trace.record(tracing.RECEIVE, message[0], message[1])
+        if self.metrics is None:
+            return
+        if message is None:
+            self.metrics.count_drop()
+        else:
+            self.metrics.count_received(message[0])
+
+    def messages_sent(self) -> int:
+        if not self.metrics is None:
+            return self.metrics.messages_sent()
+        if not self.message_count is None:
+            return self.message_count.value
+        return 0
+
+    def keep_listening(self) -> bool:
+        """A node listens until it knows the coordinator, or in daemon mode until it gets an exit message."""
+        if self.stopped:
+            return False
+        if self.heartbeat_interval is not None:
+            return True
+        return self.current_coordinator() == self.node_id and not self.has_announced
+
+    def is_leader(self) -> bool:
+        return self.has_announced and self.current_coordinator() == self.node_id
+
+    def select_timeout(self) -> float:
+        timeout = POLL_INTERVAL
+        if self.heartbeat_deadline is not None and not self.is_leader():
+            # The leader has no heartbeats to miss, its deadline only comes back once it isn't leading any more
+            timeout = min(timeout, max(self.heartbeat_deadline - monotonic(), 0))
+        deadline = self.reliable.next_deadline() if not self.reliable is None else None
+        if deadline is not None:
+            timeout = min(timeout, max(deadline - monotonic(), 0))
+        return timeout
+
+    def start_heartbeats(self):
+        """Daemon mode: the leader sends one heartbeat per interval, to the multicast group or to every other node."""
+        if self.heartbeat_interval is None or (self.heartbeat_thread is not None and self.heartbeat_thread.is_alive()):
+            return
+        self.heartbeat_stop.clear()
+        self.heartbeat_thread = self.spawn(self.send_heartbeats)
+
+    def send_heartbeats(self):
+        msg = self.encode(wire.HEARTBEAT)
+        peers = [peer_id for peer_id in range(self.num_nodes) if peer_id != self.node_id]
+        next_beat = monotonic()
+        while not self.stopped and self.is_leader():
+            alive = self.live_peers(peers)
+            self.broadcast(msg, alive)
+            if not self.membership is None:
+                # Every follower answers, the ones that don't are down
+                self.membership.expect(alive, self.heartbeat_timeout)
+            next_beat += self.heartbeat_interval
+            if self.heartbeat_stop.wait(max(next_beat - monotonic(), 0)):
+                return
+
+    def live_peers(self, peers) -> list[int]:
+        """The peers the membership cache believes alive, the ones left out are counted as skipped."""
+        if self.membership is None:
+            return peers
+        alive = self.membership.alive(peers)
+        if len(alive) < len(peers) and not self.metrics is None:
+            self.metrics.count_skipped(len(peers) - len(alive))
+        return alive
+
+    def msg_received_heartbeat(self, sender_id):
+        if sender_id == self.node_id:
+            return
+        if sender_id < self.node_id:
+            # A lower node leads while this one is up, so take over like a node that just recovered
+            if not self.running_election:
+                self.set_term(self.term + 1)
+                self.spawn(self.start_election)
+            return
+        coordinator = self.current_coordinator()
+        if sender_id != coordinator:
+            if coordinator != self.node_id and sender_id < coordinator:
+                return # An old leader that has not heard of the new one yet
+            self.set_coordinator(sender_id)
+        self.heartbeat_deadline = monotonic() + self.heartbeat_timeout
+        if not self.membership is None:
+            # Only tells the leader that this node is still there, an ack without a sequence number acks nothing
+            self.send_now(self.encode(wire.ACK), sender_id)
+
+    def check_heartbeat(self):
+        """Daemon mode: elect a new coordinator once the current one (or any, before the first) missed its heartbeats."""
+        if self.heartbeat_deadline is None or self.is_leader() or monotonic() < self.heartbeat_deadline:
+            return
+        self.heartbeat_deadline = monotonic() + self.heartbeat_timeout
+        if self.running_election and self.current_coordinator() == self.node_id:
+            return # Gave up on the leader already, the running election settles it
+        self.print2(f"Node {self.node_id} missed the heartbeats of {self.current_coordinator()}")
+        if not self.metrics is None:
+            self.metrics.missed_heartbeat()
+        if not self.trace is None:
+            self.trace.record(tracing.TIMER_FIRED, tracing.HEARTBEAT_TIMER)
+        if not self.membership is None:
+            self.membership.suspect([self.current_coordinator()])
+        self.coordinator = self.node_id
+        if not self.coordinator_id is None:
+            self.coordinator_id.value = self.node_id
+        self.has_announced = False
+        in_election = self.running_election and self.election_term == self.term
+        if not in_election and self.term in (self.coordinator_term, self.election_term):
+            # A new election needs a new term, unless another node already started one this node hasn't joined.
+            # One this node already runs keeps its term, the answers to it would be stale otherwise
+            self.set_term(self.term + 1)
+        if not self.running_election:
+            self.spawn(self.start_election)
+
+    def spawn(self, target) -> Thread:
+        """Start a helper thread, `run` waits for it before the node counts as stopped."""
+        thread = Thread(target=target)
+        thread.start()
+        self.threads.append(thread)
+        return thread
+
+    def mark_done(self):
+        """The node's outcome is settled: start the teardown clock and wake the listener."""
+        if self.done_at is None:
+            self.done_at = monotonic()
+            if not self.trace is None:
+                self.trace.record(tracing.STATE, tracing.DONE)
+        if not self.control is None:
+            self.control.wake()
+
+    def current_coordinator(self) -> int:
+        """A shared `coordinator_id` can be changed from outside the node, so it wins over the local copy."""
+        if not self.coordinator_id is None:
+            return self.coordinator_id.value
+        return self.coordinator
+
+    def set_coordinator(self, coordinator:int):
+        self.coordinator = coordinator
+        self.coordinator_term = self.term
+        if not self.coordinator_id is None:
+            self.coordinator_id.value = coordinator
+        if not self.metrics is None:
+            self.metrics.election_ended(coordinator)
+        if not self.trace is None:
+            self.trace.record(tracing.STATE, tracing.COORDINATOR, coordinator)
+        if self.heartbeat_deadline is not None:
+            self.heartbeat_deadline = monotonic() + self.heartbeat_timeout
+        if coordinator != self.node_id:
+            self.heartbeat_stop.set()
+            self.mark_done()
+
+    def encode(self, kind: int) -> bytes:
+        seq = self.reliable.next_seq() if not self.reliable is None and kind in self.RELIABLE else 0
+        return wire.encode(kind, self.node_id, self.term, seq, fmt=self.wire_format)
+
+    def get_send_socket(self) -> socket.socket:
+        """
+        Messages are sent from a socket of their own, not from the listener socket. That one doesn't
+        block, and a full send buffer would fail the send on whichever thread it happened to be.
+        """
+        if self.send_sock is None:
+            self.send_sock = self.transport.socket(self.node_id)
+            if self.multicast_group is not None:
+                multicast.enable_multicast_send(self.send_sock)
+        return self.send_sock
+
+    def send_datagram(self, send) -> None:
+        """Call `send` with the send socket."""
+        send(self.get_send_socket())
+
+    def print2(self, msg, *args, **kwargs):
+        if not self.silent:
+            print(msg, *args, **kwargs)
@@ -0,0 +1,110 @@
+from threading import Lock
+from time import monotonic, sleep
+
+
+class Pacer:
+    """
+    Decides how long a node waits before sending its next message.
+    `reserve` returns the wait and books the send, `wait` also does the sleeping.
+    The event-loop nodes only use `reserve` and schedule the send themselves.
+    """
+    def reserve(self, receiver_id: int) -> float:
+        raise NotImplementedError
+
+    def wait(self, receiver_id: int) -> None:
+        delay = self.reserve(receiver_id)
+        if delay > 0:
+            sleep(delay)
+
+
+class NoPacing(Pacer):
+    def reserve(self, receiver_id: int) -> float:
+        return 0
+
+    def __repr__(self) -> str:
+        return "none"
+
+
+class FixedDelay(Pacer):
+    """The original behaviour: the same pause in front of every message."""
+    def __init__(self, delay: float = 0.01) -> None:
+        self.delay = delay
+
+    def reserve(self, receiver_id: int) -> float:
+        return self.delay
+
+    def __repr__(self) -> str:
+        return f"fixed:{self.delay}"
+
+
+class TokenBucket(Pacer):
+    """
+    Allows bursts of up to `burst` messages, after which sends are spread out to `rate` messages per second.
+    """
+    def __init__(self, rate: float, burst: int = 1, clock = monotonic) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.last = clock()
+        self.lock = Lock()
+
+    def reserve(self, receiver_id: int) -> float:
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+            self.last = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens/self.rate
+
+    def __repr__(self) -> str:
+        return f"bucket:{self.rate}:{self.burst}"
+
+
+class PerDestinationRate(Pacer):
+    """
+    Limits the rate towards each receiver separately, so a fan-out to many peers is not slowed down
+    while a single receiver never gets more than `rate` messages per second from this node.
+    """
+    def __init__(self, rate: float, clock = monotonic) -> None:
+        self.interval = 1/rate
+        self.clock = clock
+        self.next_send = {}
+        self.lock = Lock()
+
+    def reserve(self, receiver_id: int) -> float:
+        with self.lock:
+            now = self.clock()
+            send_at = max(now, self.next_send.get(receiver_id, now))
+            self.next_send[receiver_id] = send_at + self.interval
+            return send_at - now
+
+    def __repr__(self) -> str:
+        return f"dest:{1/self.interval}"
+
+
+def make_pacer(spec: str | Pacer, clock = monotonic) -> Pacer:
+    """
+    Build a pacer from a command line style description:
+    `none`, `fixed:DELAY`, `bucket:RATE[:BURST]` or `dest:RATE`.
+    `clock` is only replaced by the event-loop nodes, so rates follow the loop's (possibly virtual) time.
+    """
+    if isinstance(spec, Pacer):
+        return spec
+
+    match spec.split(':'):
+        case ["none"]:
+            return NoPacing()
+        case ["fixed"]:
+            return FixedDelay()
+        case ["fixed", delay]:
+            return FixedDelay(float(delay))
+        case ["bucket", rate]:
+            return TokenBucket(float(rate), clock=clock)
+        case ["bucket", rate, burst]:
+            return TokenBucket(float(rate), int(burst), clock=clock)
+        case ["dest", rate]:
+            return PerDestinationRate(float(rate), clock=clock)
+    raise ValueError(f"Unknown pacing policy {spec!r}, expected none, fixed:DELAY, bucket:RATE[:BURST] or dest:RATE")
@@ -0,0 +1,106 @@
+"""
+Acks and retransmits for the election messages, so a lost datagram costs a retransmit instead of an
+election timeout or a wrong coordinator.
+
+A message sent reliably carries a sequence number in the `seq` field of the wire format, the others
+keep 0. The receiver answers it right away with an ack carrying the same number, and only hands it on
+the first time: retransmits of a message it already got are dropped as duplicates. The sender keeps
+every message until it is acked, and sends it again after `timeout`, then after twice that and so on,
+at most `retries` times. Then it gives up on the receiver, like on one that doesn't answer at all.
+A node's own timeouts wait for a message that is still `waiting`, so they only need to cover a round
+trip instead of every retransmit that might be needed.
+
+Which messages are sent reliably is up to the node, the acks themselves never are. Every node of a
+run needs the layer switched on, a node without it doesn't ack.
+"""
+from threading import Lock
+from time import monotonic
+import random
+import wire
+
+# Duplicates are recognized among the last this many reliable messages received
+MAX_SEEN = 4096
+
+
+class Reliability:
+    def __init__(self, timeout: float, retries: int = 3, clock=monotonic) -> None:
+        self.timeout = timeout
+        self.retries = retries
+        self.clock = clock
+        # A random start, so a node that restarts isn't taken for a duplicate of its former self
+        self.seq = random.randrange(1, 2**31)
+        self.pending = {}
+        self.seen = {}
+        self.lock = Lock()
+
+    def next_seq(self) -> int:
+        with self.lock:
+            self.seq = self.seq % (2**32 - 1) + 1 # 0 means unreliable
+            return self.seq
+
+    def sent(self, msg: bytes, receiver_id: int) -> None:
+        """Keep `msg` for retransmits until `receiver_id` acks it. Messages without a sequence number are ignored."""
+        seq = wire.peek_seq(msg)
+        if seq == 0 or wire.peek_kind(msg) == wire.ACK:
+            return
+        with self.lock:
+            self.pending[receiver_id, seq] = [msg, self.clock() + self.timeout, 0]
+
+    def acked(self, sender_id: int, seq: int) -> bool:
+        """Forget the message the ack is for. False if it wasn't pending, like the ack of a retransmit."""
+        with self.lock:
+            return self.pending.pop((sender_id, seq), None) is not None
+
+    def received(self, sender_id: int, seq: int) -> bool:
+        """True the first time a message comes, False for a duplicate."""
+        key = (sender_id, seq)
+        with self.lock:
+            if key in self.seen:
+                return False
+            self.seen[key] = None
+            if len(self.seen) > MAX_SEEN:
+                del self.seen[next(iter(self.seen))]
+        return True
+
+    def cancel(self, kind: int, receiver_ids=None) -> int:
+        """Stop retransmitting the messages of `kind`, to `receiver_ids` or to anyone. Returns how many were pending."""
+        with self.lock:
+            cancelled = [key for key, (msg, _, _) in self.pending.items()
+                         if wire.peek_kind(msg) == kind and (receiver_ids is None or key[0] in receiver_ids)]
+            for key in cancelled:
+                del self.pending[key]
+        return len(cancelled)
+
+    def waiting(self, kinds) -> bool:
+        """Whether a message of one of `kinds` is still unacked and has retransmits left."""
+        with self.lock:
+            return any(wire.peek_kind(msg) in kinds for msg, _, _ in self.pending.values())
+
+    def due(self) -> tuple[list[tuple[bytes, int]], list[int]]:
+        """
+        The `(msg, receiver_id)` to send again now, each with a doubled timeout for the next time, and
+        the receivers given up on because they didn't ack after the last retry.
+        """
+        now = self.clock()
+        resend = []
+        gave_up = []
+        with self.lock:
+            for key, entry in list(self.pending.items()):
+                msg, deadline, attempt = entry
+                if deadline > now:
+                    continue
+                if attempt >= self.retries:
+                    del self.pending[key]
+                    gave_up.append(key[0])
+                    continue
+                entry[1] = now + self.timeout*2**(attempt + 1)
+                entry[2] = attempt + 1
+                resend.append((msg, key[0]))
+        return resend, gave_up
+
+    def next_deadline(self) -> float | None:
+        with self.lock:
+            return min((deadline for _, deadline, _ in self.pending.values()), default=None)
+
+    def busy(self) -> bool:
+        return bool(self.pending)
@@ -0,0 +1,75 @@
+from threading import Lock
+
+# The floor of the adaptive timeout: ten of the default 10 ms pacing delays. TCP's 1 s minimum is far
+# above any loopback round trip, with it the measured round trips would never lower the timeout
+MIN_TIMEOUT = 0.1
+
+
+class RttEstimator:
+    """
+    Round-trip time estimator in the style of TCP's retransmission timer (RFC 6298): a smoothed RTT
+    and its mean deviation are kept as EWMAs, and the timeout is `srtt + k*rttvar`, clamped to
+    `[min_timeout, max_timeout]`. Until the first sample arrives `initial` is used.
+    """
+    def __init__(self,
+                 initial: float = 1.0,
+                 min_timeout: float = MIN_TIMEOUT,
+                 max_timeout: float = None,
+                 alpha: float = 1/8,
+                 beta: float = 1/4,
+                 k: float = 4) -> None:
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.lock = Lock()
+
+    def sample(self, rtt: float) -> None:
+        with self.lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt/2
+            else:
+                self.rttvar = (1 - self.beta)*self.rttvar + self.beta*abs(self.srtt - rtt)
+                self.srtt = (1 - self.alpha)*self.srtt + self.alpha*rtt
+            self.samples += 1
+
+    def timeout(self) -> float:
+        if self.srtt is None:
+            timeout = self.initial
+        else:
+            timeout = self.srtt + self.k*self.rttvar
+        timeout = max(timeout, self.min_timeout)
+        if self.max_timeout is not None:
+            timeout = min(timeout, self.max_timeout)
+        return timeout
+
+
+class FixedTimeout(RttEstimator):
+    """Ignores all samples, for running with the original fixed election timeout."""
+    def __init__(self, timeout: float) -> None:
+        super().__init__(initial=timeout, min_timeout=timeout, max_timeout=timeout)
+
+    def sample(self, rtt: float) -> None:
+        self.samples += 1
+
+
+def make_estimator(num_nodes: int,
+                   election_timeout: float = None,
+                   min_timeout: float = MIN_TIMEOUT,
+                   max_timeout: float = None) -> RttEstimator:
+    """
+    A fixed `election_timeout` turns the adaptive timeout off. Otherwise the timeout adapts between
+    `min_timeout` and `max_timeout`, which defaults to the old `.2*num_nodes`.
+    """
+    if election_timeout is not None:
+        return FixedTimeout(election_timeout)
+    if max_timeout is None:
+        max_timeout = max(.2*num_nodes, 1.0)
+    return RttEstimator(min_timeout=min_timeout, max_timeout=max_timeout)
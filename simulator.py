@@ -0,0 +1,170 @@
+from argparse import ArgumentParser
+import heapq
+import json
+import random
+import async_bully
+
+
+class SimHandle:
+    def __init__(self, when: float, callback, args) -> None:
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class SimFuture:
+    """The small part of `asyncio.Future` that the nodes use."""
+    def __init__(self) -> None:
+        self._done = False
+        self._result = None
+
+    def done(self) -> bool:
+        return self._done
+
+    def set_result(self, result) -> None:
+        self._done = True
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+class VirtualLoop:
+    """
+    Stands in for the asyncio event loop of the nodes in `async_bully`. Callbacks are kept in a heap
+    ordered by virtual time (and by scheduling order for ties), and `time()` jumps straight to the
+    next callback instead of waiting for it, so runs are both fast and reproducible.
+    """
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.queue = []
+        self.counter = 0
+        self.events = 0
+
+    def time(self) -> float:
+        return self.now
+
+    def call_later(self, delay: float, callback, *args) -> SimHandle:
+        handle = SimHandle(self.now + max(delay, 0), callback, args)
+        heapq.heappush(self.queue, (handle.when, self.counter, handle))
+        self.counter += 1
+        return handle
+
+    def call_soon(self, callback, *args) -> SimHandle:
+        return self.call_later(0, callback, *args)
+
+    def create_future(self) -> SimFuture:
+        return SimFuture()
+
+    def run(self, until: float = None) -> None:
+        while self.queue:
+            when, _, handle = self.queue[0]
+            if until is not None and when > until:
+                self.now = until
+                return
+            heapq.heappop(self.queue)
+            if handle.cancelled:
+                continue
+            self.now = when
+            self.events += 1
+            handle.callback(*handle.args)
+
+
+class SimNetwork(async_bully.LocalNetwork):
+    """
+    In-memory network with a configurable one-way latency, uniform jitter on top of it and a loss
+    probability. All randomness comes from one seeded generator.
+    """
+    def __init__(self, loop: VirtualLoop, latency: float = 0.001, jitter: float = 0, loss: float = 0, seed: int = 0) -> None:
+        super().__init__(loop, latency)
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.delivered = 0
+        self.dropped = 0
+
+    def send(self, sender, msg: bytes, receiver_id: int) -> None:
+        receiver = self.nodes.get(receiver_id)
+        if receiver is None:
+            return
+        if self.loss and self.random.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        self.delivered += 1
+        self.loop.call_later(delay, receiver.datagram_received, msg, sender.node_id)
+
+
+def simulate(variant: str,
+             num: int,
+             starters: list[int],
+             alive: list[int],
+             latency: float = 0.001,
+             jitter: float = 0,
+             loss: float = 0,
+             seed: int = 0,
+             until: float = None,
+             **node_kwargs) -> list[async_bully.AsyncNode]:
+    """
+    Run one election of the given variant on a virtual clock. The nodes are the same protocol objects
+    the asyncio runtime uses, `finish_time` on each node is the simulated time it finished at.
+    """
+    loop = VirtualLoop()
+    network = SimNetwork(loop, latency, jitter, loss, seed)
+    implementation = async_bully.VARIANTS[variant]
+
+    nodes = [implementation(node_id, num, node_id in starters, network, **node_kwargs) for node_id in alive]
+    for node in nodes:
+        network.nodes[node.node_id] = node
+    for node in nodes:
+        node.start()
+
+    loop.run(until)
+    return nodes
+
+
+def convergence_time(nodes: list[async_bully.AsyncNode]) -> float:
+    """Simulated time at which the last node finished, or None if some node never did."""
+    if not all(node.done.done() for node in nodes):
+        return None
+    return max(node.finish_time for node in nodes)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("variant", choices=async_bully.VARIANTS.keys())
+    parser.add_argument("-f", "--file", type=str, default="batch.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.001)
+    parser.add_argument("--jitter", type=float, default=0)
+    parser.add_argument("--loss", type=float, default=0)
+    parser.add_argument("--pacing", type=str, default=None, help="none, fixed:DELAY, bucket:RATE[:BURST] or dest:RATE")
+    parser.add_argument("-k", "--probe-window", type=int, default=1, help="improved only: number of higher nodes probed at once")
+    parser.add_argument("--retransmit", type=float, default=None, metavar="TIMEOUT", help="ack the election messages and retransmit them, see reliable.py")
+    parser.add_argument("--retries", type=int, default=3)
+
+    args = parser.parse_args()
+
+    with open(args.file, "r") as f:
+        batch = json.load(f)
+
+    node_kwargs = {"pacing": args.pacing, "retransmit_timeout": args.retransmit, "retries": args.retries}
+    if args.variant == "improved":
+        node_kwargs["probe_window"] = args.probe_window
+
+    for i, run in enumerate(batch):
+        nodes = simulate(args.variant, run["num"], run["starters"], run["alive"],
+                         latency=args.latency, jitter=args.jitter, loss=args.loss, seed=args.seed, **node_kwargs)
+        messages = sum(node.message_count for node in nodes)
+        retransmits = sum(node.retransmit_count for node in nodes)
+        correct = all(node.coordinator_id == max(run["alive"]) for node in nodes)
+        t = convergence_time(nodes)
+        converged = f"converged after {t:.3f} s" if t is not None else "did not converge"
+        resent = f" ({retransmits} retransmits)" if args.retransmit is not None else ""
+        print(f"Test {i}: {messages} messages{resent}, {converged}, {'correct' if correct else 'wrong'} coordinator")
@@ -1,207 +1,217 @@
+"""
+The standard bully: a node that notices the coordinator is gone sends an election to every higher node,
+and announces itself unless one of them answers OK before the election timeout. The node machinery the
+variants share is `node.Node`, the command line is `cli.py`.
+
+With `--execution-mode inline` the nodes of `async_bully.py` run instead. They can't use the membership
+cache, heartbeats (daemon mode), tracing, multicast, the unix and shm transports or `--rcvbuf`.
+"""
 from email import parser
-from multiprocessing import Process, Value
-from ctypes import c_uint
-from multiprocessing.sharedctypes import SynchronizedBase
-from threading import Thread, Timer
-from time import sleep
-import socket
-import random
-from argparse import ArgumentParser
-
-
-class Node(Process):
-    def __init__(self, 
-                 id: int, 
-                 num_nodes: int, 
-                 base_port: int, 
-                 starter: bool, 
-                 coordinator_id: SynchronizedBase,
-                 message_count: SynchronizedBase = None,
-                 silent:bool = False) -> None:
-        self.node_id = id
-        self.num_nodes = num_nodes
-        self.base_port = base_port
-        self.is_starter = starter
-        self.port = base_port + id
-        self.message_count = message_count
-        self.silent = silent
-        
-        self.coordinator_id = coordinator_id
-        self.coordinator_id.value = id
-        self.timer = None
-        self.running_election = False
-        self.has_announced = False
-
-        super().__init__()
-
-    def run(self):
-        self.starter_thread = Thread(target=self.starter)
-        self.starter_thread.start()
-
-        self.listen_thread = Thread(target=self.listener)
-        self.listen_thread.start()
-
-        self.starter_thread.join()
-        self.listen_thread.join()
-        
-        self.print2(f"Node {self.node_id} is done")
-
-    def starter(self) -> None: 
-        sleep(.1)
-        if self.is_starter:
-            self.run_election()
-
-
-    def listener(self) -> None:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.bind(("127.0.0.1", self.port))
-            sock.settimeout(1)
-
-            while self.coordinator_id.value == self.node_id and not self.has_announced:
-                try:
-                    data, addr = sock.recvfrom(1024)
-                    match data.decode("UTF8").split(' '):
-                        case ["election", id]:
-                            self.msg_received_election(int(id))
-                        case ["coordinator", id]:
-                            self.msg_received_coordinator(int(id))
-                        case ["OK", id]:
-                            self.msg_received_ok(int(id))
-                        case ["exit"]:
-                            self.print2(f"Node {self.node_id} received exit message")
-                            return
-
-                    self.print2(f"{self.node_id} received {data}")
-                except socket.timeout:
-                    #self.print2(f"{self.node_id} timed out") 
-                    pass
-            
-            if self.message_count.value > self.num_nodes**2:
-                self.print2(f"Node {self.node_id} received too many messages. Exiting.")
-                return
+from threading import Timer, Lock
+from time import monotonic
+import wire
+import tracing
+from rtt import make_estimator, MIN_TIMEOUT
+import node
+import cli
+
+class Node(node.Node):
+    VARIANT = "standard"
+    # The messages that are acked and retransmitted with a retransmit timeout
+    RELIABLE = (wire.ELECTION, wire.OK, wire.COORDINATOR)
+
+    def __init__(self, *args,
+                 ok_window: float = 0,
+                 election_timeout: float = None,
+                 min_timeout: float = MIN_TIMEOUT,
+                 max_timeout: float = None,
+                 **options) -> None:
+        """The options shared by both variants are the ones of `node.Node`."""
+        super().__init__(*args, **options)
+        # A node runs at most one election per term, so concurrent starters end up in the same election instead of one each
+        self.election_lock = Lock()
+        self.rtt = make_estimator(self.num_nodes, election_timeout, min_timeout, max_timeout)
+        self.election_sent = {}
+        self.election_peers = []
+        # The OKs of elections that come in within `ok_window` go out together, at most one per lower node and term
+        self.ok_window = ok_window
+        self.ok_lock = Lock()
+        self.ok_pending = []
+        self.ok_answered = set()
+        self.ok_term = -1
+        self.ok_timer = None
+
+    def start_election(self):
+        self.run_election()
+
+    def handle_message(self, kind:int, sender_id:int):
+        match kind:
+            case wire.ELECTION:
+                self.msg_received_election(sender_id)
+            case wire.COORDINATOR:
+                self.msg_received_coordinator(sender_id)
+            case wire.OK:
+                self.msg_received_ok(sender_id)
+
+    def retransmitting(self, msg:bytes, receiver_id:int):
+        if wire.peek_kind(msg) == wire.ELECTION:
+            # The OK to a retransmit says nothing about the round trip
+            self.election_sent.pop(receiver_id, None)
+    
+    def check_term(self, message:tuple) -> bool:
+        """
+        Adopt a newer term, and drop messages of an older one. A stale election still gets its OK,
+        which carries the current term and brings the sender up to date, but doesn't start anything.
+        The same goes for a stale announcement of a lower node, the leader answers it with its own.
+        """
+        kind, sender_id, term, _ = message
+        if kind == wire.EXIT or term == self.term:
+            return True
+        if term > self.term:
+            self.set_term(term)
+            return True
+        if not self.metrics is None:
+            self.metrics.count_stale()
+        if kind == wire.ELECTION and sender_id < self.node_id:
+            self.answer_election(sender_id)
+        if kind == wire.COORDINATOR and sender_id < self.node_id and self.is_leader():
+            self.send_message(self.encode(wire.COORDINATOR), sender_id)
+        return False
     
     def msg_received_election(self, sender_id):
         if sender_id < self.node_id:
-            self.send_message(bytes(f"OK {self.node_id}", encoding="UTF8"), sender_id)
-            self.run_election()
+            self.answer_election(sender_id)
+            if not self.running_election and self.election_term < self.term:
+                # Fan out on a separate thread, so the listener keeps answering while this node sends
+                self.spawn(self.run_election)
+    
+    def answer_election(self, sender_id):
+        """
+        Queue an OK for a lower node. An OK only says that a higher node is alive, so a lower node
+        that already got one this term gets no second one, whatever its election messages were.
+        """
+        with self.ok_lock:
+            if self.ok_term != self.term:
+                self.ok_term = self.term
+                self.ok_answered.clear()
+            if sender_id in self.ok_answered:
+                if not self.metrics is None:
+                    self.metrics.count_coalesced()
+                return
+            self.ok_answered.add(sender_id)
+            self.ok_pending.append(sender_id)
+            if self.ok_timer is not None:
+                return
+            if self.ok_window:
+                self.ok_timer = Timer(self.ok_window, self.send_oks)
+                self.ok_timer.start()
+                self.threads.append(self.ok_timer)
+                return
+        self.send_oks()
+    
+    def send_oks(self):
+        with self.ok_lock:
+            pending, self.ok_pending = self.ok_pending, []
+            self.ok_timer = None
+        msg = self.encode(wire.OK)
+        for peer_id in pending:
+            self.send_message(msg, peer_id)
     
     def msg_received_coordinator(self, sender_id):
         #self.print2(f"Coordinator received from {sender_id} by {self.node_id}")
-        self.coordinator_id.value = sender_id
+        self.set_coordinator(sender_id)
         
     
     def msg_received_ok(self, sender_id):
         self.print2(f"OK received from {sender_id} by {self.node_id}", end="")
-        if self.running_election:
-            self.print2(" - ending election", end="")
-            self.running_election = False
-            
-            if self.timer and not self.timer.finished.is_set():
-                self.print2(" - stopping timer", end="")
-                self.timer.cancel()
-        else:
-            self.print2(" - no election was running", end="")
+        sent = self.election_sent.pop(sender_id, None)
+        if sent is not None:
+            self.rtt.sample(monotonic() - sent)
+        if not self.reliable is None:
+            # The higher node took over, the other higher nodes don't need the election any more
+            self.reliable.cancel(wire.ELECTION)
+        
+        with self.election_lock:
+            if self.running_election:
+                self.print2(" - ending election", end="")
+                self.running_election = False
+                if not self.trace is None:
+                    self.trace.record(tracing.STATE, tracing.ELECTION_STOPPED)
+                
+                if self.timer and not self.timer.finished.is_set():
+                    self.print2(" - stopping timer", end="")
+                    self.timer.cancel()
+            else:
+                self.print2(" - no election was running", end="")
         self.print2("")
+        if self.heartbeat_deadline is not None:
+            # A higher node is alive and runs its own election, give it time to announce before electing again
+            self.heartbeat_deadline = max(self.heartbeat_deadline, monotonic() + self.rtt.timeout() + self.heartbeat_timeout)
             
         self.ok_received = True
 
     def run_election(self):
-        if not self.running_election:
+        # Checked and set at once, the listener spawns a thread for every lower election and a starter runs one too
+        with self.election_lock:
+            if self.running_election or self.election_term >= self.term:
+                return
             self.running_election = True
-            self.print2(f"Starting election on {self.node_id}")
-            
-            self.timer = Timer(.2*self.num_nodes, self.announce_coordinator)
-            self.timer.start()
-            
-            for peer_id in range(self.node_id+1, self.num_nodes):
-                self.send_message(bytes(f"election {self.node_id}", encoding="UTF8"), peer_id)
-            
+            self.election_term = self.term
+        self.print2(f"Starting election on {self.node_id}")
+        if not self.metrics is None:
+            self.metrics.election_started()
+        if not self.trace is None:
+            self.trace.record(tracing.STATE, tracing.ELECTION_STARTED)
+        
+        self.election_peers = self.live_peers(range(self.node_id+1, self.num_nodes))
+        # Once a higher node answered, it runs the election from there and reaches the rest itself
+        self.broadcast(self.encode(wire.ELECTION), self.election_peers, self.election_sent, lambda: self.running_election)
+        
+        # The timeout counts from the last election message, and is derived from the OK round
+        # trip times seen so far instead of the size of the cluster
+        with self.election_lock:
+            if self.running_election:
+                timeout = self.rtt.timeout()
+                if not self.trace is None:
+                    self.trace.record(tracing.TIMER_ARMED, tracing.ELECTION_TIMER, int(timeout*1e6))
+                self.timer = Timer(timeout, self.election_timed_out)
+                self.threads.append(self.timer)
+                self.timer.start()
+
+
+    def election_timed_out(self):
+        if not self.reliable is None and self.reliable.waiting((wire.ELECTION,)):
+            with self.election_lock:
+                if self.running_election:
+                    # An election message is still being retransmitted, its receiver may well be alive
+                    self.timer = Timer(self.reliable.timeout, self.election_timed_out)
+                    self.threads.append(self.timer)
+                    self.timer.start()
+                    return
+        if not self.trace is None:
+            self.trace.record(tracing.TIMER_FIRED, tracing.ELECTION_TIMER)
+        if not self.membership is None:
+            # Nobody answered, so every higher node that was asked is down
+            self.membership.suspect([peer_id for peer_id in self.election_peers if peer_id in self.election_sent])
+        self.announce_coordinator()
 
     def announce_coordinator(self):
         self.print2(f"Announcing coordinator {self.node_id}")
-        for peer_id in range(self.num_nodes):
-            self.send_message(bytes(f"coordinator {self.node_id}", encoding="UTF8"), peer_id)
+        if not self.metrics is None:
+            self.metrics.announced()
+        self.broadcast(self.encode(wire.COORDINATOR), self.live_peers(range(self.num_nodes)))
+        self.set_coordinator(self.node_id)
         self.running_election = False
         self.has_announced = True
-    
-    def send_message(self, msg:bytes, receiver_id):
-        sleep(.01)
-        port = self.base_port + receiver_id
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.settimeout(5)
-            sock.sendto(msg, ("127.0.0.1", port))
-            if not self.message_count is None:
-                self.message_count.value += 1
-    
-    def print2(self, msg, *args, **kwargs):
-        if not self.silent:
-            print(msg, *args, **kwargs)
+        self.mark_done()
+        self.start_heartbeats()
 
 if __name__ == "__main__":
-    parser = ArgumentParser()
-    parser.add_argument("-n", "--num_nodes", type=int, default=5)
-    starter = parser.add_mutually_exclusive_group(required=True)
-    starter.add_argument("-s", "--starters", type=int, nargs="+")
-    starter.add_argument("-S", '--num-starters', type=int)
-    alive = parser.add_mutually_exclusive_group(required=True)
-    alive.add_argument("-a", "--alive", type=int, nargs="+")
-    alive.add_argument("-A", '--num-alive', type=int)
-    parser.add_argument("-p", "--base_port", type=int, default=5000)
-    
-    args = parser.parse_args()
-    
-    num_proc = args.num_nodes
-    if args.num_alive:
-        num_alive = args.num_alive
-        alive_nodes = random.sample(range(num_proc), num_alive)
-        alive_nodes = sorted(alive_nodes)
-    else:
-        alive_nodes = args.alive
-        num_alive = len(alive_nodes)
-        
-    if args.num_starters:
-        num_starters = args.num_starters
-        starter_nodes = random.sample(alive_nodes, num_starters)
-        starter_nodes = sorted(starter_nodes)
-    else:
-        starter_nodes = args.starters
-        num_starters = len(starter_nodes)
-    
-    
-    print(f"{num_proc = }")
-    print(f"{alive_nodes = }")
-    print(f"{starter_nodes = }")
-    
-
-    processes = []
-    message_counts = []
-    coordinator_ids = []
-    for node_id in alive_nodes:
-        starter = node_id in starter_nodes
-        count = Value(c_uint)
-        coordinator = Value(c_uint)
-        p = Node(node_id, num_proc, args.base_port, starter, coordinator, count)
-
-        processes.append(p)
-        message_counts.append(count)
-        coordinator_ids.append(coordinator)
-
-    for p in processes:
-        p.start()
-
-    for p in processes:
-        p.join()
-    
-    print("")
-    for node, count, coord in zip(alive_nodes, message_counts, coordinator_ids):
-        print(f"{node} sent {count.value} messages, and got coordinator {coord.value}")
-    print(f"Total messages sent: {sum(count.value for count in message_counts)}")
-    print("")
-    if all(coordinator_ids[0].value == coordinator_id.value for coordinator_id in coordinator_ids):
-        print(f"Coordinator: {coordinator_ids[0].value}")
-    else:
-        print("No coordinator elected")
-    print("")
-    print(f"{num_proc = }")
-    print(f"{alive_nodes = }")
-    print(f"{starter_nodes = }")
\ No newline at end of file
+    parser = cli.make_parser("send elections and announcements to a multicast group")
+    parser.add_argument("--election-timeout", type=float, default=None, help="fixed election timeout, instead of one adapted to the measured round trip times")
+    parser.add_argument("--min-timeout", type=float, default=MIN_TIMEOUT)
+    parser.add_argument("--max-timeout", type=float, default=None, help="defaults to .2*NUM_NODES")
+    parser.add_argument("--ok-window", type=float, default=0, help="collect the OKs for this many seconds and send them together")
+    args = cli.parse_args(parser)
+    cli.run("standard", Node, args, election_timeout=args.election_timeout, min_timeout=args.min_timeout, max_timeout=args.max_timeout,
+            ok_window=args.ok_window)
@@ -0,0 +1,115 @@
+"""
+Per-node event trace in a preallocated ring buffer.
+
+Every record is four int64s: a `perf_counter_ns` timestamp, the event, a kind and a value. The
+meaning of the last two depends on the event:
+
+    SEND            wire type, receiver id (-1 for a multicast)
+    RECEIVE         wire type (0 if the datagram did not decode), sender id
+    TIMER_ARMED     ELECTION_TIMER or PROBE_TIMER, timeout in microseconds
+    TIMER_FIRED     ELECTION_TIMER, PROBE_TIMER or HEARTBEAT_TIMER (the coordinator missed its heartbeats), 0
+    STATE           ELECTION_STARTED, ELECTION_STOPPED, COORDINATOR or DONE, the coordinator for COORDINATOR
+
+When the buffer is full the oldest records are overwritten. `dump` writes the records, oldest first,
+as a `.npy` file with a structured dtype, without needing NumPy in the nodes. `perf_counter_ns` is
+the system wide monotonic clock on Linux, so the traces of all nodes of a run can be merged by time:
+
+    python tracing.py traces/*.npy
+"""
+from array import array
+from itertools import count
+from time import perf_counter_ns
+import argparse
+
+SEND = 1
+RECEIVE = 2
+TIMER_ARMED = 3
+TIMER_FIRED = 4
+STATE = 5
+
+ELECTION_TIMER = 1
+PROBE_TIMER = 2
+HEARTBEAT_TIMER = 3
+
+ELECTION_STARTED = 1
+ELECTION_STOPPED = 2
+COORDINATOR = 3
+DONE = 4
+
+FIELDS = ("time", "event", "kind", "value")
+DTYPE = [(field, "<i8") for field in FIELDS]
+
+EVENT_NAMES = {SEND: "send", RECEIVE: "receive", TIMER_ARMED: "timer armed", TIMER_FIRED: "timer fired", STATE: "state"}
+TIMER_NAMES = {ELECTION_TIMER: "election", PROBE_TIMER: "probe", HEARTBEAT_TIMER: "heartbeat"}
+STATE_NAMES = {ELECTION_STARTED: "election started", ELECTION_STOPPED: "election stopped", COORDINATOR: "coordinator", DONE: "done"}
+
+
+class Trace:
+    """
+    Records are kept as tuples in a list of fixed length, a single store per event is cheaper in
+    Python than four stores into an `array` (about 0.25 vs 0.45 us), and they are packed when dumped.
+    """
+    def __init__(self, capacity: int = 4096) -> None:
+        self.capacity = capacity
+        self.records = [None]*capacity
+        # next() on a count is atomic under the GIL, so threads of a node never get the same slot
+        self.counter = count()
+
+    def record(self, event: int, kind: int = 0, value: int = 0) -> None:
+        self.records[next(self.counter) % self.capacity] = (perf_counter_ns(), event, kind, value)
+
+    def ordered(self) -> list[tuple[int, int, int, int]]:
+        """The records, oldest first. Only meant for once the node has stopped recording."""
+        total = next(self.counter)
+        if total <= self.capacity:
+            return self.records[:total]
+        start = total % self.capacity
+        return self.records[start:] + self.records[:start]
+
+    def dump(self, path: str) -> None:
+        ordered = self.ordered()
+        records = array("q", [field for record in ordered for field in record])
+        header = repr({"descr": DTYPE, "fortran_order": False, "shape": (len(ordered),)})
+        # .npy version 1.0: magic, header length and a header padded so the data starts 64 byte aligned
+        padding = 64 - (10 + len(header) + 1) % 64
+        header = (header + " "*padding + "\n").encode("latin1")
+        with open(path, "wb") as f:
+            f.write(b"\x93NUMPY\x01\x00")
+            f.write(len(header).to_bytes(2, "little"))
+            f.write(header)
+            f.write(records.tobytes())
+
+
+def describe(event: int, kind: int, value: int) -> str:
+    if event in (SEND, RECEIVE):
+        import wire
+        name = wire.NAMES.get(kind, "garbage")
+        return f"{EVENT_NAMES[event]} {name} {'to' if event == SEND else 'from'} {value}"
+    if event == TIMER_ARMED:
+        return f"{TIMER_NAMES.get(kind, kind)} timer armed for {value/1000:.1f} ms"
+    if event == TIMER_FIRED:
+        return f"{TIMER_NAMES.get(kind, kind)} timer fired"
+    if event == STATE:
+        return STATE_NAMES.get(kind, str(kind)) + (f" {value}" if kind == COORDINATOR else "")
+    return f"{event} {kind} {value}"
+
+
+def load(path: str):
+    import numpy as np
+    return np.load(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the traces of one or more nodes as one timeline")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    events = []
+    for path in args.files:
+        for record in load(path):
+            events.append((int(record["time"]), path, int(record["event"]), int(record["kind"]), int(record["value"])))
+    events.sort()
+    if events:
+        t0 = events[0][0]
+        for t, path, event, kind, value in events:
+            print(f"{(t - t0)/1e6:10.3f} ms  {path}: {describe(event, kind, value)}")
@@ -0,0 +1,656 @@
+"""
+How the nodes reach each other.
+
+A transport gives a node an endpoint to listen on (`bind`) and sends datagrams to a node id (`send`).
+Endpoints behave like non-blocking datagram sockets to the listener: they have a `fileno` for the
+selector, and `recvfrom` raises BlockingIOError when nothing is waiting.
+
+    udp     127.0.0.1:base_port+id, the default and the only one with multicast
+    unix    AF_UNIX datagram sockets, no ports to run out of and no IP stack on the way
+    queue   in-process queues with an eventfd for the selector, only for nodes running as threads
+    shm     a ring per sender in a shared memory inbox of each node, for threads and processes
+
+Like UDP, every transport drops a datagram for a node that isn't there, or whose queue is full.
+The listener takes everything waiting on an endpoint at once with `drain`. On UDP sockets that also
+brings the kernel's count of datagrams it dropped because the receive buffer was full.
+"""
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+from threading import Lock
+from time import perf_counter, sleep
+import atexit
+import mmap
+import os
+import socket
+import sys
+import tempfile
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Not on Windows, where there is no shm transport either
+
+TRANSPORTS = ("udp", "unix", "queue", "shm")
+# A unix datagram socket only queues net.unix.max_dgram_qlen datagrams (often just 10), a send to a
+# full one is retried after these pauses before it is dropped
+UNIX_RETRIES = (.0005, .001, .002, .004, .008)
+# Datagrams the listener takes off one endpoint per wakeup
+RECV_BATCH = 64
+# The socket option for the count of datagrams dropped on a full receive buffer, Linux only and not named by Python
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40) if sys.platform.startswith("linux") else None
+ANCILLARY_SIZE = socket.CMSG_SPACE(4) if SO_RXQ_OVFL is not None else 0
+
+# Shared memory inboxes: a ring of SHM_SLOTS slots per sender, each slot a length byte and the datagram
+SHM_SLOTS = 32
+SHM_SLOT_SIZE = 64
+# The first cache line of an inbox: the number of rings, whether the node closed it, and whether it sleeps
+NUM_RINGS, CLOSED, SLEEPING = range(3)
+CACHE_LINE = 64
+# Where POSIX shared memory shows up as files, on Linux
+SHM_DIR = "/dev/shm"
+
+
+class UdpTransport:
+    name = "udp"
+
+    def __init__(self, base_port: int) -> None:
+        self.base_port = base_port
+
+    def address(self, node_id: int):
+        return ("127.0.0.1", self.base_port + node_id)
+
+    def bind(self, node_id: int, rcvbuf: int = None) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        configure_receive(sock, rcvbuf)
+        sock.bind(self.address(node_id))
+        sock.setblocking(False)
+        return sock
+
+    def socket(self, node_id: int = None) -> socket.socket:
+        """An unbound endpoint, for sending only. Only the shm transport needs to know who sends."""
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, sock, msg: bytes, node_id: int) -> None:
+        sock.sendto(msg, self.address(node_id))
+
+    def send_to(self, node_id: int, msg: bytes) -> None:
+        """Send one datagram from outside the nodes, like an exit message."""
+        with self.socket() as sock:
+            self.send(sock, msg, node_id)
+
+
+class UnixTransport(UdpTransport):
+    """
+    On Linux the sockets live in the abstract namespace, elsewhere they are files in the temp
+    directory. Unlike UDP, sending to a missing socket or a full queue is an error. The first is
+    dropped right away, the second after `UNIX_RETRIES`.
+    """
+    name = "unix"
+
+    def __init__(self, base_port: int, prefix: str = "bully") -> None:
+        super().__init__(base_port)
+        self.prefix = prefix
+
+    def address(self, node_id: int) -> str:
+        if sys.platform.startswith("linux"):
+            return f"\0{self.prefix}-{self.base_port}-{node_id}"
+        return os.path.join(tempfile.gettempdir(), f"{self.prefix}-{self.base_port}-{node_id}.sock")
+
+    def bind(self, node_id: int, rcvbuf: int = None) -> socket.socket:
+        address = self.address(node_id)
+        if not address.startswith("\0") and os.path.exists(address):
+            os.unlink(address) # Left over from a node that didn't clean up
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        configure_receive(sock, rcvbuf)
+        sock.bind(address)
+        sock.setblocking(False)
+        return sock
+
+    def socket(self, node_id: int = None) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        return sock
+
+    def send(self, sock, msg: bytes, node_id: int) -> None:
+        address = self.address(node_id)
+        for pause in UNIX_RETRIES + (None,):
+            try:
+                sock.sendto(msg, address)
+                return
+            except (ConnectionRefusedError, FileNotFoundError):
+                return
+            except BlockingIOError:
+                if pause is not None:
+                    sleep(pause)
+
+
+def configure_receive(sock: socket.socket, rcvbuf: int = None) -> socket.socket:
+    """
+    Set the receive buffer to `rcvbuf` bytes (Linux doubles it, and caps it at net.core.rmem_max) and
+    have UDP sockets report their drops.
+    """
+    if rcvbuf is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    if SO_RXQ_OVFL is not None and sock.family == socket.AF_INET:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        except OSError:
+            pass
+    return sock
+
+
+def drain(endpoint, limit: int = RECV_BATCH) -> tuple[list[bytes], int | None]:
+    """
+    Everything waiting on `endpoint`, at most `limit` datagrams, and the drop count of the socket if one
+    came along. The kernel only attaches it to datagrams that arrived after a drop, so it is None
+    until the first one and only ever grows.
+    """
+    datagrams = []
+    drops = None
+    if isinstance(endpoint, socket.socket) and endpoint.family == socket.AF_INET and SO_RXQ_OVFL is not None:
+        while len(datagrams) < limit:
+            try:
+                data, ancdata, _, _ = endpoint.recvmsg(1024, ANCILLARY_SIZE)
+            except BlockingIOError:
+                break
+            datagrams.append(data)
+            for level, kind, value in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                    drops = int.from_bytes(value[:4], sys.byteorder)
+        return datagrams, drops
+
+    while len(datagrams) < limit:
+        try:
+            data, _ = endpoint.recvfrom(1024)
+        except BlockingIOError:
+            break
+        datagrams.append(data)
+    return datagrams, None
+
+
+def kernel_drops(sock) -> int | None:
+    """
+    The drops of a UDP socket as /proc/net/udp shows them, including the ones after the last datagram
+    `drain` saw. None for other endpoints, or where there is no /proc.
+    """
+    if not isinstance(sock, socket.socket) or sock.family != socket.AF_INET or sock.fileno() < 0:
+        return None
+    try:
+        inode = os.fstat(sock.fileno()).st_ino
+        with open("/proc/net/udp") as f:
+            next(f) # The header
+            for line in f:
+                fields = line.split()
+                if int(fields[9]) == inode:
+                    return int(fields[-1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class QueueEndpoint:
+    """A queue of datagrams. The eventfd counts them, so the selector sees it readable while any are left."""
+    def __init__(self, registry: dict = None, key=None) -> None:
+        self.items = deque()
+        self.fd = os.eventfd(0, os.EFD_SEMAPHORE | os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+        self.lock = Lock()
+        self.registry = registry
+        self.key = key
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def put(self, msg: bytes) -> None:
+        with self.lock:
+            if self.fd == -1:
+                return
+            self.items.append(msg)
+            os.eventfd_write(self.fd, 1)
+
+    def recvfrom(self, bufsize: int) -> tuple[bytes, None]:
+        os.eventfd_read(self.fd) # BlockingIOError when the queue is empty
+        return self.items.popleft()[:bufsize], None
+
+    def setblocking(self, flag: bool) -> None:
+        pass
+
+    def close(self) -> None:
+        with self.lock:
+            if self.fd == -1:
+                return
+            if self.registry is not None and self.registry.get(self.key) is self:
+                del self.registry[self.key]
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self) -> "QueueEndpoint":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class NullSocket:
+    """The sending side of the queue transport needs no socket of its own."""
+    def fileno(self) -> int:
+        return -1
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "NullSocket":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+# Endpoints of every queue transport in this process, by (base_port, node id)
+QUEUES = {}
+
+
+class QueueTransport:
+    name = "queue"
+
+    def __init__(self, base_port: int) -> None:
+        if not hasattr(os, "eventfd"):
+            raise ValueError("The queue transport needs eventfd, which only Linux has")
+        self.base_port = base_port
+
+    def bind(self, node_id: int, rcvbuf: int = None) -> QueueEndpoint:
+        if rcvbuf is not None:
+            raise ValueError("The queue transport has no receive buffer to size")
+        key = (self.base_port, node_id)
+        if key in QUEUES:
+            raise OSError(f"Node {node_id} on {self.base_port} is already bound")
+        endpoint = QueueEndpoint(QUEUES, key)
+        QUEUES[key] = endpoint
+        return endpoint
+
+    def socket(self, node_id: int = None) -> NullSocket:
+        return NullSocket()
+
+    def send(self, sock, msg: bytes, node_id: int) -> None:
+        endpoint = QUEUES.get((self.base_port, node_id))
+        if endpoint is not None:
+            endpoint.put(msg)
+
+    def send_to(self, node_id: int, msg: bytes) -> None:
+        self.send(None, msg, node_id)
+
+
+class AttachedSegment:
+    """
+    What `SharedMemory(name, track=False)` does from 3.13 on. Before, opening a segment also tells the
+    resource tracker, which all the node processes share. It would unlink the segment when the first
+    of them exits, and loses track of it when one of them lets go.
+    """
+    def __init__(self, name: str) -> None:
+        fd = os.open(os.path.join(SHM_DIR, name), os.O_RDWR)
+        try:
+            self._mmap = mmap.mmap(fd, os.fstat(fd).st_size) # ValueError while it is still empty
+        finally:
+            os.close(fd)
+        self.buf = memoryview(self._mmap)
+
+    def close(self) -> None:
+        self.buf.release()
+        self._mmap.close()
+
+
+def attach_segment(name: str) -> shared_memory.SharedMemory | AttachedSegment:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    return AttachedSegment(name)
+
+
+def aligned(size: int) -> int:
+    return -(-size // CACHE_LINE) * CACHE_LINE
+
+
+# Taking a lock is a full memory barrier, the only one Python has
+FENCE = Lock()
+
+
+def fence() -> None:
+    """
+    Order a store to the shared memory before the load that follows it. A sender publishes its tail and
+    then reads SLEEPING, the node sets SLEEPING and then reads the tails. Without the barrier both loads
+    can see the old value, and the datagram waits for the next wakeup.
+    """
+    with FENCE:
+        pass
+
+
+class Inbox:
+    """
+    The shared memory of one node. After the header come the tails of every ring, the heads (written
+    by the node only) and the slots. Node ids get the ring of their id and are its only writer.
+    Everyone else (exit messages) shares the last one, possibly from several processes, so those
+    senders take turns on a file lock. Within a process the senders to an inbox take turns on its
+    `lock`, which also keeps it from being closed under a put.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory) -> None:
+        self.shm = shm
+        self.lock = Lock()
+        self.header = shm.buf[:CACHE_LINE].cast("Q")
+        self.num_rings = self.header[NUM_RINGS]
+        if self.num_rings == 0:
+            return # Not set up yet
+        tails = CACHE_LINE
+        heads = tails + aligned(8*self.num_rings)
+        slots = heads + aligned(8*self.num_rings)
+        self.tails = shm.buf[tails:tails + 8*self.num_rings].cast("Q")
+        self.heads = shm.buf[heads:heads + 8*self.num_rings].cast("Q")
+        self.slots = shm.buf[slots:slots + self.num_rings*SHM_SLOTS*SHM_SLOT_SIZE]
+
+    @classmethod
+    def create(cls, name: str, num_rings: int) -> "Inbox":
+        size = CACHE_LINE + 2*aligned(8*num_rings) + num_rings*SHM_SLOTS*SHM_SLOT_SIZE
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left over from a node that didn't clean up
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        header = shm.buf[:CACHE_LINE].cast("Q")
+        header[SLEEPING] = 1 # Until it gets the first datagram, the node waits in the selector
+        header[NUM_RINGS] = num_rings
+        header.release()
+        return cls(shm)
+
+    def put(self, ring: int, msg: bytes) -> bool:
+        """
+        Copy the datagram into the next slot of `ring` and publish it. A full ring is retried like a full
+        unix socket, which only holds up the senders to this inbox. Returns whether the node sleeps and
+        needs a wakeup.
+        """
+        with self.lock:
+            if self.shm is None:
+                return False # Closed in the meantime
+            tail = self.tails[ring]
+            for pause in UNIX_RETRIES + (None,):
+                if self.header[CLOSED]:
+                    return False
+                if tail - self.heads[ring] < SHM_SLOTS:
+                    break
+                if pause is None:
+                    return False
+                sleep(pause)
+            offset = (ring*SHM_SLOTS + tail % SHM_SLOTS)*SHM_SLOT_SIZE
+            self.slots[offset] = len(msg)
+            self.slots[offset + 1:offset + 1 + len(msg)] = msg
+            self.tails[ring] = tail + 1 # Only now the node can see it
+            fence()
+            if not self.header[SLEEPING]:
+                return False
+            self.header[SLEEPING] = 0
+            return True
+
+    def close(self) -> None:
+        with self.lock:
+            if self.shm is None:
+                return
+            views = [self.header] + ([self.tails, self.heads, self.slots] if self.num_rings else [])
+            for view in views:
+                view.release()
+            self.shm.close()
+            self.shm = None
+
+
+# The inboxes this process writes to, by segment name. The lock is only held to look one up or
+# attach it, the puts take turns on the lock of the inbox
+INBOXES = {}
+INBOX_LOCK = Lock()
+
+
+@atexit.register
+def close_inboxes() -> None:
+    """Close the inboxes left attached, before the interpreter would while their memory is still in use."""
+    with INBOX_LOCK:
+        for inbox in INBOXES.values():
+            inbox.close()
+        INBOXES.clear()
+
+
+class ShmSender:
+    def __init__(self, transport: "ShmTransport", node_id: int = None) -> None:
+        self.transport = transport
+        self.node_id = node_id
+        self.wakeup = transport.wakeup.socket()
+        # INBOX_LOCK only covers this process, the shared ring needs one across processes
+        self.lock_file = open(transport.lock_path(), "a") if node_id is None else None
+
+    def inbox(self, node_id: int) -> Inbox | None:
+        """The inbox of `node_id`, attached the first time. Must hold INBOX_LOCK."""
+        name = self.transport.segment_name(node_id)
+        inbox = INBOXES.get(name)
+        if inbox is not None and inbox.header[CLOSED]:
+            # The node is gone, maybe there is a new one
+            del INBOXES[name]
+            inbox.close()
+            inbox = None
+        if inbox is None:
+            try:
+                inbox = Inbox(attach_segment(name))
+            except (FileNotFoundError, ValueError):
+                return None # Nobody there, or the segment is still being created
+            if inbox.num_rings == 0 or inbox.header[CLOSED]:
+                inbox.close()
+                return None
+            INBOXES[name] = inbox
+        return inbox
+
+    def send(self, msg: bytes, node_id: int) -> None:
+        if len(msg) >= SHM_SLOT_SIZE:
+            raise ValueError(f"A {len(msg)} byte datagram does not fit a {SHM_SLOT_SIZE} byte slot")
+        with INBOX_LOCK:
+            inbox = self.inbox(node_id)
+        if inbox is None:
+            return
+        if self.node_id is None:
+            ring = inbox.num_rings - 1
+        elif self.node_id < inbox.num_rings - 1:
+            ring = self.node_id
+        else:
+            raise ValueError(f"The inbox of node {node_id} has no ring for node {self.node_id}")
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            wake = inbox.put(ring, msg)
+        finally:
+            if self.lock_file is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        if wake:
+            self.wake(node_id)
+
+    def wake(self, node_id: int) -> None:
+        """The only system call of a send, and only when the node is about to sleep."""
+        try:
+            self.wakeup.sendto(b"\0", self.transport.wakeup.address(node_id))
+        except (BlockingIOError, ConnectionRefusedError, FileNotFoundError):
+            pass # Already awake, or gone
+
+    def fileno(self) -> int:
+        return self.wakeup.fileno()
+
+    def close(self) -> None:
+        self.wakeup.close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+
+    def __enter__(self) -> "ShmSender":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ShmEndpoint:
+    """
+    A node's inbox, with a unix socket the senders poke when the node sleeps. `recvfrom` takes
+    everything the rings hold at once, and serves the rest without touching the shared memory. The
+    poke stays in the socket until the last datagram is handed out, so the selector keeps returning
+    until then. Two senders can both poke a sleeping node, so now and then the endpoint is readable
+    with nothing to read.
+    """
+    def __init__(self, transport: "ShmTransport", node_id: int, num_rings: int) -> None:
+        self.node_id = node_id
+        self.spin_time = transport.spin
+        self.name = transport.segment_name(node_id)
+        self.wakeup = transport.wakeup.bind(node_id)
+        self.inbox = Inbox.create(self.name, num_rings)
+        self.heads = [0]*num_rings
+        self.pending = deque()
+        self.sender = ShmSender(transport, node_id)
+        with INBOX_LOCK:
+            old = INBOXES.pop(self.name, None)
+            if old is not None:
+                old.close()
+            INBOXES[self.name] = self.inbox
+
+    def fileno(self) -> int:
+        return self.wakeup.fileno()
+
+    def fill(self) -> bool:
+        """Move every published datagram from the rings to `pending`."""
+        tails = self.inbox.tails.tolist()
+        if tails == self.heads:
+            return False
+        slots = self.inbox.slots
+        for ring, tail in enumerate(tails):
+            head = self.heads[ring]
+            if head == tail:
+                continue
+            while head < tail:
+                offset = (ring*SHM_SLOTS + head % SHM_SLOTS)*SHM_SLOT_SIZE
+                self.pending.append(bytes(slots[offset + 1:offset + 1 + slots[offset]]))
+                head += 1
+            self.heads[ring] = head
+            self.inbox.heads[ring] = head # Frees the slots for the sender
+        return True
+
+    def spin(self) -> bool:
+        """Watch the rings for `spin_time` before going to sleep, an answer that comes by then needs no system call at all."""
+        if not self.spin_time:
+            return False
+        deadline = perf_counter() + self.spin_time
+        while perf_counter() < deadline:
+            if self.fill():
+                return True
+        return False
+
+    def settle(self) -> None:
+        """
+        The inbox is about to run dry and the node waits in the selector next. Take the poke that woke
+        it, set SLEEPING and look at the rings once more. If more than the last datagram came in between,
+        the node pokes itself so the selector returns again.
+        """
+        try:
+            self.wakeup.recv(16)
+        except BlockingIOError:
+            pass
+        self.inbox.header[SLEEPING] = 1
+        fence()
+        if self.fill() and len(self.pending) > 1:
+            self.inbox.header[SLEEPING] = 0
+            self.sender.wake(self.node_id)
+
+    def recvfrom(self, bufsize: int) -> tuple[bytes, None]:
+        if not self.pending:
+            self.fill() or self.spin()
+        if len(self.pending) <= 1:
+            self.settle()
+        if not self.pending:
+            raise BlockingIOError
+        return self.pending.popleft()[:bufsize], None
+
+    def send(self, msg: bytes, node_id: int) -> None:
+        self.sender.send(msg, node_id)
+
+    def setblocking(self, flag: bool) -> None:
+        pass
+
+    def close(self) -> None:
+        with INBOX_LOCK:
+            if self.inbox is None:
+                return
+            self.inbox.header[CLOSED] = 1
+            if INBOXES.get(self.name) is self.inbox:
+                del INBOXES[self.name]
+            shm = self.inbox.shm
+            self.inbox.close()
+            shm.unlink()
+            self.inbox = None
+        self.wakeup.close()
+        self.sender.close()
+
+    def __enter__(self) -> "ShmEndpoint":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ShmTransport:
+    """
+    With `spin` an empty inbox is watched for that many seconds before the node sleeps. That only
+    pays off with a core to spare for every node, otherwise the spinning node holds up the sender.
+    """
+    name = "shm"
+
+    def __init__(self, base_port: int, num_nodes: int = None, spin: float = 0) -> None:
+        if sys.version_info < (3, 13) and not os.path.isdir(SHM_DIR):
+            raise ValueError(f"The shm transport needs Python 3.13, or {SHM_DIR}")
+        if fcntl is None:
+            raise ValueError("The shm transport needs fcntl")
+        self.base_port = base_port
+        self.num_nodes = num_nodes
+        self.spin = spin
+        self.wakeup = UnixTransport(base_port, prefix="bully-shm")
+        # Started here, the node processes share it instead of starting one each
+        resource_tracker.ensure_running()
+
+    def segment_name(self, node_id: int) -> str:
+        return f"bully-{self.base_port}-{node_id}"
+
+    def lock_path(self) -> str:
+        """The lock of the senders without a node id. It is left in place, removing a lock file races with its next user."""
+        return os.path.join(tempfile.gettempdir(), f"bully-shm-{self.base_port}.lock")
+
+    def bind(self, node_id: int, rcvbuf: int = None) -> ShmEndpoint:
+        if rcvbuf is not None:
+            raise ValueError("The shm inboxes have a fixed number of slots, there is no receive buffer to size")
+        if self.num_nodes is None:
+            raise ValueError("The shm transport needs the number of nodes to bind")
+        return ShmEndpoint(self, node_id, self.num_nodes + 1)
+
+    def socket(self, node_id: int = None) -> ShmSender:
+        return ShmSender(self, node_id)
+
+    def send(self, sock, msg: bytes, node_id: int) -> None:
+        sock.send(msg, node_id)
+
+    def send_to(self, node_id: int, msg: bytes) -> None:
+        with self.socket() as sock:
+            sock.send(msg, node_id)
+
+
+def make_transport(spec, base_port: int, num_nodes: int = None):
+    """
+    A transport from its name, or the transport itself if it already is one. Only nodes binding
+    shared memory inboxes need `num_nodes`.
+    """
+    if not isinstance(spec, str):
+        return spec
+    match spec:
+        case "udp":
+            return UdpTransport(base_port)
+        case "unix":
+            return UnixTransport(base_port)
+        case "queue":
+            return QueueTransport(base_port)
+        case "shm":
+            return ShmTransport(base_port, num_nodes)
+    raise ValueError(f"Unknown transport {spec}, use one of {', '.join(TRANSPORTS)}")
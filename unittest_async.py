@@ -0,0 +1,71 @@
+from async_bully import run, StandardNode, ImprovedNode
+import unittest
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+def test_integration(variant, num_procs, alive_nodes, starter_nodes, **kwargs):
+    nodes = run(variant, num_procs, starter_nodes, alive_nodes, delay=0.001, timeout=30, **kwargs)
+
+    for node in nodes:
+        logger.debug(f"Node {node.node_id} sent {node.message_count} messages and sees {node.coordinator_id} as coordinator")
+
+    return nodes
+
+
+class TestAsyncBully(unittest.TestCase):
+    def assert_elected(self, nodes, alive_nodes):
+        for node in nodes:
+            self.assertTrue(node.done.done())
+            self.assertEqual(node.coordinator_id, max(alive_nodes))
+
+    def test_standard_integration_1(self):
+        alive_nodes = [0]
+        nodes = test_integration("standard", 1, alive_nodes, [0])
+        self.assert_elected(nodes, alive_nodes)
+        self.assertIsInstance(nodes[0], StandardNode)
+
+    def test_standard_integration_2(self):
+        alive_nodes = [1, 2, 4, 5, 7]
+        nodes = test_integration("standard", 10, alive_nodes, [2, 4])
+        self.assert_elected(nodes, alive_nodes)
+
+    def test_improved_integration_1(self):
+        alive_nodes = [0]
+        nodes = test_integration("improved", 1, alive_nodes, [0])
+        self.assert_elected(nodes, alive_nodes)
+        self.assertIsInstance(nodes[0], ImprovedNode)
+
+    def test_improved_integration_2(self):
+        alive_nodes = [1, 2, 4, 5, 7]
+        nodes = test_integration("improved", 10, alive_nodes, [2, 4])
+        self.assert_elected(nodes, alive_nodes)
+
+    def test_improved_integration_3(self):
+        alive_nodes = [33, 66]
+        nodes = test_integration("improved", 100, alive_nodes, [33])
+        self.assert_elected(nodes, alive_nodes)
+
+    def test_improved_many_nodes(self):
+        alive_nodes = list(range(0, 2000, 2))
+        nodes = test_integration("improved", 2000, alive_nodes, [10])
+        self.assert_elected(nodes, alive_nodes)
+
+    def test_udp_network(self):
+        alive_nodes = [1, 2, 4, 5, 7]
+        for variant in ("standard", "improved"):
+            nodes = test_integration(variant, 10, alive_nodes, [2], port=6000)
+            self.assert_elected(nodes, alive_nodes)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
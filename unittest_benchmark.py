@@ -0,0 +1,66 @@
+from benchmark import scenario, benchmark, regressions, write_json, write_csv, FIELDS
+import unittest
+import tempfile
+import logging
+import argparse
+import json
+import csv
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_scenario(self):
+        alive, starters = scenario(100, .25, 4, seed=3)
+
+        self.assertEqual((alive, starters), scenario(100, .25, 4, seed=3))
+        self.assertEqual(len(alive), 25)
+        self.assertEqual(len(starters), 4)
+        self.assertTrue(set(starters) <= set(alive))
+        self.assertEqual(len(scenario(10, .01, 4, seed=0)[0]), 1)
+
+    def test_simulated_grid(self):
+        results = benchmark([10, 40], [.5, 1.0], [1, 3], mode="simulate")
+        self.assertEqual(len(results), 2*2*2*2)
+        for record in results:
+            logger.debug(record)
+            self.assertEqual(set(record), set(FIELDS))
+            self.assertGreater(record["messages"], 0)
+            self.assertGreater(record["cpu_time"], 0)
+            self.assertGreaterEqual(record["peak_rss_kb"], record["baseline_rss_kb"])
+            if record["variant"] == "improved":
+                self.assertIsNotNone(record["agreement"])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            write_json(results, os.path.join(tmp, "results.json"))
+            write_csv(results, os.path.join(tmp, "results.csv"))
+            with open(os.path.join(tmp, "results.json")) as f:
+                self.assertEqual(json.load(f), results)
+            with open(os.path.join(tmp, "results.csv")) as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual([int(row["messages"]) for row in rows], [record["messages"] for record in results])
+
+    def test_regressions(self):
+        before = {"variant": "improved", "mode": "simulate", "num_nodes": 10, "alive_fraction": 1.0, "num_alive": 10, "num_starters": 1,
+                  "repeat": 0, "seed": 0, "messages": 100, "agreement": 1.0, "cpu_time": 0.5, "peak_rss_kb": 40000}
+        self.assertEqual(regressions([before], [before]), [])
+        self.assertEqual(regressions([{**before, "messages": 110}], [before], tolerance=.2), [])
+
+        found = regressions([{**before, "messages": 200, "agreement": None}], [before], tolerance=.2)
+        self.assertEqual(len(found), 2)
+        self.assertIn("messages", found[0])
+        self.assertIn("agreement", found[1])
+        # Points that are not in the baseline are not compared
+        self.assertEqual(regressions([{**before, "num_nodes": 20, "messages": 200}], [before]), [])
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
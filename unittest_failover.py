@@ -0,0 +1,89 @@
+from metrics import MetricsBlock, SENT, COORDINATOR, FAILOVERS
+from multiprocessing import Barrier
+from time import sleep, monotonic
+from failover import measure_failover, stop_nodes, wait_for_coordinator
+import standard_bully
+import improved_bully
+import unittest
+import logging
+import argparse
+import wire
+
+logger = logging.getLogger(__name__)
+
+
+class TestFailover(unittest.TestCase):
+    def test_failover(self):
+        alive_nodes = [1, 3, 5, 6]
+        for module, port in ((standard_bully, 6000), (improved_bully, 6100)):
+            with MetricsBlock(len(alive_nodes)) as block:
+                ready = Barrier(len(alive_nodes))
+                nodes = [module.Node(node_id, 8, port, node_id == 1, silent=True, metrics=block.slot(slot), execution_mode="thread",
+                                     ready_barrier=ready, heartbeat_interval=.1)
+                         for slot, node_id in enumerate(alive_nodes)]
+                for node in nodes:
+                    node.start()
+                # Let the leader send a few heartbeats before it is stopped
+                self.assertTrue(wait_for_coordinator(block, [0, 1, 2, 3], 6, 10))
+                sleep(.3)
+                detection, failover = measure_failover(block, alive_nodes, port)
+                stop_nodes(port, alive_nodes)
+                for node in nodes:
+                    node.join()
+                results = block.array()
+            logger.debug(f"{module.__name__}: detection {detection}, failover {failover}")
+
+            self.assertEqual(results[:3, COORDINATOR].tolist(), [5, 5, 5])
+            self.assertLess(detection, failover)
+            self.assertLess(failover, 3)
+            # Only the leaders sent heartbeats, the others just listened for them
+            self.assertEqual(results[:2, SENT + wire.HEARTBEAT].tolist(), [0, 0])
+            self.assertGreater(results[3, SENT + wire.HEARTBEAT], 0)
+            self.assertTrue((results[:3, FAILOVERS] > 0).all())
+
+    def test_missed_heartbeat_during_election(self):
+        # Node 3 already answers the election of a lower node for term 4 when the heartbeats of leader 6
+        # run out. It keeps term 4, with term 5 the OK of node 5 to that election would be dropped as stale
+        for module in (standard_bully, improved_bully):
+            node = module.Node(3, 8, 6000, False, silent=True, heartbeat_interval=.1)
+            node.set_term(4)
+            node.coordinator_term = 3
+            node.election_term = 4
+            node.running_election = True
+            node.coordinator = 6
+            node.heartbeat_deadline = monotonic() - 1
+            node.check_heartbeat()
+
+            self.assertEqual(node.term, 4, module.__name__)
+            self.assertEqual(node.current_coordinator(), 3)
+
+    def test_takeover(self):
+        # A higher node that comes up later hears the heartbeats of a lower leader, and takes over
+        for module, port in ((standard_bully, 6200), (improved_bully, 6300)):
+            with MetricsBlock(3) as block:
+                nodes = [module.Node(node_id, 8, port, node_id == 1, silent=True, metrics=block.slot(slot), execution_mode="thread",
+                                     heartbeat_interval=.1)
+                         for slot, node_id in enumerate([1, 3])]
+                for node in nodes:
+                    node.start()
+                self.assertTrue(wait_for_coordinator(block, [0, 1], 3, 10))
+
+                late = module.Node(6, 8, port, False, silent=True, metrics=block.slot(2), execution_mode="thread", heartbeat_interval=.1)
+                late.start()
+                agreed = wait_for_coordinator(block, [0, 1, 2], 6, 10)
+                stop_nodes(port, [1, 3, 6])
+                for node in nodes + [late]:
+                    node.join()
+
+            self.assertTrue(agreed)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,53 @@
+from fuzz import scenario, elect, correct, shrink, fuzz
+import unittest
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+class TestFuzz(unittest.TestCase):
+    def test_scenario(self):
+        for seed in range(200):
+            run = scenario(seed, max_nodes=30, max_starters=3)
+            self.assertEqual(run, scenario(seed, max_nodes=30, max_starters=3))
+            self.assertLessEqual(run["num"], 30)
+            self.assertTrue(0 < len(run["starters"]) <= 3)
+            self.assertTrue(set(run["starters"]) <= set(run["alive"]))
+            self.assertTrue(all(0 <= node_id < run["num"] for node_id in run["alive"]))
+
+    def test_shrink(self):
+        # A made up bug: fails whenever node 5 is alive and node 2 starts
+        fails = lambda run: 5 in run["alive"] and 2 in run["starters"]
+        run = {"num": 20, "alive": [1, 2, 3, 5, 8, 13], "starters": [1, 2, 13]}
+
+        self.assertEqual(shrink(run, fails), {"num": 6, "alive": [2, 5], "starters": [2]})
+
+    def test_shrink_renumbers(self):
+        # Fails whenever the two highest alive nodes start
+        fails = lambda run: len(run["alive"]) > 1 and set(run["alive"][-2:]) <= set(run["starters"])
+        run = {"num": 20, "alive": [4, 9, 15], "starters": [9, 15]}
+
+        self.assertEqual(shrink(run, fails), {"num": 2, "alive": [0, 1], "starters": [0, 1]})
+
+    def test_simulated(self):
+        failures = fuzz(300, max_nodes=30)
+        self.assertEqual(failures, [])
+
+    def test_threads(self):
+        for seed in range(3):
+            run = scenario(seed, max_nodes=10)
+            coordinators = elect("improved", run, "thread", port=5900)
+            logger.debug(f"{run}: {coordinators}")
+            self.assertTrue(correct(run, coordinators))
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
@@ -11,7 +11,7 @@ import argparse
 
 logger = logging.getLogger(__name__)
 
-def test_integration(num_procs, alive_nodes, starter_nodes):
+def test_integration(num_procs, alive_nodes, starter_nodes, **node_options):
     processes = []
     message_counts = []
     coordinator_ids = []
@@ -19,7 +19,7 @@ def test_integration(num_procs, alive_nodes, starter_nodes):
         starter = node_id in starter_nodes
         count = Value(c_uint)
         coordinator = Value(c_uint)
-        p = Node(node_id, num_procs, 5000, starter, coordinator, count, silent=True)
+        p = Node(node_id, num_procs, 5000, starter, coordinator, count, silent=True, **node_options)
         
         processes.append(p)
         message_counts.append(count)
@@ -68,8 +68,9 @@ def base_unit_test_setup(num_nodes,
                          listener_timeout=1, 
                          port = 4000, 
                          silent=True, 
-                         responders:dict[int,list[tuple[str,str,int]]]=None):
-    n = Node(test_node_id, num_nodes, port, False, Value(c_uint), Value(c_uint), silent=silent)
+                         responders:dict[int,list[tuple[str,str,int]]]=None,
+                         **node_options):
+    n = Node(test_node_id, num_nodes, port, False, Value(c_uint), Value(c_uint), silent=silent, wire_format="text", **node_options)
     
     q = Queue()
     listeners = []
@@ -206,6 +207,18 @@ class TestBully(unittest.TestCase):
         for c in coordinator_ids:
             self.assertEqual(c.value, max(alive_nodes))
 
+    def test_bully_integration_windowed(self):
+        num_procs = 100
+        alive_nodes = [5, 40, 66]
+        starter_nodes = [5]
+
+        message_counts, coordinator_ids = test_integration(num_procs, alive_nodes, starter_nodes, probe_window=8)
+
+        for node, coordinator in zip(alive_nodes, coordinator_ids):
+            logger.debug(f"Node {node} sees {coordinator.value} as coordinator")
+
+        for c in coordinator_ids:
+            self.assertEqual(c.value, max(alive_nodes))
 
     # - Send message
     def test_send_message(self):
@@ -226,7 +239,7 @@ class TestBully(unittest.TestCase):
         t = Thread(target=listen, args=(5000, 1, q))
         t.start()
         
-        n = Node(0, 2, 5000, False, Value(c_uint), Value(c_uint), silent=True)
+        n = Node(0, 2, 5000, False, Value(c_uint), Value(c_uint), silent=True, wire_format="text")
         n.announce_coordinator()
         
         sleep(.5)
@@ -318,6 +331,47 @@ class TestBully(unittest.TestCase):
         self.assertEqual(len(unexpected_msgs), 0)
 
         
+    # - Run election (windowed, the highest node that answered is gone before it announces)
+    def test_run_election_windowed_top_gone(self):
+        num_nodes = 6
+        node_id = 1 # ID of tested node
+        port = 5000
+        n, q, ls = base_unit_test_setup(num_nodes, 
+                                        node_id, 
+                                        msg_count=6, 
+                                        listener_timeout=.5, 
+                                        port=port, 
+                                        responders = 
+                                            {
+                                                5: [
+                                                    (b"probe 1", b"alive 5", 1)
+                                                ],
+                                                3: [
+                                                    (b"probe 1", b"alive 3", 1),
+                                                    (b"are_you_alive 1", b"coordinator 3", 1)
+                                                ]
+                                            },
+                                        probe_window=8
+                                        )
+        
+        n.is_starter = True
+        n.start()
+        
+        for l in ls:
+            l.join()
+        n.join()
+        
+        received = []
+        while not q.empty():
+            received.append(q.get())
+        
+        # Node 5 is asked twice, then the scan starts over without it and ends at node 3, never below it
+        self.assertEqual(received.count((5, b"are_you_alive 1")), 2)
+        self.assertIn((3, b"are_you_alive 1"), received)
+        self.assertNotIn(b"coordinator 1", [msg for _, msg in received])
+        self.assertEqual(n.coordinator_id.value, 3)
+
+        
     # - Run election (no response)
     def test_run_election_no_response(self):
         num_nodes = 5
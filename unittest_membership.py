@@ -0,0 +1,112 @@
+from metrics import MetricsBlock, SENT, SKIPPED
+from multiprocessing import Barrier
+from time import sleep
+from membership import Membership
+from failover import measure_failover, stop_nodes, wait_for_coordinator
+import standard_bully
+import improved_bully
+import unittest
+import logging
+import argparse
+import wire
+
+logger = logging.getLogger(__name__)
+
+
+class TestMembership(unittest.TestCase):
+    def test_cache(self):
+        members = Membership(2, ttl=.2)
+        self.assertEqual(members.alive(range(6)), [0, 1, 2, 3, 4, 5])
+
+        members.suspect([2, 3, 5])
+        self.assertEqual(members.alive(range(6)), [0, 1, 2, 4])
+        members.seen(5)
+        self.assertEqual(members.alive(range(6)), [0, 1, 2, 4, 5])
+
+        self.assertEqual(members.sweep(), [])
+        sleep(.3)
+        self.assertEqual(members.sweep(), [3])
+        self.assertEqual(members.alive([3, 5]), [3, 5])
+
+    def test_expect(self):
+        members = Membership(2, ttl=.2)
+        members.expect([0, 1, 3], timeout=.1)
+        self.assertEqual(members.alive(range(4)), [0, 1, 2, 3])
+        members.seen(1)
+        sleep(.15)
+        self.assertEqual(members.alive(range(4)), [1, 2])
+        sleep(.2)
+        self.assertEqual(sorted(members.sweep()), [0, 3])
+
+    def test_heartbeats_skip_dead_followers(self):
+        # Without retransmits only the answers to the heartbeats tell leader 5 that 0, 1, 3 and 4 are down
+        alive_nodes = [2, 5]
+        with MetricsBlock(len(alive_nodes)) as block:
+            ready = Barrier(len(alive_nodes))
+            nodes = [standard_bully.Node(node_id, 8, 8100, node_id == 2, silent=True, metrics=block.slot(slot), execution_mode="thread",
+                                         ready_barrier=ready, heartbeat_interval=.1, membership_ttl=10)
+                     for slot, node_id in enumerate(alive_nodes)]
+            for node in nodes:
+                node.start()
+            agreed = wait_for_coordinator(block, [0, 1], 5, 10)
+            sleep(.5) # Longer than the heartbeat timeout
+            peers = nodes[1].membership.alive(range(8))
+            stop_nodes(8100, alive_nodes)
+            for node in nodes:
+                node.join()
+            results = block.array()
+
+        self.assertTrue(agreed)
+        self.assertEqual(peers, [2, 5])
+        self.assertGreater(results[1, SKIPPED], 0)
+        self.assertGreater(results[0, SENT + wire.ACK], 0)
+
+    def test_announce_skips_timed_out(self):
+        # Node 5 hears no OK from 6 and 7, so its announcement leaves them out
+        alive_nodes = [2, 5]
+        with MetricsBlock(len(alive_nodes)) as block:
+            ready = Barrier(len(alive_nodes))
+            nodes = [standard_bully.Node(node_id, 8, 6400, node_id == 5, silent=True, metrics=block.slot(slot), execution_mode="thread",
+                                         ready_barrier=ready, membership_ttl=10)
+                     for slot, node_id in enumerate(alive_nodes)]
+            for node in nodes:
+                node.start()
+            for node in nodes:
+                node.join()
+            results = block.array()
+
+        self.assertEqual(results[:, SENT + wire.COORDINATOR].tolist(), [0, 6])
+        self.assertEqual(results[:, SKIPPED].tolist(), [0, 2])
+
+    def test_failover(self):
+        # After the first election the survivors know 13 to 19 are down, and don't ask them again
+        alive_nodes = [1, 3, 5, 9, 12]
+        for module, port in ((standard_bully, 6500), (improved_bully, 6600)):
+            with MetricsBlock(len(alive_nodes)) as block:
+                ready = Barrier(len(alive_nodes))
+                nodes = [module.Node(node_id, 20, port, node_id == 1, silent=True, metrics=block.slot(slot), execution_mode="thread",
+                                     ready_barrier=ready, heartbeat_interval=.1, membership_ttl=10)
+                         for slot, node_id in enumerate(alive_nodes)]
+                for node in nodes:
+                    node.start()
+                detection, failover = measure_failover(block, alive_nodes, port)
+                stop_nodes(port, alive_nodes)
+                for node in nodes:
+                    node.join()
+                results = block.array()
+            logger.debug(f"{module.__name__}: detection {detection}, failover {failover}, skipped {results[:, SKIPPED].tolist()}")
+
+            self.assertEqual([node.current_coordinator() for node in nodes[:4]], [9, 9, 9, 9])
+            self.assertGreater(results[:, SKIPPED].sum(), 0)
+            self.assertLess(failover, 3)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
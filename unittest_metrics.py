@@ -0,0 +1,164 @@
+from metrics import MetricsBlock, SENT, RECEIVED, DATAGRAMS, DROPS, ELECTION_START, ELECTION_END, COORDINATOR, TEARDOWN, READY, ANNOUNCE, SLOT_SIZE
+import metrics
+from multiprocessing import Process, Barrier
+from threading import Thread
+from time import sleep, monotonic_ns
+import standard_bully
+import improved_bully
+import unittest
+import socket
+import logging
+import argparse
+import wire
+
+logger = logging.getLogger(__name__)
+
+
+def hammer(slot, kind, times):
+    for _ in range(times):
+        slot.count_sent(kind, 1, 1)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_layout(self):
+        with MetricsBlock(3) as block:
+            results = block.array()
+            self.assertEqual(results.shape, (3, SLOT_SIZE))
+            self.assertEqual(results[:, COORDINATOR].tolist(), [-1, -1, -1])
+            self.assertEqual(results[:, DATAGRAMS].tolist(), [0, 0, 0])
+
+    def test_threads_in_one_node(self):
+        with MetricsBlock(1) as block:
+            slot = block.slot(0)
+            threads = [Thread(target=hammer, args=(slot, wire.OK, 10000)) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            self.assertEqual(block.array()[0, SENT + wire.OK], 40000)
+            self.assertEqual(block.messages_sent(), [40000])
+
+    def test_processes_write_own_slots(self):
+        with MetricsBlock(4) as block:
+            processes = [Process(target=hammer, args=(block.slot(i), wire.ELECTION, 1000*(i+1))) for i in range(4)]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join()
+
+            results = block.array()
+            self.assertEqual(results[:, SENT + wire.ELECTION].tolist(), [1000, 2000, 3000, 4000])
+            self.assertEqual(results[:, DATAGRAMS].tolist(), [1000, 2000, 3000, 4000])
+
+    def test_election_timestamps(self):
+        with MetricsBlock(1) as block:
+            slot = block.slot(0)
+            slot.election_started()
+            first = slot[ELECTION_START]
+            slot.election_started()
+            slot.election_ended(5)
+
+            self.assertEqual(slot[ELECTION_START], first)
+            self.assertGreaterEqual(slot[ELECTION_END], first)
+            self.assertEqual(block.coordinators(), [5])
+
+    def test_convergence(self):
+        # Node 0 starts at 10, node 2 announces at 20, and the nodes adopt it at 25, 30 and 22
+        self.assertEqual(metrics.convergence([10, None, 12], [None, None, 20], [25, 30, 22], [6, 6, 6]), (10, 20, 5, 10))
+        self.assertEqual(metrics.convergence([10, None, 12], [None, 15, 20], [25, 30, 22], [6, 5, 6]), (5, None, None, None))
+        self.assertEqual(metrics.convergence([None, None], [None, None], [None, None], [-1, -1]), (None, None, None, None))
+        self.assertEqual(metrics.percentile([3, 1, 2, 4], 50), 2)
+        self.assertEqual(metrics.percentile(list(range(1, 201)), 99), 198)
+
+    def test_nodes(self):
+        alive_nodes = [1, 3, 6]
+        runs = [(module, port, mode) for module, port in ((standard_bully, 5300), (improved_bully, 5400)) for mode in ("process", "thread")]
+        for module, port, mode in runs:
+            with MetricsBlock(len(alive_nodes)) as block:
+                start = monotonic_ns()
+                processes = [module.Node(node_id, 8, port, node_id == 1, silent=True, metrics=block.slot(slot), execution_mode=mode)
+                             for slot, node_id in enumerate(alive_nodes)]
+                for p in processes:
+                    p.start()
+                for p in processes:
+                    p.join()
+
+                results = block.array()
+                startup, election, teardown = block.phases(start, monotonic_ns())
+                first_announce, agreement, p50, p99 = block.convergence()
+            logger.debug(f"{module.__name__} {mode}: {results[:, :DATAGRAMS+1].sum(axis=0)}, startup {startup}, election {election}, teardown {teardown}")
+            logger.debug(metrics.format_convergence((first_announce, agreement, p50, p99)))
+
+            self.assertTrue((results[:, READY] > 0).all())
+            self.assertGreater(election, 0)
+            self.assertEqual(results[:, ANNOUNCE].tolist()[:2], [0, 0])
+            self.assertGreater(first_announce, 0)
+            self.assertAlmostEqual(agreement, election)
+            self.assertLessEqual(p50, p99)
+
+            self.assertEqual(results[:, COORDINATOR].tolist(), [6, 6, 6])
+            self.assertEqual(results[:, SENT:RECEIVED].sum(), results[:, DATAGRAMS].sum())
+            self.assertEqual(results[:, SENT + wire.COORDINATOR].sum(), 8)
+            self.assertGreater(results[0, ELECTION_START], 0)
+            self.assertTrue((results[:, ELECTION_END] > 0).all())
+            # The listeners are woken up when the node is done, instead of polling once a second
+            self.assertTrue((results[:, TEARDOWN] < 5e8).all())
+
+    def test_ready_barrier(self):
+        # Node 0 probes the top node first, so it must not start before all 100 listeners are up
+        num_nodes = 100
+        ready = Barrier(num_nodes)
+        with MetricsBlock(num_nodes) as block:
+            start = monotonic_ns()
+            processes = [improved_bully.Node(node_id, num_nodes, 5600, node_id == 0, silent=True, metrics=block.slot(node_id), ready_barrier=ready)
+                         for node_id in range(num_nodes)]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join()
+
+            results = block.array()
+            startup, election, teardown = block.phases(start, monotonic_ns())
+        logger.debug(f"startup {startup}, election {election}, teardown {teardown}")
+
+        self.assertEqual(results[:, COORDINATOR].tolist(), [num_nodes - 1]*num_nodes)
+        self.assertGreaterEqual(results[0, ELECTION_START], results[:, READY].max())
+
+    def test_drops(self):
+        with MetricsBlock(1) as block:
+            n = standard_bully.Node(1, 2, 5500, False, silent=True, metrics=block.slot(0))
+            t = Thread(target=n.listener)
+            t.start()
+            sleep(.1)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.sendto(b"garbage", ("127.0.0.1", 5501))
+                # Unknown types, one that would land on a later field and one past the slot
+                sock.sendto(wire.HEADER.pack(wire.VERSION, 20, 3, 0, 0), ("127.0.0.1", 5501))
+                sock.sendto(wire.HEADER.pack(wire.VERSION, 200, 3, 0, 0), ("127.0.0.1", 5501))
+                sock.sendto(wire.encode(wire.COORDINATOR, 1), ("127.0.0.1", 5501))
+                sock.sendto(b"exit", ("127.0.0.1", 5501))
+            t.join()
+
+            results = block.array()
+            self.assertEqual(results[0, DROPS], 3)
+            self.assertEqual(results[0, RECEIVED + wire.COORDINATOR], 1)
+            self.assertEqual(results[0, COORDINATOR], 1)
+
+            # The slot itself doesn't trust the type either
+            slot = block.slot(0)
+            slot.count_received(200)
+            self.assertEqual(block.array()[0, DROPS], 4)
+            with self.assertRaises(ValueError):
+                slot.count_sent(-1, 1, 1)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,47 @@
+from pacing import NoPacing, FixedDelay, TokenBucket, PerDestinationRate, make_pacer
+import unittest
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+class TestPacing(unittest.TestCase):
+    def test_make_pacer(self):
+        self.assertIsInstance(make_pacer("none"), NoPacing)
+        self.assertEqual(make_pacer("fixed").delay, 0.01)
+        self.assertEqual(make_pacer("fixed:0.5").delay, 0.5)
+        self.assertEqual(make_pacer("bucket:100:10").burst, 10)
+        self.assertIsInstance(make_pacer("dest:100"), PerDestinationRate)
+        with self.assertRaises(ValueError):
+            make_pacer("sometimes")
+
+    def test_fixed_delay(self):
+        pacer = FixedDelay(0.2)
+        self.assertEqual([pacer.reserve(i) for i in range(3)], [0.2, 0.2, 0.2])
+
+    def test_token_bucket_burst(self):
+        # The burst goes out at once, after that messages are spaced by 1/rate
+        pacer = TokenBucket(10, burst=3)
+        delays = [pacer.reserve(1) for _ in range(5)]
+        self.assertEqual(delays[:3], [0, 0, 0])
+        self.assertAlmostEqual(delays[3], 0.1, places=2)
+        self.assertAlmostEqual(delays[4], 0.2, places=2)
+
+    def test_per_destination_rate(self):
+        # A fan-out to different receivers is not paced, repeated sends to one receiver are
+        pacer = PerDestinationRate(10)
+        self.assertEqual([pacer.reserve(i) for i in range(5)], [0]*5)
+        self.assertAlmostEqual(pacer.reserve(0), 0.1, places=2)
+        self.assertAlmostEqual(pacer.reserve(0), 0.2, places=2)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,103 @@
+from metrics import MetricsBlock, RETRANSMITS, KERNEL_DROPS
+from multiprocessing import Barrier
+from reliable import Reliability
+import standard_bully
+import fuzz
+import unittest
+import contextlib
+import io
+import logging
+import argparse
+import wire
+
+logger = logging.getLogger(__name__)
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestReliable(unittest.TestCase):
+    def test_retransmits(self):
+        clock = Clock()
+        reliable = Reliability(.125, retries=2, clock=clock)
+        election = wire.encode(wire.ELECTION, 1, seq=reliable.next_seq())
+        reliable.sent(election, 2)
+        reliable.sent(election, 3)
+        reliable.sent(wire.encode(wire.HEARTBEAT, 1), 2) # Not reliable, not kept
+        self.assertTrue(reliable.waiting((wire.ELECTION,)))
+        self.assertEqual(reliable.due(), ([], []))
+
+        # The timeout doubles with every retransmit, then the receiver is given up on
+        clock.now = .125
+        self.assertEqual(reliable.due(), ([(election, 2), (election, 3)], []))
+        self.assertTrue(reliable.acked(3, wire.peek_seq(election)))
+        self.assertFalse(reliable.acked(3, wire.peek_seq(election)))
+        clock.now = .25
+        self.assertEqual(reliable.due(), ([], []))
+        clock.now = .375
+        self.assertEqual(reliable.due(), ([(election, 2)], []))
+        self.assertEqual(reliable.next_deadline(), .875)
+        clock.now = .875
+        self.assertEqual(reliable.due(), ([], [2]))
+        self.assertFalse(reliable.busy())
+
+        ok = wire.encode(wire.OK, 1, seq=reliable.next_seq())
+        reliable.sent(ok, 0)
+        self.assertEqual(reliable.cancel(wire.ELECTION), 0)
+        self.assertEqual(reliable.cancel(wire.OK, [0]), 1)
+        self.assertFalse(reliable.waiting((wire.OK,)))
+
+    def test_duplicates(self):
+        reliable = Reliability(.1)
+        self.assertTrue(reliable.received(2, 17))
+        self.assertFalse(reliable.received(2, 17))
+        self.assertTrue(reliable.received(3, 17))
+
+        reliable.seq = 2**32 - 2
+        self.assertEqual([reliable.next_seq() for _ in range(3)], [2**32 - 1, 1, 2])
+
+    def test_simulated_loss(self):
+        # With 5% of the datagrams lost, elections go wrong unless they are retransmitted
+        with contextlib.redirect_stdout(io.StringIO()):
+            lossy = fuzz.fuzz(100, shrink_failures=False, max_nodes=30, loss=.05)
+        reliable = fuzz.fuzz(100, shrink_failures=False, max_nodes=30, loss=.05, retransmit_timeout=.02)
+        logger.debug(f"{len(lossy)} failed without retransmits")
+
+        self.assertGreater(len(lossy), 0)
+        self.assertEqual(reliable, [])
+
+    def test_kernel_drops(self):
+        # Receive buffers too small for an unpaced election lose datagrams on real sockets, with a short election timeout
+        alive_nodes = list(range(30))
+        with MetricsBlock(len(alive_nodes)) as block:
+            ready = Barrier(len(alive_nodes))
+            nodes = [standard_bully.Node(node_id, 30, 7600, node_id < 10, silent=True, metrics=block.slot(slot), execution_mode="thread",
+                                         ready_barrier=ready, pacing="none", rcvbuf=1024, election_timeout=.3,
+                                         retransmit_timeout=.02, retries=5)
+                     for slot, node_id in enumerate(alive_nodes)]
+            for node in nodes:
+                node.start()
+            for node in nodes:
+                node.join()
+            coordinators = block.coordinators()
+            results = block.array()
+        logger.debug(f"kernel drops {results[:, KERNEL_DROPS].sum()}, retransmits {results[:, RETRANSMITS].sum()}")
+
+        self.assertEqual(coordinators, [29]*30)
+        self.assertGreater(results[:, RETRANSMITS].sum(), 0)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
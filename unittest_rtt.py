@@ -0,0 +1,56 @@
+from rtt import RttEstimator, FixedTimeout, make_estimator
+import unittest
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+class TestRtt(unittest.TestCase):
+    def test_initial(self):
+        self.assertEqual(RttEstimator(initial=1.0).timeout(), 1.0)
+
+    def test_first_sample(self):
+        # srtt = rtt, rttvar = rtt/2, so the timeout is three times the first sample
+        estimator = RttEstimator(min_timeout=0)
+        estimator.sample(0.1)
+        self.assertAlmostEqual(estimator.timeout(), 0.3)
+
+    def test_converges(self):
+        estimator = RttEstimator(min_timeout=0)
+        for _ in range(100):
+            estimator.sample(0.02)
+        self.assertAlmostEqual(estimator.srtt, 0.02)
+        self.assertLess(estimator.timeout(), 0.03)
+
+    def test_bounds(self):
+        estimator = RttEstimator(min_timeout=0.5, max_timeout=2)
+        estimator.sample(0.01)
+        self.assertEqual(estimator.timeout(), 0.5)
+        estimator.sample(10)
+        self.assertEqual(estimator.timeout(), 2)
+
+    def test_make_estimator(self):
+        fixed = make_estimator(10, election_timeout=3)
+        self.assertIsInstance(fixed, FixedTimeout)
+        fixed.sample(0.01)
+        self.assertEqual(fixed.timeout(), 3)
+
+        self.assertEqual(make_estimator(100).max_timeout, 20)
+
+        # Loopback round trips bring the default timeout well below the initial second
+        adaptive = make_estimator(10)
+        for _ in range(10):
+            adaptive.sample(0.012)
+        self.assertLess(adaptive.timeout(), 0.5)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
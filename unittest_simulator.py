@@ -0,0 +1,116 @@
+from simulator import simulate, convergence_time, VirtualLoop
+from async_bully import convergence_times
+import unittest
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+class TestSimulator(unittest.TestCase):
+    def test_virtual_loop_order(self):
+        loop = VirtualLoop()
+        calls = []
+        loop.call_later(2, calls.append, "b")
+        loop.call_later(1, calls.append, "a")
+        loop.call_later(2, calls.append, "c")
+        loop.call_later(1.5, calls.append, "never").cancel()
+        loop.run()
+
+        self.assertEqual(calls, ["a", "b", "c"])
+        self.assertEqual(loop.time(), 2)
+
+    def test_virtual_loop_until(self):
+        loop = VirtualLoop()
+        calls = []
+        loop.call_later(1, calls.append, "a")
+        loop.call_later(5, calls.append, "b")
+        loop.run(until=3)
+
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(loop.time(), 3)
+
+    def test_both_variants(self):
+        alive_nodes = [0, 2, 3, 5, 6, 9, 10, 12, 14, 15, 19, 21, 22, 23, 26, 33, 34, 35, 36, 38, 41, 42, 45, 46, 49]
+        for variant in ("standard", "improved"):
+            nodes = simulate(variant, 50, [22, 41], alive_nodes)
+            logger.debug(f"{variant}: {sum(n.message_count for n in nodes)} messages in {convergence_time(nodes)} s")
+
+            self.assertIsNotNone(convergence_time(nodes))
+            for node in nodes:
+                self.assertEqual(node.coordinator_id, max(alive_nodes))
+
+    def test_concurrent_starters(self):
+        # Starters of the same term end up in one election, so four cost about as much as one
+        alive_nodes = list(range(0, 100, 2))
+        counts = {}
+        for starters in ([22], [22, 48, 72, 86]):
+            nodes = simulate("standard", 100, starters, alive_nodes)
+            counts[len(starters)] = sum(n.message_count for n in nodes)
+            for node in nodes:
+                self.assertEqual(node.coordinator_id, max(alive_nodes))
+                self.assertEqual(node.term, 0)
+        logger.debug(f"messages by number of starters: {counts}")
+
+        self.assertLess(counts[4], 1.2*counts[1])
+
+    def test_fan_out_stops_at_ok(self):
+        # Every node hands the election to the next one up, instead of asking all the higher nodes
+        alive_nodes = list(range(100))
+        nodes = simulate("standard", 100, [0], alive_nodes)
+        for node in nodes:
+            self.assertEqual(node.coordinator_id, 99)
+        messages = sum(n.message_count for n in nodes)
+        coalesced = sum(n.coalesced_count for n in nodes)
+        logger.debug(f"{messages} messages, {coalesced} coalesced")
+
+        self.assertLess(messages, 5*len(alive_nodes))
+        self.assertGreater(coalesced, 4000)
+
+    def test_probe_window(self):
+        alive_nodes = [3, 40, 170]
+        rounds = {}
+        for window in (1, 16):
+            nodes = simulate("improved", 200, [3], alive_nodes, probe_window=window)
+            rounds[window] = convergence_time(nodes)
+            for node in nodes:
+                self.assertEqual(node.coordinator_id, max(alive_nodes))
+
+        self.assertLess(rounds[16], rounds[1])
+
+    def test_reproducible(self):
+        alive_nodes = list(range(0, 100, 3))
+        runs = []
+        for _ in range(2):
+            nodes = simulate("improved", 100, [3, 30, 60], alive_nodes, jitter=0.05, seed=7)
+            runs.append(([n.message_count for n in nodes], [n.finish_time for n in nodes]))
+
+        self.assertEqual(runs[0], runs[1])
+
+    def test_latency_shows_in_convergence(self):
+        fast = simulate("improved", 10, [2], [2, 7], latency=0.001)
+        slow = simulate("improved", 10, [2], [2, 7], latency=0.1)
+
+        self.assertLess(convergence_time(fast), convergence_time(slow))
+
+    def test_convergence_times(self):
+        for variant in ("standard", "improved"):
+            nodes = simulate(variant, 20, [2], [2, 7, 11, 15], latency=0.01)
+            first_announce, agreement, p50, p99 = convergence_times(nodes)
+            logger.debug(f"{variant}: first announce {first_announce}, agreement {agreement}, spread {p50} {p99}")
+
+            self.assertGreater(first_announce, 0)
+            self.assertGreater(agreement, first_announce)
+            self.assertLessEqual(p50, p99)
+            self.assertLessEqual(p99, agreement - first_announce)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
@@ -2,10 +2,12 @@ from ctypes import c_uint
 from multiprocessing import Value
 from queue import Queue
 from standard_bully import Node
+from pacing import FixedDelay
 from threading import Thread
 from time import sleep
 import socket
 import unittest
+import wire
 import argparse
 import logging
 
@@ -52,7 +54,7 @@ def listen(base_port, id, queue, count=1, timeout=1):
                 pass
 
 def base_unit_test_setup(num_nodes, test_node_id, msg_count=5, listener_timeout=1, port = 4000, silent=True):
-    n = Node(test_node_id, num_nodes, port, False, Value(c_uint), Value(c_uint), silent=silent)
+    n = Node(test_node_id, num_nodes, port, False, Value(c_uint), Value(c_uint), silent=silent, wire_format="text")
     
     q = Queue()
     listeners = []
@@ -311,6 +313,61 @@ class TestBully(unittest.TestCase):
         self.assertEqual(len(expected_msgs), 0)
         self.assertEqual(len(unexpected_msgs), 0)
     
+    def test_stale_election(self):
+        # An election of an older term gets an OK with the current term, but isn't joined
+        num_nodes = 5
+        node_id = 2
+        n, q, ls = base_unit_test_setup(num_nodes, node_id, msg_count=2)
+        n.term = 3
+        
+        self.assertFalse(n.check_term((wire.ELECTION, 1, 2, 0)))
+        self.assertTrue(n.check_term((wire.ELECTION, 0, 4, 0)))
+        self.assertEqual(n.term, 4)
+        
+        for l in ls:
+            l.join()
+        
+        self.assertEqual([q.get() for _ in range(q.qsize())], [(1, b"OK 2 3")])
+        self.assertFalse(n.running_election)
+    
+    def test_duplicate_elections(self):
+        # A lower node gets one OK per term, however many of its elections come in
+        num_nodes = 5
+        node_id = 2
+        n, q, ls = base_unit_test_setup(num_nodes, node_id, msg_count=2, port=4300)
+        n.term = 3
+        
+        n.answer_election(1)
+        n.answer_election(1)
+        self.assertFalse(n.check_term((wire.ELECTION, 1, 2, 0)))
+        n.answer_election(0)
+        n.set_term(4)
+        n.answer_election(1)
+        
+        for l in ls:
+            l.join()
+        
+        self.assertEqual(sorted(q.get() for _ in range(q.qsize())), [(0, b"OK 2 3"), (1, b"OK 2 3"), (1, b"OK 2 4")])
+    
+    def test_fan_out_stops_at_ok(self):
+        # Once a higher node answered, the rest of the election messages are not sent
+        num_nodes = 6
+        node_id = 1
+        n, q, ls = base_unit_test_setup(num_nodes, node_id, msg_count=1, port=4100)
+        n.pacer = FixedDelay(.1)
+        
+        election = Thread(target=n.run_election)
+        election.start()
+        sleep(.15)
+        n.msg_received_ok(2)
+        election.join()
+        
+        for l in ls:
+            l.join()
+        
+        self.assertEqual([q.get() for _ in range(q.qsize())], [(2, b"election 1")])
+        self.assertIsNone(n.timer)
+    
     def test_coordinator_received(self):
         # If coordinator message is received, set coordinator id and stop the node
         num_nodes = 5
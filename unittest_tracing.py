@@ -0,0 +1,79 @@
+import tracing
+from tracing import Trace
+import standard_bully
+import improved_bully
+import numpy as np
+import unittest
+import tempfile
+import os
+import logging
+import argparse
+import wire
+
+logger = logging.getLogger(__name__)
+
+
+class TestTracing(unittest.TestCase):
+    def test_wraparound(self):
+        trace = Trace(8)
+        for i in range(11):
+            trace.record(tracing.SEND, wire.ELECTION, i)
+
+        records = trace.ordered()
+        self.assertEqual([value for _, _, _, value in records], list(range(3, 11)))
+        self.assertEqual(sorted(records), records)
+
+    def test_dump(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for num_records in (0, 1, 5, 20):
+                trace = Trace(16)
+                for i in range(num_records):
+                    trace.record(tracing.RECEIVE, wire.OK, i)
+                path = os.path.join(tmp, f"{num_records}.npy")
+                trace.dump(path)
+
+                records = np.load(path)
+                self.assertEqual(records.dtype.names, tracing.FIELDS)
+                self.assertEqual(len(records), min(num_records, 16))
+                self.assertEqual(records["value"].tolist(), list(range(max(num_records - 16, 0), num_records)))
+                self.assertTrue((np.diff(records["time"]) >= 0).all())
+
+    def test_nodes(self):
+        alive_nodes = [1, 3, 6]
+        for module, variant, port in ((standard_bully, "standard", 5700), (improved_bully, "improved", 5800)):
+            with tempfile.TemporaryDirectory() as tmp:
+                processes = [module.Node(node_id, 8, port, node_id == 1, silent=True, trace_dir=tmp) for node_id in alive_nodes]
+                for p in processes:
+                    p.start()
+                for p in processes:
+                    p.join()
+
+                traces = {node_id: tracing.load(os.path.join(tmp, f"{variant}-{node_id}.npy")) for node_id in alive_nodes}
+            logger.debug(f"{variant}: {[len(records) for records in traces.values()]} events")
+
+            for node_id, records in traces.items():
+                coordinators = records[(records["event"] == tracing.STATE) & (records["kind"] == tracing.COORDINATOR)]
+                self.assertEqual(coordinators["value"].tolist()[-1], 6)
+                done = records[(records["event"] == tracing.STATE) & (records["kind"] == tracing.DONE)]
+                self.assertEqual(len(done), 1)
+                self.assertGreaterEqual(done["time"][0], coordinators["time"][0])
+
+            starter = traces[1]
+            self.assertEqual((starter[0]["event"], starter[0]["kind"]), (tracing.STATE, tracing.ELECTION_STARTED))
+            # Every coordinator message node 6 sent to an alive node shows up as received there, after it was sent
+            sent = traces[6][(traces[6]["event"] == tracing.SEND) & (traces[6]["kind"] == wire.COORDINATOR)]
+            for node_id in (1, 3):
+                received = traces[node_id][(traces[node_id]["event"] == tracing.RECEIVE) & (traces[node_id]["kind"] == wire.COORDINATOR)]
+                self.assertEqual(received["value"].tolist(), [6])
+                self.assertLess(sent[sent["value"] == node_id]["time"][0], received["time"][0])
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
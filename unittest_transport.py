@@ -0,0 +1,185 @@
+from metrics import MetricsBlock
+from multiprocessing import Barrier, Process
+from transport import TRANSPORTS, SHM_SLOTS, make_transport, drain, kernel_drops
+from bench_transport import throughput, latency
+import standard_bully
+import improved_bully
+import unittest
+import selectors
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+def send_exits(port: int, sender: int, count: int) -> None:
+    transport = make_transport("shm", port, 2)
+    for i in range(count):
+        transport.send_to(1, b"exit %d %d" % (sender, i))
+
+
+class TestTransport(unittest.TestCase):
+    def test_endpoints(self):
+        for name in TRANSPORTS:
+            transport = make_transport(name, 6700, 4)
+            with transport.bind(1) as endpoint, transport.socket() as sender, selectors.DefaultSelector() as selector:
+                selector.register(endpoint, selectors.EVENT_READ)
+                with self.assertRaises(BlockingIOError):
+                    endpoint.recvfrom(1024)
+
+                transport.send(sender, b"election 0", 1)
+                transport.send(sender, b"election 2", 1)
+                transport.send(sender, b"election 0", 3) # Nobody there, dropped
+                self.assertTrue(selector.select(1))
+                self.assertEqual(endpoint.recvfrom(1024)[0], b"election 0")
+                self.assertTrue(selector.select(1))
+                self.assertEqual(endpoint.recvfrom(1024)[0], b"election 2")
+                with self.assertRaises(BlockingIOError):
+                    endpoint.recvfrom(1024)
+            # The node id can be bound again once the endpoint is closed
+            transport.bind(1).close()
+
+    def test_queue_needs_threads(self):
+        with self.assertRaises(ValueError):
+            standard_bully.Node(1, 4, 6800, True, transport="queue")
+        with self.assertRaises(ValueError):
+            improved_bully.Node(1, 4, 6800, True, transport="unix", execution_mode="thread", multicast_group="239.255.42.1")
+        with self.assertRaises(ValueError):
+            standard_bully.Node(1, 4, 6800, True, transport="shm", rcvbuf=4096)
+
+    def test_drain(self):
+        transport = make_transport("udp", 7400, 2)
+        with transport.bind(1, rcvbuf=1024) as endpoint, transport.socket() as sender:
+            for i in range(100):
+                transport.send(sender, b"election %d" % i, 1)
+            datagrams, drops = drain(endpoint)
+            self.assertLess(len(datagrams), 100)
+            self.assertIsNone(drops) # All of them came before the first drop
+            overflow = kernel_drops(endpoint)
+            self.assertEqual(len(datagrams) + overflow, 100)
+
+            # The next datagram brings the count along
+            transport.send(sender, b"election 1", 1)
+            self.assertEqual(drain(endpoint), ([b"election 1"], overflow))
+            self.assertEqual(drain(endpoint), ([], None))
+
+        for name in ("unix", "queue"):
+            transport = make_transport(name, 7400, 2)
+            with transport.bind(1) as endpoint, transport.socket() as sender:
+                for i in range(5):
+                    transport.send(sender, b"election %d" % i, 1)
+                self.assertEqual(drain(endpoint, 3), ([b"election 0", b"election 1", b"election 2"], None))
+                self.assertEqual(drain(endpoint), ([b"election 3", b"election 4"], None))
+                self.assertIsNone(kernel_drops(endpoint))
+
+    def test_kernel_drops_reported(self):
+        # A receive buffer this small can't take an unpaced election, and the run says so
+        alive_nodes = list(range(30))
+        with MetricsBlock(len(alive_nodes)) as block:
+            ready = Barrier(len(alive_nodes))
+            nodes = [standard_bully.Node(node_id, 30, 7500, node_id < 10, silent=True, metrics=block.slot(slot), execution_mode="thread",
+                                         ready_barrier=ready, pacing="none", rcvbuf=1024, election_timeout=.5)
+                     for slot, node_id in enumerate(alive_nodes)]
+            for node in nodes:
+                node.start()
+            for node in nodes:
+                node.join()
+            dropped = block.kernel_drops()
+        logger.debug(f"kernel drops {dropped}")
+
+        self.assertGreater(sum(dropped), 0)
+
+    def test_elections(self):
+        alive_nodes = [1, 4, 6, 9]
+        for name in TRANSPORTS:
+            for module, port in ((standard_bully, 6800), (improved_bully, 6900)):
+                with MetricsBlock(len(alive_nodes)) as block:
+                    ready = Barrier(len(alive_nodes))
+                    nodes = [module.Node(node_id, 12, port, node_id == 1, silent=True, metrics=block.slot(slot), execution_mode="thread",
+                                         ready_barrier=ready, transport=name)
+                             for slot, node_id in enumerate(alive_nodes)]
+                    for node in nodes:
+                        node.start()
+                    for node in nodes:
+                        node.join()
+                    coordinators = block.coordinators()
+
+                self.assertEqual(coordinators, [9, 9, 9, 9], f"{module.__name__} over {name}")
+
+    def test_shm_rings(self):
+        transport = make_transport("shm", 7100, 4)
+        with transport.bind(1) as endpoint, transport.socket(2) as sender:
+            for i in range(SHM_SLOTS + 2):
+                transport.send(sender, b"election %d" % i, 1)
+            transport.send(sender, b"election 2", 3) # Nobody there, dropped
+            with self.assertRaises(ValueError):
+                transport.send(sender, b"x"*100, 1)
+            with transport.socket(4) as outsider, self.assertRaises(ValueError):
+                transport.send(outsider, b"election 4", 1) # No ring for ids past num_nodes
+
+            # Only what fit the ring of node 2 arrived, and the outside ring is separate
+            transport.send_to(1, b"exit")
+            received = []
+            with selectors.DefaultSelector() as selector:
+                selector.register(endpoint, selectors.EVENT_READ)
+                while selector.select(.2):
+                    try:
+                        received.append(endpoint.recvfrom(1024)[0])
+                    except BlockingIOError:
+                        pass
+        self.assertEqual(received, [b"election %d" % i for i in range(SHM_SLOTS)] + [b"exit"])
+
+    def test_shm_outside_senders(self):
+        # Senders without a node id share the last ring, from processes of their own they take turns on the file lock
+        transport = make_transport("shm", 7700, 2)
+        with transport.bind(1) as endpoint:
+            senders = [Process(target=send_exits, args=(7700, sender, SHM_SLOTS//4)) for sender in range(4)]
+            for sender in senders:
+                sender.start()
+            for sender in senders:
+                sender.join()
+            received = []
+            while True:
+                try:
+                    received.append(endpoint.recvfrom(1024)[0])
+                except BlockingIOError:
+                    break
+        self.assertEqual(sorted(received), sorted(b"exit %d %d" % (sender, i) for sender in range(4) for i in range(SHM_SLOTS//4)))
+
+    def test_shm_processes(self):
+        alive_nodes = [1, 4, 6, 9]
+        for module, port in ((standard_bully, 7200), (improved_bully, 7300)):
+            with MetricsBlock(len(alive_nodes)) as block:
+                ready = Barrier(len(alive_nodes))
+                nodes = [module.Node(node_id, 12, port, node_id in (1, 4), silent=True, metrics=block.slot(slot), execution_mode="process",
+                                     ready_barrier=ready, transport="shm")
+                         for slot, node_id in enumerate(alive_nodes)]
+                for node in nodes:
+                    node.start()
+                for node in nodes:
+                    node.join()
+                coordinators = block.coordinators()
+
+            self.assertEqual(coordinators, [9, 9, 9, 9], module.__name__)
+
+    def test_bench(self):
+        for name in TRANSPORTS:
+            transport = make_transport(name, 7000, 2)
+            for processes in ((False,) if name == "queue" else (False, True)):
+                rate, lost = throughput(transport, 1000, 8, processes)
+                times = latency(transport, 100, processes)
+                logger.debug(f"{name}: {rate:.0f} messages/s, {lost} lost, {len(times)} round trips")
+
+                self.assertEqual(lost, 0)
+                self.assertEqual(len(times), 100)
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
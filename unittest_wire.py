@@ -0,0 +1,47 @@
+import wire
+import unittest
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+
+class TestWire(unittest.TestCase):
+    def test_binary_roundtrip(self):
+        msg = wire.encode(wire.COORDINATOR, 42, term=7, seq=123456)
+        self.assertEqual(len(msg), wire.SIZE)
+        self.assertEqual(msg[0], wire.VERSION)
+        self.assertEqual(wire.decode(msg), (wire.COORDINATOR, 42, 7, 123456))
+        self.assertEqual(wire.peek_seq(msg), 123456)
+        self.assertEqual(wire.peek_seq(wire.encode(wire.ACK, 1, seq=2**32 - 1)), 2**32 - 1)
+
+    def test_text_roundtrip(self):
+        self.assertEqual(wire.encode(wire.ELECTION, 2, fmt="text"), b"election 2")
+        self.assertEqual(wire.encode(wire.OK, 3, term=4, fmt="text"), b"OK 3 4")
+        self.assertEqual(wire.decode(b"are_you_alive 1"), (wire.ARE_YOU_ALIVE, 1, 0, 0))
+        self.assertEqual(wire.decode(b"OK 3 4 5"), (wire.OK, 3, 4, 5))
+        self.assertEqual(wire.decode(b"exit"), (wire.EXIT, 0, 0, 0))
+        self.assertEqual(wire.encode(wire.ACK, 3, term=1, seq=17, fmt="text"), b"ack 3 1 17")
+        self.assertEqual(wire.peek_seq(b"ack 3 1 17"), 17)
+        self.assertEqual(wire.peek_seq(b"election 2"), 0)
+
+    def test_invalid(self):
+        self.assertIsNone(wire.decode(b"hello"))
+        self.assertIsNone(wire.decode(b"election two"))
+        self.assertIsNone(wire.decode(bytes([wire.VERSION, 1, 2])))
+        for kind in (0, 20, 200):
+            self.assertIsNone(wire.decode(wire.HEADER.pack(wire.VERSION, kind, 3, 0, 0)))
+            self.assertEqual(wire.peek_kind(wire.HEADER.pack(wire.VERSION, kind, 3, 0, 0)), 0)
+        with self.assertRaises(ValueError):
+            wire.encode(wire.OK, 1, fmt="json")
+
+
+# run the test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    unittest.main(verbosity=2)
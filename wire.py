@@ -0,0 +1,105 @@
+"""
+Wire format of the election messages.
+
+Binary messages are a fixed 14 byte struct: version, message type, sender id, term and sequence number,
+all in network byte order. The sequence number is 0 unless the message is sent reliably, see
+reliable.py, and an ack carries the number of the message it acknowledges. The text format
+("election 42") is kept for debugging and for sending messages by hand, `decode` accepts both: text
+messages always start with a letter, and the first byte of a binary message is the version, which
+never is one.
+"""
+import struct
+
+VERSION = 1
+HEADER = struct.Struct("!BBIII")
+SIZE = HEADER.size
+
+ELECTION = 1
+OK = 2
+COORDINATOR = 3
+ARE_YOU_ALIVE = 4
+EXIT = 5
+PROBE = 6
+ALIVE = 7
+HEARTBEAT = 8
+ACK = 9
+
+NAMES = {
+    ELECTION: "election",
+    OK: "OK",
+    COORDINATOR: "coordinator",
+    ARE_YOU_ALIVE: "are_you_alive",
+    EXIT: "exit",
+    PROBE: "probe",
+    ALIVE: "alive",
+    HEARTBEAT: "heartbeat",
+    ACK: "ack",
+}
+TYPES = {name.encode("UTF8"): kind for kind, name in NAMES.items()}
+
+FORMATS = ("binary", "text")
+
+
+def encode_text(kind: int, sender: int, term: int = 0, seq: int = 0) -> bytes:
+    """`kind sender [term [seq]]`, trailing zero fields are left out so plain messages look like they always did."""
+    if kind == EXIT:
+        return b"exit"
+    fields = [NAMES[kind], str(sender)]
+    if term or seq:
+        fields.append(str(term))
+    if seq:
+        fields.append(str(seq))
+    return bytes(' '.join(fields), encoding="UTF8")
+
+
+def encode(kind: int, sender: int, term: int = 0, seq: int = 0, fmt: str = "binary") -> bytes:
+    if fmt == "binary":
+        return HEADER.pack(VERSION, kind, sender, term, seq)
+    if fmt == "text":
+        return encode_text(kind, sender, term, seq)
+    raise ValueError(f"Unknown wire format {fmt}")
+
+
+def decode(data: bytes) -> tuple[int, int, int, int] | None:
+    """
+    Parse a message into `(type, sender, term, seq)`.
+    Returns None for anything that is not a valid message in either format.
+    """
+    if len(data) == SIZE and data[0] == VERSION:
+        _, kind, sender, term, seq = HEADER.unpack(data)
+        if kind not in NAMES:
+            return None
+        return kind, sender, term, seq
+    return decode_text(data)
+
+
+def peek_kind(data: bytes) -> int:
+    """Only the message type, without unpacking the rest of a binary message. 0 if it isn't a message."""
+    if len(data) == SIZE and data[0] == VERSION:
+        return data[1] if data[1] in NAMES else 0
+    decoded = decode_text(data)
+    return decoded[0] if decoded is not None else 0
+
+
+def peek_seq(data: bytes) -> int:
+    """Only the sequence number, 0 for a message that wasn't sent reliably or isn't a message."""
+    if len(data) == SIZE and data[0] == VERSION:
+        return int.from_bytes(data[10:], "big")
+    decoded = decode_text(data)
+    return decoded[3] if decoded is not None else 0
+
+
+def decode_text(data: bytes) -> tuple[int, int, int, int] | None:
+    try:
+        match data.split(b' '):
+            case [b"exit"]:
+                return EXIT, 0, 0, 0
+            case [name, sender]:
+                return TYPES[name], int(sender), 0, 0
+            case [name, sender, term]:
+                return TYPES[name], int(sender), int(term), 0
+            case [name, sender, term, seq]:
+                return TYPES[name], int(sender), int(term), int(seq)
+    except (KeyError, ValueError):
+        pass
+    return None